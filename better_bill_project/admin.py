@@ -1,4 +1,6 @@
 from django.contrib import admin
+from django.db import transaction
+from django.db.models import Q
 from import_export import resources, fields
 from import_export.widgets import ForeignKeyWidget, DateTimeWidget
 from import_export.admin import ImportExportModelAdmin
@@ -6,6 +8,8 @@ from import_export.admin import ImportExportModelAdmin
 # IMPORTANT: include Role here
 from .models import Client, Personnel, Role, Matter
 from .models import TimeEntry, ActivityCode, WIP, Invoice, InvoiceLine, Ledger
+from . import fulltext
+from . import summaries
 
 # --- Resources ---
 
@@ -145,20 +149,49 @@ class ActivityCodeAdmin(ImportExportModelAdmin):
     list_display = ("activity_code", "activity_description")
     search_fields = ("activity_code", "activity_description")
 
+class NarrativeSearchMixin:
+    """Admin search: search_fields (icontains) OR full-text on narrative."""
+    def get_search_results(self, request, queryset, search_term):
+        """Add narrative full-text matches to the search_fields matches."""
+        qs, may_have_duplicates = super().get_search_results(
+            request, queryset, search_term)
+        if search_term.strip():
+            qs = queryset.filter(
+                fulltext.match_q(queryset.model, search_term)
+                | Q(pk__in=qs.values("pk")))
+        return qs, may_have_duplicates
+
 @admin.register(TimeEntry)
-class TimeEntryAdmin(ImportExportModelAdmin):
+class TimeEntryAdmin(NarrativeSearchMixin, ImportExportModelAdmin):
     resource_class = TimeEntryResource
     list_display = ("matter", "fee_earner", "hours_worked", "created_at")
     list_select_related = ("matter", "fee_earner")
     search_fields = ("matter__matter_number",
-                     "fee_earner__initials", "activity_code", "narrative")
+                     "fee_earner__initials", "activity_code__activity_code")
 
 @admin.register(WIP)
-class WIPAdmin(admin.ModelAdmin):
+class WIPAdmin(NarrativeSearchMixin, admin.ModelAdmin):
     list_display = ("created_at", 'client', "matter",
                     "fee_earner", "hours_worked", "status")
     list_filter  = ("status", "fee_earner", "matter", "created_at")
-    search_fields = ("matter__matter_number", "fee_earner__initials", "narrative")
+    search_fields = ("matter__matter_number", "fee_earner__initials")
+
+    def get_readonly_fields(self, request, obj=None):
+        """ Fee earner and hours follow the time entry once WIP exists
+        (and attribute any invoice lines), so only status is editable. """
+        readonly = super().get_readonly_fields(request, obj)
+        return (*readonly, "fee_earner", "hours_worked") if obj else readonly
+
+    def save_model(self, request, obj, form, change):
+        """ Mirror the save in the dashboard totals (deletes are handled
+        by the WIP post_delete signal). """
+        old_status = (WIP.objects.values_list("status", flat=True).get(pk=obj.pk)
+                      if change else None)
+        super().save_model(request, obj, form, change)
+        if not change:
+            summaries.add_wip(obj.fee_earner_id, obj.hours_worked, obj.status)
+        elif old_status != obj.status:
+            summaries.move_wip([obj], old_status, obj.status)
 
 # ------ Invoicing ------
 
@@ -170,11 +203,38 @@ class InvoiceLineInline(admin.TabularInline):
 @admin.register(Invoice)
 class InvoiceAdmin(admin.ModelAdmin):
     list_display = ("number", "invoice_date", "client",
-                    "matter", "tax_rate", "created_at")
+                    "matter", "tax_rate", "total", "created_at")
     list_filter  = ("client", "matter", "invoice_date")
     search_fields = ("number", "client__name", "matter__matter_number")
+    readonly_fields = ("subtotal", "tax_amount", "total")
     inlines = [InvoiceLineInline]
 
+    def save_model(self, request, obj, form, change):
+        """ Take the ledger's shares out of the dashboard totals before its
+        lines change; save_related() puts them back. """
+        if change:
+            summaries.remove_ledgers(Ledger.objects.filter(invoice=obj))
+        super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        """ Refresh stored totals after inline lines are saved. """
+        super().save_related(request, form, formsets, change)
+        form.instance.recalculate_totals()
+        if change:
+            summaries.add_ledgers(Ledger.objects.filter(invoice=form.instance))
+
+    def delete_model(self, request, obj):
+        """ Drop the invoice's ledger from the dashboard totals. """
+        with transaction.atomic():
+            summaries.remove_ledgers(Ledger.objects.filter(invoice=obj))
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        """ Bulk delete action: as delete_model(), for every invoice. """
+        with transaction.atomic():
+            summaries.remove_ledgers(Ledger.objects.filter(invoice__in=queryset))
+            super().delete_queryset(request, queryset)
+
 @admin.register(Ledger)
 class LedgerAdmin(admin.ModelAdmin):
     list_display = ("invoice", "client", "matter", "subtotal",
@@ -182,3 +242,24 @@ class LedgerAdmin(admin.ModelAdmin):
     list_filter  = ("status", "client", "matter", "created_at")
     search_fields = ("invoice__number", "client__name", "matter__matter_number")
 
+    def save_model(self, request, obj, form, change):
+        """ Move the ledger's amounts to their new status/values in the
+        dashboard totals. """
+        with transaction.atomic(), summaries.deferred():
+            if change:
+                summaries.remove_ledgers([Ledger.objects.get(pk=obj.pk)])
+            super().save_model(request, obj, form, change)
+            summaries.add_ledgers([obj])
+
+    def delete_model(self, request, obj):
+        """ Drop the ledger from the dashboard totals. """
+        with transaction.atomic():
+            summaries.remove_ledgers([Ledger.objects.get(pk=obj.pk)])
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        """ Bulk delete action: as delete_model(), for every ledger. """
+        with transaction.atomic():
+            summaries.remove_ledgers(list(queryset))
+            super().delete_queryset(request, queryset)
+
@@ -0,0 +1,311 @@
+"""
+Invoice drafting rules and the bulk billing run.
+
+invoice_line() holds the rate/amount/description rules for one WIP item
+and is shared by create_invoice (one hand-picked invoice) and run() (month
+end: every matter with unbilled WIP at once), so both bill identically.
+
+Both take WIP with claim_wip(), which marks it billed inside the caller's
+transaction and reports what was lost to another biller. On Postgres the
+rows are locked with SELECT ... FOR UPDATE SKIP LOCKED, so concurrent
+billers never wait on each other: each takes what nobody else holds. Other
+databases use a conditional UPDATE ... WHERE status='unbilled' RETURNING,
+which only the first biller to commit can win. Either way a WIP item can
+never land on two invoices. Time entry edits still queued in the WIP
+outbox are applied first, and WIP whose sync is still pending (failing,
+or in a worker's hands) is left out rather than billed at stale hours.
+
+A run splits the matters with unbilled WIP into batches. Each batch is one
+transaction: its WIP is claimed, grouped into invoices (per matter, or per
+matter and fee earner / month, see GROUPINGS), and the Invoice,
+InvoiceLine and draft Ledger rows are written with bulk inserts. Batches
+cover disjoint matters and run in a thread pool when the database
+supports SKIP LOCKED. Their dashboard deltas are collected and written
+as the batch ends (summaries.deferred), so parallel batches sharing fee
+earners hold the summary rows only briefly.
+"""
+from __future__ import annotations
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+import logging
+from django.db import connection, transaction
+from django.utils import timezone
+from . import outbox
+from . import summaries
+from .models import Invoice, InvoiceLine, Ledger, WIP
+from .numbering import format_invoice_number, reserve_numbers
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TAX_RATE = Decimal("20.00")  # percent
+DEFAULT_BATCH_SIZE = 50              # matters per transaction
+CLAIM_CHUNK_SIZE = 1000              # ids per claiming statement
+CENT = Decimal("0.01")
+
+# Everything invoice_line() and the run report read from a WIP row
+BILLING_RELATED = ("fee_earner__role", "matter", "matter__client", "activity_code")
+
+DESC_MAX_LENGTH = InvoiceLine._meta.get_field("desc").max_length
+
+# Invoice grouping: one invoice per distinct key of a matter's WIP
+GROUPINGS = {
+    "matter": lambda w: (),
+    "matter-fee-earner": lambda w: (w.fee_earner_id,),
+    "matter-month": lambda w: (timezone.localtime(w.created_at).strftime("%Y-%m"),),
+}
+
+
+# --- Rules shared with create_invoice ---
+
+def billable_wip():
+    """Unbilled WIP with everything invoice_line() reads."""
+    return (WIP.objects
+            .select_related(*BILLING_RELATED)
+            .filter(status="unbilled"))
+
+
+def invoice_line(w, invoice=None):
+    """The (unsaved) invoice line billing WIP item w at its fee earner's rate."""
+    rate = getattr(getattr(w.fee_earner, "role", None), "rate", Decimal("0.00"))
+    amount = (Decimal(w.hours_worked) * rate).quantize(CENT)
+    desc = w.narrative or f"{w.matter.matter_number} — {w.activity_code or 'Work'}"
+    return InvoiceLine(invoice=invoice, wip=w, desc=desc[:DESC_MAX_LENGTH],
+                       hours=w.hours_worked, rate=rate, amount=amount)
+
+
+# --- Claiming ---
+
+def _chunks(ids):
+    """Split ids into lists of at most CLAIM_CHUNK_SIZE."""
+    for i in range(0, len(ids), CLAIM_CHUNK_SIZE):
+        yield ids[i:i + CLAIM_CHUNK_SIZE]
+
+
+def _claim_locked(qs, wanted):
+    """Lock the unbilled rows of qs nobody else holds and mark them billed."""
+    locked = (qs.filter(status="unbilled")
+              .select_related(*BILLING_RELATED)
+              .select_for_update(skip_locked=True, of=("self",)))
+    items = [w for w in locked if w.id in wanted]
+    now = timezone.now()
+    for chunk in _chunks([w.id for w in items]):
+        WIP.objects.filter(id__in=chunk).update(status="billed", updated_at=now)
+    return items
+
+
+def _claim_returning(wanted):
+    """Mark the still-unbilled wanted rows billed; load the ones this call won."""
+    qn = connection.ops.quote_name
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    won = []
+    with connection.cursor() as cur:
+        for chunk in _chunks(sorted(wanted)):
+            cur.execute(
+                "UPDATE {} SET {} = %s, {} = %s WHERE {} = %s AND {} IN ({}) "
+                "RETURNING {}".format(
+                    qn(WIP._meta.db_table), qn("status"), qn("updated_at"),
+                    qn("status"), qn("id"), ", ".join(["%s"] * len(chunk)), qn("id")),
+                ["billed", now, "unbilled", *chunk])
+            won.extend(row[0] for row in cur.fetchall())
+    items = []
+    for chunk in _chunks(won):
+        items.extend(WIP.objects
+                     .select_related(*BILLING_RELATED)
+                     .filter(id__in=chunk))
+    return items
+
+
+def claim_wip(qs):
+    """
+    Take the WIP in qs for an invoice: mark its unbilled rows billed and
+    move them in the dashboard totals. Call inside the transaction that
+    writes the invoice, so a rollback releases the claim.
+
+    Returns (items, lost_ids): the claimed WIP (with everything
+    invoice_line() reads) and the ids in qs that were not claimed because
+    another biller holds or already billed them, or their time entry's
+    WIP sync is still pending.
+    """
+    wanted = set(qs.values_list("id", flat=True))
+    if not wanted:
+        return [], []
+    outbox.apply_pending(qs.values("time_entry_id"))
+    qs = qs.exclude(time_entry__wip_outbox__isnull=False)
+    claimable = set(qs.values_list("id", flat=True))
+    if not claimable:
+        items = []
+    elif connection.features.has_select_for_update_skip_locked:
+        items = _claim_locked(qs, claimable)
+    else:
+        items = _claim_returning(claimable)
+    lost = sorted(wanted - {w.id for w in items})
+    if lost:
+        log.info("WIP claim: %s of %s items lost to another biller "
+                 "(%s awaiting a WIP sync)",
+                 len(lost), len(wanted), len(wanted - claimable))
+    summaries.move_wip(items, "unbilled", "billed")
+    return items, lost
+
+
+# --- Planning ---
+
+def _drafts(items, group_by, tax_rate):
+    """Group WIP items into (unsaved Invoice, [InvoiceLine]) drafts."""
+    key_of = GROUPINGS[group_by]
+    groups = defaultdict(list)
+    for w in sorted(items, key=lambda w: (w.matter_id, w.created_at, w.id)):
+        groups[(w.matter_id, *key_of(w))].append(w)
+
+    drafts = []
+    for ws in groups.values():
+        matter = ws[0].matter
+        inv = Invoice(client_id=matter.client_id, matter_id=matter.pk,
+                      tax_rate=tax_rate)
+        lines = [invoice_line(w, inv) for w in ws]
+        inv.set_totals(sum((li.amount for li in lines), Decimal("0.00")))
+        drafts.append((inv, lines))
+    return drafts
+
+
+def _report_row(inv, lines):
+    """One invoice of the run report."""
+    matter = lines[0].wip.matter
+    return {
+        "number": inv.number or "",
+        "client": matter.client.client_number,
+        "matter": matter.matter_number,
+        "lines": len(lines),
+        "hours": sum((li.hours for li in lines), Decimal("0.0")),
+        "subtotal": inv.subtotal,
+        "tax": inv.tax_amount,
+        "total": inv.total,
+    }
+
+
+def matters_to_bill(client_ids=None, matter_ids=None, until=None):
+    """Ids of matters with unbilled WIP in scope, ascending."""
+    qs = WIP.objects.filter(status="unbilled")
+    if client_ids is not None:
+        qs = qs.filter(matter__client_id__in=client_ids)
+    if matter_ids is not None:
+        qs = qs.filter(matter_id__in=matter_ids)
+    if until is not None:
+        qs = qs.filter(created_at__date__lte=until)
+    return list(qs.order_by("matter_id").values_list("matter_id", flat=True).distinct())
+
+
+# --- Writing ---
+
+def _batch_wip(matter_ids, until):
+    """The batch's unbilled WIP."""
+    qs = billable_wip().filter(matter_id__in=matter_ids)
+    if until is not None:
+        qs = qs.filter(created_at__date__lte=until)
+    return qs
+
+
+def _write(drafts, invoice_date, notes):
+    """Insert the (already claimed) drafts' invoices, lines and ledgers."""
+    numbers = reserve_numbers(len(drafts))
+    invoices = []
+    for (inv, _lines), n in zip(drafts, numbers):
+        inv.number = format_invoice_number(n)
+        inv.invoice_date = invoice_date
+        inv.notes = notes
+        invoices.append(inv)
+    Invoice.objects.bulk_create(invoices)
+
+    lines = []
+    for inv, inv_lines in drafts:
+        for li in inv_lines:
+            li.invoice = inv  # picks up the new pk
+            lines.append(li)
+    InvoiceLine.objects.bulk_create(lines, batch_size=1000)
+
+    ledgers = Ledger.objects.bulk_create([
+        Ledger(invoice=inv, client_id=inv.client_id, matter_id=inv.matter_id,
+               subtotal=inv.subtotal, tax=inv.tax_amount, total=inv.total,
+               status="draft")
+        for inv in invoices
+    ])
+    summaries.add_ledgers(ledgers)
+
+
+def _bill_batch(matter_ids, opts):
+    """Bill one batch of matters in one transaction. Returns (report rows, lost ids)."""
+    try:
+        # Summary deltas are written once, at the end of the batch
+        with transaction.atomic(), summaries.deferred():
+            qs = _batch_wip(matter_ids, opts["until"])
+            if opts["dry_run"]:
+                items, lost = list(qs), []
+            else:
+                items, lost = claim_wip(qs)
+            drafts = _drafts(items, opts["group_by"], opts["tax_rate"])
+            if drafts and not opts["dry_run"]:
+                _write(drafts, opts["invoice_date"], opts["notes"])
+        return [_report_row(inv, lines) for inv, lines in drafts], lost
+    finally:
+        # Worker threads each opened their own connection
+        if opts["threaded"]:
+            connection.close()
+
+
+def run(client_ids=None, matter_ids=None, until=None, group_by="matter",
+        invoice_date=None, tax_rate=DEFAULT_TAX_RATE, notes="",
+        batch_size=DEFAULT_BATCH_SIZE, workers=1, dry_run=False, progress=None):
+    """
+    Draft invoices for all unbilled WIP in scope.
+
+    client_ids/matter_ids limit the matters, until (a date) the WIP by
+    creation date. dry_run plans the invoices without locking or writing
+    anything. progress, if given, is called with (matters_done, matters).
+    Returns {"invoices": [report row, ...], "failed": [(matter_ids, error)],
+    "lost": [WIP ids another biller took or awaiting a WIP sync],
+    "matters": int}; a failed batch is rolled back and left for a re-run.
+    """
+    if group_by not in GROUPINGS:
+        raise ValueError(f"group_by must be one of {', '.join(GROUPINGS)}")
+    matters = matters_to_bill(client_ids, matter_ids, until)
+    batches = [matters[i:i + batch_size] for i in range(0, len(matters), batch_size)]
+
+    # Parallel writers are only safe (and only useful) with row locks
+    if not connection.features.has_select_for_update_skip_locked:
+        workers = 1
+    workers = max(1, min(workers, len(batches)))
+    opts = {"until": until, "group_by": group_by, "tax_rate": tax_rate,
+            "invoice_date": invoice_date or timezone.localdate(), "notes": notes,
+            "dry_run": dry_run, "threaded": workers > 1}
+
+    report = {"invoices": [], "failed": [], "lost": [], "matters": len(matters)}
+    done = 0
+
+    def _collect(batch, future_result):
+        """Fold one batch's outcome into the report."""
+        nonlocal done
+        try:
+            rows, lost = future_result()
+            report["invoices"].extend(rows)
+            report["lost"].extend(lost)
+        except Exception as exc:
+            log.exception("Billing run batch of %s matters failed", len(batch))
+            report["failed"].append((batch, f"{type(exc).__name__}: {exc}"))
+        done += len(batch)
+        if progress:
+            progress(done, len(matters))
+
+    if workers == 1:
+        for batch in batches:
+            _collect(batch, lambda: _bill_batch(batch, opts))
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [(batch, pool.submit(_bill_batch, batch, opts)) for batch in batches]
+            for batch, future in futures:
+                _collect(batch, future.result)
+
+    report["invoices"].sort(key=lambda r: (r["number"], r["matter"]))
+    log.info("Billing run: %s invoices for %s matters, %s batches failed%s",
+             len(report["invoices"]), len(matters), len(report["failed"]),
+             " (dry run)" if dry_run else "")
+    return report
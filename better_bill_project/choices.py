@@ -0,0 +1,69 @@
+"""
+Cached "eligible choices" for TimeEntryForm and InvoiceForm.
+
+The forms need to know which clients have open matters (and, for the
+invoice form, which open matters a fee earner leads) every time one is
+built. Those sets are read once, kept in the cache under a version that
+any Matter save or delete bumps, and memoized in-process per version, so
+building a form normally runs no query at all.
+"""
+from __future__ import annotations
+from collections import defaultdict
+import time
+from django.conf import settings
+from django.core.cache import cache
+from .models import Matter
+
+CHOICES_VERSION_KEY = "better_bill:choices:version"
+
+# (version, {name: value}); replaced whenever the version moves on
+_memo = (None, {})
+
+
+def _timeout():
+    """Seconds a computed set stays in the shared cache."""
+    return getattr(settings, "ELIGIBLE_CHOICES_CACHE_TIMEOUT", 3600)
+
+
+def invalidate():
+    """Bump the version so every process re-reads the sets."""
+    cache.set(CHOICES_VERSION_KEY, time.time_ns(), None)
+
+
+def _cached(name, compute):
+    """Value for name under the current version: memo, then cache, then compute."""
+    global _memo
+    version = cache.get_or_set(CHOICES_VERSION_KEY, time.time_ns(), None)
+    memo = _memo
+    if memo[0] != version:
+        memo = _memo = (version, {})
+    if name in memo[1]:
+        return memo[1][name]
+    key = f"better_bill:choices:{version}:{name}"
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, _timeout())
+    memo[1][name] = value
+    return value
+
+
+def open_client_ids():
+    """Ids of clients with at least one open matter."""
+    return _cached("open_clients", lambda: frozenset(
+        Matter.objects.filter(closed_at__isnull=True)
+        .values_list("client_id", flat=True).distinct()))
+
+
+def lead_open_matters(lead_id):
+    """{client id: frozenset(matter ids)} of open matters led by lead_id."""
+    def compute():
+        """Group the fee earner's open matters by client."""
+        by_client = defaultdict(set)
+        for matter_id, client_id in (Matter.objects
+                                     .filter(closed_at__isnull=True,
+                                             lead_fee_earner_id=lead_id)
+                                     .values_list("id", "client_id")):
+            by_client[client_id].add(matter_id)
+        return {cid: frozenset(ids) for cid, ids in by_client.items()}
+    return _cached(f"lead:{lead_id}", compute)
@@ -1,16 +1,12 @@
 # better_bill_project/context_processors.py
-from .models import Personnel
+from .permissions import capabilities_for
 from .views import can_view_invoices_user, is_time_entry_user
 
 def personnel(request):
     """Add the Personnel profile of the logged-in user to the context."""
     if not getattr(request.user, "is_authenticated", False):
         return {"me": None}
-    try:
-        p = Personnel.objects.select_related("role").get(user=request.user)
-    except Personnel.DoesNotExist:
-        p = None
-    return {"me": p}
+    return {"me": capabilities_for(request.user).personnel}
 
 def global_perms(request):
     """
@@ -0,0 +1,78 @@
+"""
+Data access for the dashboard (index view).
+
+Three queries fill the page whatever the role:
+  - the ten newest unbilled WIP rows for the team,
+  - every total (WIP hours, draft/posted money) in one grouped read of the
+    pre-aggregated summary (summaries.dashboard_totals),
+  - the ten newest draft and ten newest posted invoices together, ranked
+    with ROW_NUMBER() OVER (PARTITION BY ledger status), so the team
+    Exists(InvoiceLine ...) filter is evaluated in a single statement.
+`team` is None (no scoping) or a subquery of fee earner ids (teams.members).
+"""
+from __future__ import annotations
+from django.db.models import Exists, F, OuterRef, Window
+from django.db.models.functions import RowNumber
+from . import summaries
+from .models import Invoice, InvoiceLine, WIP
+
+INVOICE_STATUSES = ("draft", "posted")
+PANEL_SIZE = 10
+
+
+def team_invoices(qs, team):
+    """Limit an Invoice queryset to invoices carrying the team's work."""
+    if team is None:
+        return qs
+    return qs.filter(Exists(InvoiceLine.objects.filter(
+        invoice_id=OuterRef("pk"), wip__fee_earner_id__in=team)))
+
+
+def recent_wip(team, limit=PANEL_SIZE):
+    """Newest unbilled WIP rows for the team."""
+    qs = (WIP.objects
+          .select_related("matter", "client")
+          .filter(status="unbilled")
+          .order_by("-created_at"))
+    if team is not None:
+        qs = qs.filter(fee_earner_id__in=team)
+    return list(qs[:limit])
+
+
+def recent_invoices(team, statuses=INVOICE_STATUSES, per_status=PANEL_SIZE):
+    """Newest invoices per ledger status, in one query. Returns {status: [Invoice]}."""
+    qs = (team_invoices(Invoice.objects.select_related("client", "matter", "ledger"),
+                        team)
+          .filter(ledger__status__in=statuses)
+          .annotate(panel_rank=Window(
+              RowNumber(),
+              partition_by=[F("ledger__status")],
+              order_by=[F("created_at").desc(), F("id").desc()]))
+          .filter(panel_rank__lte=per_status)
+          .order_by("-created_at", "-id"))
+    by_status = {status: [] for status in statuses}
+    for inv in qs:
+        by_status[inv.ledger.status].append(inv)
+    return by_status
+
+
+def panels(team, with_invoices):
+    """Context values for the dashboard tables and their totals."""
+    totals = summaries.dashboard_totals(team)
+    context = {
+        "wip_items": recent_wip(team),
+        "wip_total_hours": totals["wip_hours"],
+    }
+    if with_invoices:
+        invoices = recent_invoices(team)
+        context.update({
+            "draft_invoices": invoices["draft"],
+            "draft_subtotal": totals["draft_subtotal"],
+            "draft_tax":      totals["draft_tax"],
+            "draft_total":    totals["draft_total"],
+            "posted_invoices": invoices["posted"],
+            "post_subtotal":  totals["posted_subtotal"],
+            "post_tax":       totals["posted_tax"],
+            "post_total":     totals["posted_total"],
+        })
+    return context
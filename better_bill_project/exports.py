@@ -0,0 +1,126 @@
+"""
+Streaming CSV / JSONL exports of invoices, invoice lines and the ledger.
+
+Rows are produced from QuerySet.iterator(chunk_size=...) and encoded one
+at a time, so memory stays flat however many invoices match the filters.
+"""
+import csv
+import json
+from decimal import Decimal
+from .filters import filter_invoices
+from .models import Invoice, InvoiceLine, Ledger
+
+CHUNK_SIZE = 2000
+
+INVOICE_HEADER = [
+    "number", "invoice_date", "client_number", "client_name", "matter_number",
+    "tax_rate", "status", "subtotal", "tax", "total", "paid_at", "created_at",
+]
+LINE_HEADER = [
+    "invoice_number", "invoice_date", "matter_number", "fee_earner_initials",
+    "activity_code", "desc", "hours", "rate", "amount", "status",
+]
+LEDGER_HEADER = [
+    "invoice_number", "client_number", "matter_number", "status",
+    "subtotal", "tax", "total", "created_at", "paid_at",
+]
+
+
+def _invoice_rows(invoices):
+    """One row per invoice; totals from the ledger, else the stored invoice totals."""
+    qs = (invoices
+          .select_related("client", "matter", "ledger")
+          .order_by("-created_at", "-id"))
+    for inv in qs.iterator(chunk_size=CHUNK_SIZE):
+        ledger = getattr(inv, "ledger", None)
+        if ledger:
+            status, subtotal, tax, total = (
+                ledger.status, ledger.subtotal, ledger.tax, ledger.total)
+            paid_at = ledger.paid_at
+        else:
+            status, subtotal, tax, total = (
+                "", inv.subtotal, inv.tax_amount, inv.total)
+            paid_at = None
+        yield [
+            inv.number, inv.invoice_date, inv.client.client_number,
+            inv.client.name, inv.matter.matter_number, inv.tax_rate,
+            status, subtotal, tax, total, paid_at, inv.created_at,
+        ]
+
+
+def _line_rows(invoices):
+    """One row per invoice line for the matching invoices."""
+    qs = (InvoiceLine.objects
+          .filter(invoice__in=invoices.values("pk"))
+          .select_related("invoice", "invoice__ledger", "wip__matter",
+                          "wip__fee_earner", "wip__activity_code")
+          .order_by("invoice_id", "id"))
+    for li in qs.iterator(chunk_size=CHUNK_SIZE):
+        ledger = getattr(li.invoice, "ledger", None)
+        yield [
+            li.invoice.number, li.invoice.invoice_date,
+            li.wip.matter.matter_number, li.wip.fee_earner.initials,
+            li.wip.activity_code.activity_code, li.desc,
+            li.hours, li.rate, li.amount, ledger.status if ledger else "",
+        ]
+
+
+def _ledger_rows(invoices):
+    """One row per ledger entry for the matching invoices."""
+    qs = (Ledger.objects
+          .filter(invoice__in=invoices.values("pk"))
+          .select_related("invoice", "client", "matter")
+          .order_by("-created_at", "-id"))
+    for led in qs.iterator(chunk_size=CHUNK_SIZE):
+        yield [
+            led.invoice.number, led.client.client_number,
+            led.matter.matter_number if led.matter_id else "",
+            led.status, led.subtotal, led.tax, led.total,
+            led.created_at, led.paid_at,
+        ]
+
+
+EXPORT_KINDS = {
+    "invoices": (INVOICE_HEADER, _invoice_rows),
+    "lines": (LINE_HEADER, _line_rows),
+    "ledger": (LEDGER_HEADER, _ledger_rows),
+}
+
+
+def export_rows(kind, filters):
+    """Return (header, row iterator) for an export kind and invoice filters."""
+    header, rows = EXPORT_KINDS[kind]
+    return header, rows(filter_invoices(Invoice.objects.all(), filters))
+
+
+class _Echo:
+    """File-like object whose write() just returns the value (for csv.writer)."""
+
+    def write(self, value):
+        return value
+
+
+def _plain(value):
+    """Render a cell for CSV/JSON output."""
+    if value is None:
+        return ""
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def stream_csv(header, rows):
+    """Yield CSV text line by line."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow([_plain(v) for v in row])
+
+
+def stream_jsonl(header, rows):
+    """Yield one JSON object per line."""
+    for row in rows:
+        yield json.dumps(dict(zip(
+            header, (None if v is None else _plain(v) for v in row)))) + "\n"
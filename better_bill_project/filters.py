@@ -0,0 +1,35 @@
+"""Invoice list filters shared by view_invoice and the ledger exports."""
+from django.utils.dateparse import parse_date
+
+
+def invoice_filters(params):
+    """Read the invoice filter values (as submitted strings) from a GET mapping."""
+    return {
+        "number": (params.get("number") or "").strip(),
+        "client": (params.get("client") or "").strip(),
+        "matter": (params.get("matter") or "").strip(),
+        "status": (params.get("status") or "").strip(),  # comes from Ledger.status
+        "date_from": params.get("date_from") or "",
+        "date_to": params.get("date_to") or "",
+    }
+
+
+def filter_invoices(qs, filters):
+    """Apply invoice_filters() values to an Invoice queryset."""
+    date_from = parse_date(filters["date_from"] or "")
+    date_to = parse_date(filters["date_to"] or "")
+
+    if filters["number"]:
+        qs = qs.filter(number__icontains=filters["number"])
+    if filters["client"]:
+        qs = qs.filter(client_id=filters["client"])
+    if filters["matter"]:
+        qs = qs.filter(matter_id=filters["matter"])
+    if filters["status"]:
+        # filter via related Ledger.status
+        qs = qs.filter(ledger__status=filters["status"])
+    if date_from:
+        qs = qs.filter(invoice_date__gte=date_from)
+    if date_to:
+        qs = qs.filter(invoice_date__lte=date_to)
+    return qs
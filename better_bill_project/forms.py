@@ -3,7 +3,52 @@ from decimal import Decimal, ROUND_HALF_UP
 from django import forms
 from django.core.exceptions import ValidationError
 from .models import TimeEntry, Matter, Client, Invoice, Personnel
+from . import choices # cached eligible clients/matters
+from . import refdata # cached activity codes/personnel
 from django.contrib.auth.forms import AuthenticationForm
+from django.urls import reverse_lazy
+from django.utils.http import urlencode
+
+# Select filled by type-ahead search instead of listing every choice
+
+class TypeaheadSelect(forms.Select):
+    """
+    <select> that renders only the blank and currently selected options;
+    static/js/typeahead.js adds a search box that fills it from search_api.
+    The field's queryset still validates the submitted value.
+    params: extra search_api query parameters, e.g. {"open": 1}.
+    """
+    def __init__(self, kind, params=None, attrs=None):
+        """Set the data-* attributes typeahead.js reads."""
+        attrs = {"class": "form-select", **(attrs or {})}
+        super().__init__(attrs)
+        self.kind = kind
+        self.params = params or {}
+
+    def get_context(self, name, value, attrs):
+        """Add the search URL and parameters to the rendered attributes."""
+        context = super().get_context(name, value, attrs)
+        context["widget"]["attrs"].update({
+            "data-typeahead": self.kind,
+            "data-typeahead-url": str(reverse_lazy("search-api")),
+            "data-typeahead-params": urlencode(self.params),
+        })
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        """Only the blank choice and the selected value(s)."""
+        selected = [v for v in value if str(v).isdigit()]
+        choices = self.choices
+        field = getattr(choices, "field", None)
+        rendered = [("", getattr(field, "empty_label", None) or "---------")]
+        if selected and field is not None:
+            rendered += [(obj.pk, field.label_from_instance(obj))
+                         for obj in choices.queryset.filter(pk__in=selected)]
+        self.choices, original = rendered, choices
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = original
 
 # Time entry form with dynamic matter filtering based on selected client
 
@@ -12,7 +57,7 @@ class TimeEntryForm(forms.ModelForm):
     client = forms.ModelChoiceField(
         queryset=Client.objects.order_by("name"),
         required=True,
-        widget=forms.Select(attrs={"class": "form-select"})
+        widget=TypeaheadSelect("client", params={"open": 1})
     )
 
     class Meta:
@@ -43,24 +88,29 @@ class TimeEntryForm(forms.ModelForm):
         if me:
             self.fields["fee_earner"].initial = me.pk
 
+        # Dropdowns render from the reference-data cache; the querysets
+        # are only run to validate a submitted value
+        self.fields["activity_code"].choices = [
+            ("", self.fields["activity_code"].empty_label),
+            *refdata.activity_code_choices()]
+        self.fields["fee_earner"].choices = [
+            ("", self.fields["fee_earner"].empty_label),
+            *refdata.personnel_choices()]
+
         # Non-partners: lock the dropdown to themselves
         if me and not is_partner:
             self.fields["fee_earner"].queryset = Personnel.objects.filter(pk=me.pk)
             self.fields["fee_earner"].empty_label = None  # no blank option
+            self.fields["fee_earner"].choices = [(me.pk, str(me))]
 
-        # Clients with at least one OPEN matter
-        open_client_ids = (
-            Matter.objects
-            .filter(closed_at__isnull=True)
-            .values_list("client_id", flat=True)
-            .distinct()
-        )
+        # Clients with at least one OPEN matter (lazy; only run to validate)
         clients_with_open_matters = Client.objects.filter(
-            id__in=open_client_ids).order_by("name")
+            id__in=Matter.objects.filter(closed_at__isnull=True)
+            .values("client_id")).order_by("name")
 
         # if editing an instance whose client has no open matters, still include it
-        inst_client_id = getattr(getattr(self.instance, "client", None), "id", None)
-        if inst_client_id and inst_client_id not in open_client_ids:
+        inst_client_id = getattr(self.instance, "client_id", None)
+        if inst_client_id and inst_client_id not in choices.open_client_ids():
             clients_with_open_matters = (
                 Client.objects.filter(id=inst_client_id) | clients_with_open_matters
             ).order_by("name")
@@ -76,7 +126,7 @@ class TimeEntryForm(forms.ModelForm):
             except (TypeError, ValueError):
                 cid = None
         elif getattr(self.instance, "pk", None):
-            cid = getattr(getattr(self.instance, "matter", None), "client_id", None)
+            cid = self.instance.client_id  # TimeEntry.clean keeps it = matter's client
 
         if cid:
             self.fields["matter"].queryset = (
@@ -139,9 +189,9 @@ class InvoiceForm(forms.ModelForm):
         model = Invoice
         fields = ["client", "matter", "notes"]
         widgets = {
-            "client": forms.Select(
-                attrs={"id": "id_inv_client",
-                       "class": "form-select", "required": True}),
+            "client": TypeaheadSelect(
+                "client", params={"mine": 1},
+                attrs={"id": "id_inv_client", "required": True}),
             "matter": forms.Select(
                 attrs={"id": "id_inv_matter",
                        "class": "form-select", "required": True}),
@@ -155,16 +205,15 @@ class InvoiceForm(forms.ModelForm):
         me = getattr(user, "personnel_profile", None)
 
         # ----- Clients: only those with at least one OPEN matter led by me -----
+        my_matters = choices.lead_open_matters(me.pk) if me else {}
         if me:
-            my_open_matters = Matter.objects.filter(
-                closed_at__isnull=True,
-                lead_fee_earner=me,
-            )
-            client_ids = my_open_matters.values_list("client_id", flat=True).distinct()
+            client_ids = (Matter.objects
+                          .filter(closed_at__isnull=True, lead_fee_earner=me)
+                          .values("client_id"))
             clients_qs = Client.objects.filter(id__in=client_ids).order_by("name")
 
             inst_client_id = getattr(self.instance, "client_id", None)
-            if inst_client_id and inst_client_id not in client_ids:
+            if inst_client_id and inst_client_id not in my_matters:
                 clients_qs = (
                     Client.objects.filter(
                         id=inst_client_id) | clients_qs).order_by("name")
@@ -197,7 +246,7 @@ class InvoiceForm(forms.ModelForm):
             # Include instance matter (e.g.,
             # when re-editing an older invoice) so the form can render
             inst_matter_id = getattr(self.instance, "matter_id", None)
-            if inst_matter_id and not matters_qs.filter(pk=inst_matter_id).exists():
+            if inst_matter_id and inst_matter_id not in my_matters.get(cid, ()):
                 matters_qs = Matter.objects.filter(pk=inst_matter_id) | matters_qs
 
             self.fields["matter"].queryset = matters_qs.order_by("matter_number")
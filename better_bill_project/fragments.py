@@ -0,0 +1,63 @@
+"""
+Cached HTML fragments.
+
+The matter dropdown (ajax_matter_options) is re-fetched every time a
+client is picked on the time entry, invoice and filter forms. Its
+rendered <option> list is cached per client (and per lead fee earner for
+the invoice form) under a version that any Matter save or delete bumps.
+The same version makes up the ETag, so a browser revalidating an
+unchanged list gets a 304 without a query or a render.
+
+A bump only reaches other workers through a shared cache backend. With
+the default per-process cache the version also rolls over every
+MATTER_OPTIONS_MAX_AGE seconds (on the wall clock, so all workers agree),
+which bounds how long another worker serves a stale list or a 304.
+"""
+from __future__ import annotations
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from .models import Matter
+
+MATTER_OPTIONS_VERSION_KEY = "better_bill:matter_opts:version"
+
+
+def _timeout():
+    """Seconds a rendered fragment is kept."""
+    return getattr(settings, "MATTER_OPTIONS_CACHE_TIMEOUT", 3600)
+
+
+def _max_age():
+    """Seconds before a version rolls over even without a Matter change."""
+    return max(int(getattr(settings, "MATTER_OPTIONS_MAX_AGE", 60)), 1)
+
+
+def matter_options_version():
+    """Current version of every matter option fragment."""
+    version = cache.get_or_set(MATTER_OPTIONS_VERSION_KEY, time.time_ns(), None)
+    return f"{version}.{int(time.time()) // _max_age()}"
+
+
+def invalidate_matter_options():
+    """Bump the version so every client's matter list is re-rendered."""
+    cache.set(MATTER_OPTIONS_VERSION_KEY, time.time_ns(), None)
+
+
+def matter_options_etag(client_id, lead_id=None):
+    """ETag for one client's (optionally lead-restricted) matter list."""
+    return f"mo-{client_id}-{lead_id or 0}-{matter_options_version()}"
+
+
+def matter_options(client_id, lead_id=None):
+    """Rendered <option>s for the client's open matters (led by lead_id if given)."""
+    key = f"better_bill:matter_opts:{matter_options_etag(client_id, lead_id)}"
+    html = cache.get(key)
+    if html is None:
+        matters = Matter.objects.filter(client_id=client_id, closed_at__isnull=True)
+        if lead_id is not None:
+            matters = matters.filter(lead_fee_earner_id=lead_id)
+        html = render_to_string("partials/matter_options.html", {
+            "matters": matters.order_by("matter_number")})
+        cache.set(key, html, _timeout())
+    return html
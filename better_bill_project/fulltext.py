@@ -0,0 +1,150 @@
+"""
+Full-text search over TimeEntry and WIP narratives.
+
+Postgres: each table has a generated `narrative_search` tsvector column
+(english configuration) with a GIN index, so Postgres keeps it current on
+every insert/update with no trigger or application code.
+
+SQLite: an external-content FTS5 table per model (`<table>_fts`) mirrors
+the narrative, kept in step by insert/update/delete triggers.
+
+Both are created by migration 0033 via install(). SQLite drops triggers
+when Django rebuilds a table during a migration, so run
+`rebuild_search_index` (install() again, which also re-indexes) after
+migrating TimeEntry/WIP there. Any other database falls back to icontains.
+
+match_q() gives a Q usable anywhere (admin search, combined filters);
+search() also orders the queryset by relevance.
+"""
+from __future__ import annotations
+import re
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from .models import TimeEntry, WIP
+
+MODELS = (TimeEntry, WIP)
+TS_CONFIG = "english"
+TSVECTOR_COLUMN = "narrative_search"
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def _fts_table(model):
+    """Name of the SQLite FTS5 table mirroring model.narrative."""
+    return f"{model._meta.db_table}_fts"
+
+
+def _fts5_query(text):
+    """User text as an FTS5 query: every word required, last one as a prefix."""
+    words = _TOKEN_RE.findall(text)
+    if not words:
+        return None
+    quoted = [f'"{w}"' for w in words]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+# --- Schema ---
+
+def _postgres_ddl(model):
+    """Generated tsvector column + GIN index."""
+    table = model._meta.db_table
+    return [
+        f'ALTER TABLE "{table}" ADD COLUMN IF NOT EXISTS "{TSVECTOR_COLUMN}" tsvector '
+        f"GENERATED ALWAYS AS (to_tsvector('{TS_CONFIG}', coalesce(narrative, ''))) STORED",
+        f'CREATE INDEX IF NOT EXISTS "{table}_narr_fts_idx" '
+        f'ON "{table}" USING gin ("{TSVECTOR_COLUMN}")',
+    ]
+
+
+def _sqlite_ddl(model):
+    """FTS5 table, sync triggers and a rebuild from the content table."""
+    table, fts = model._meta.db_table, _fts_table(model)
+    return [
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS "{fts}" USING fts5('
+        f"narrative, content='{table}', content_rowid='id')",
+        f'CREATE TRIGGER IF NOT EXISTS "{fts}_ai" AFTER INSERT ON "{table}" BEGIN '
+        f'INSERT INTO "{fts}"(rowid, narrative) VALUES (new.id, new.narrative); END',
+        f'CREATE TRIGGER IF NOT EXISTS "{fts}_ad" AFTER DELETE ON "{table}" BEGIN '
+        f"INSERT INTO \"{fts}\"(\"{fts}\", rowid, narrative) "
+        f"VALUES ('delete', old.id, old.narrative); END",
+        f'CREATE TRIGGER IF NOT EXISTS "{fts}_au" AFTER UPDATE OF narrative ON "{table}" BEGIN '
+        f"INSERT INTO \"{fts}\"(\"{fts}\", rowid, narrative) "
+        f"VALUES ('delete', old.id, old.narrative); "
+        f'INSERT INTO "{fts}"(rowid, narrative) VALUES (new.id, new.narrative); END',
+        f"INSERT INTO \"{fts}\"(\"{fts}\") VALUES ('rebuild')",
+    ]
+
+
+def install(conn=connection):
+    """Create (idempotently) the full-text structures for this database."""
+    ddl = {"postgresql": _postgres_ddl, "sqlite": _sqlite_ddl}.get(conn.vendor)
+    if ddl is None:
+        return
+    with conn.cursor() as cur:
+        for model in MODELS:
+            for sql in ddl(model):
+                cur.execute(sql)
+
+
+def uninstall(conn=connection):
+    """Drop the full-text structures (migration reverse)."""
+    with conn.cursor() as cur:
+        for model in MODELS:
+            table = model._meta.db_table
+            if conn.vendor == "postgresql":
+                cur.execute(f'DROP INDEX IF EXISTS "{table}_narr_fts_idx"')
+                cur.execute(f'ALTER TABLE "{table}" DROP COLUMN IF EXISTS '
+                            f'"{TSVECTOR_COLUMN}"')
+            elif conn.vendor == "sqlite":
+                fts = _fts_table(model)
+                for suffix in ("ai", "ad", "au"):
+                    cur.execute(f'DROP TRIGGER IF EXISTS "{fts}_{suffix}"')
+                cur.execute(f'DROP TABLE IF EXISTS "{fts}"')
+
+
+# --- Queries ---
+
+def match_q(model, text):
+    """Q matching rows of model whose narrative matches text."""
+    table = model._meta.db_table
+    if connection.vendor == "postgresql":
+        return Q(pk__in=RawSQL(
+            f'SELECT "id" FROM "{table}" WHERE "{TSVECTOR_COLUMN}" @@ '
+            f"websearch_to_tsquery('{TS_CONFIG}', %s)", [text]))
+    if connection.vendor == "sqlite":
+        query = _fts5_query(text)
+        if query is None:
+            return Q(pk__in=[])
+        fts = _fts_table(model)
+        return Q(pk__in=RawSQL(
+            f'SELECT rowid FROM "{fts}" WHERE "{fts}" MATCH %s', [query]))
+    return Q(narrative__icontains=text)
+
+
+def rank(model, text):
+    """Relevance of each row's narrative to text (higher is better)."""
+    table = model._meta.db_table
+    if connection.vendor == "postgresql":
+        return RawSQL(
+            f'ts_rank("{table}"."{TSVECTOR_COLUMN}", '
+            f"websearch_to_tsquery('{TS_CONFIG}', %s))", [text],
+            output_field=FloatField())
+    query = _fts5_query(text) if connection.vendor == "sqlite" else None
+    if query is None:
+        return Value(0.0, output_field=FloatField())
+    fts = _fts_table(model)
+    # FTS5 rank is bm25, lower = better
+    return RawSQL(
+        f'(SELECT -rank FROM "{fts}" WHERE "{fts}" MATCH %s '
+        f'AND rowid = "{table}"."id")', [query], output_field=FloatField())
+
+
+def search(qs, text):
+    """qs narrowed to narratives matching text, best matches first."""
+    model = qs.model
+    return (qs.filter(match_q(model, text))
+            .annotate(search_rank=rank(model, text))
+            .order_by("-search_rank", "-created_at", "-id"))
+
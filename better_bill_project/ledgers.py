@@ -0,0 +1,87 @@
+"""
+Bulk invoice ledger actions for the post-invoice page.
+
+post(), delete_drafts() and settle() take any number of invoice ids and
+run a fixed handful of set-based statements in one transaction: lock the
+eligible ledgers, one UPDATE (or DELETE), one grouped read of their lines
+for the dashboard totals. Invoices not in the required status are skipped
+and reported rather than failing the batch. Cached PDFs of the touched
+invoices are dropped after commit; the next download renders afresh.
+"""
+from __future__ import annotations
+import logging
+from django.db import transaction
+from django.utils import timezone
+from . import pdfs
+from . import summaries
+from .models import Invoice, InvoiceLine, Ledger, WIP
+
+log = logging.getLogger(__name__)
+
+
+def _lock(invoice_ids, status):
+    """Lock and return the ledgers of invoice_ids currently in status."""
+    return list(Ledger.objects
+                .filter(invoice_id__in=invoice_ids, status=status)
+                .select_for_update())
+
+
+def _drop_pdfs(invoice_ids):
+    """After commit, delete the invoices' cached PDFs."""
+    def _drop():
+        for pk in invoice_ids:
+            pdfs.invalidate(pk)
+    transaction.on_commit(_drop)
+
+
+def _move(invoice_ids, old_status, new_status, **fields):
+    """Move the old_status ledgers of invoice_ids to new_status. Returns their invoice ids."""
+    with transaction.atomic(), summaries.deferred():
+        ledgers = _lock(invoice_ids, old_status)
+        if not ledgers:
+            return []
+        Ledger.objects.filter(pk__in=[lg.pk for lg in ledgers]).update(
+            status=new_status, **fields)
+        summaries.move_ledgers(ledgers, old_status, new_status)
+        done = [lg.invoice_id for lg in ledgers]
+        _drop_pdfs(done)
+    return done
+
+
+def post(invoice_ids):
+    """Post the draft invoices among invoice_ids. Returns the posted ids."""
+    return _move(invoice_ids, "draft", "posted")
+
+
+def settle(invoice_ids):
+    """Mark the posted invoices among invoice_ids paid. Returns the settled ids."""
+    return _move(invoice_ids, "posted", "paid", paid_at=timezone.now())
+
+
+def delete_drafts(invoice_ids):
+    """
+    Delete the draft invoices among invoice_ids (lines and ledgers cascade)
+    and put their WIP back to unbilled. Returns the deleted ids.
+    """
+    with transaction.atomic(), summaries.deferred():
+        ledgers = _lock(invoice_ids, "draft")
+        if not ledgers:
+            return []
+        done = [lg.invoice_id for lg in ledgers]
+        summaries.remove_ledgers(ledgers)
+
+        wip_ids = InvoiceLine.objects.filter(invoice_id__in=done).values("wip_id")
+        reverted = list(WIP.objects
+                        .filter(id__in=wip_ids)
+                        .exclude(status="unbilled")
+                        .values_list("status", "fee_earner_id", "hours_worked"))
+        for old_status in {r[0] for r in reverted}:
+            summaries.move_wip([r[1:] for r in reverted if r[0] == old_status],
+                               old_status, "unbilled")
+        WIP.objects.filter(id__in=wip_ids).exclude(status="unbilled").update(
+            status="unbilled", updated_at=timezone.now())
+
+        Invoice.objects.filter(id__in=done).delete()
+        _drop_pdfs(done)
+    log.info("Deleted %s draft invoices", len(done))
+    return done
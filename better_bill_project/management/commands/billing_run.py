@@ -0,0 +1,104 @@
+import csv
+from datetime import date
+from decimal import Decimal, InvalidOperation
+import time
+from django.core.management.base import BaseCommand, CommandError
+from better_bill_project import billing
+from better_bill_project.models import Client, Matter
+
+REPORT_FIELDS = ("number", "client", "matter", "lines", "hours",
+                 "subtotal", "tax", "total")
+
+
+def _date(value):
+    """Parse a YYYY-MM-DD option."""
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        raise CommandError(f"Not a YYYY-MM-DD date: {value!r}")
+
+
+class Command(BaseCommand):
+    help = ("Month-end billing run: draft invoices (with draft ledgers) for "
+            "all unbilled WIP, one per matter or per matter and fee earner/month.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--client", nargs="*", default=None,
+                            help="Limit to these client numbers.")
+        parser.add_argument("--matter", nargs="*", default=None,
+                            help="Limit to these matter numbers.")
+        parser.add_argument("--until", default="",
+                            help="Only bill WIP created on or before YYYY-MM-DD.")
+        parser.add_argument("--group-by", choices=sorted(billing.GROUPINGS),
+                            default="matter")
+        parser.add_argument("--invoice-date", default="",
+                            help="YYYY-MM-DD (default today).")
+        parser.add_argument("--tax-rate", default=str(billing.DEFAULT_TAX_RATE),
+                            help="Percent.")
+        parser.add_argument("--notes", default="", help="Notes for every invoice.")
+        parser.add_argument("--batch-size", type=int,
+                            default=billing.DEFAULT_BATCH_SIZE,
+                            help="Matters per transaction.")
+        parser.add_argument("--workers", type=int, default=1,
+                            help="Parallel batches (Postgres only).")
+        parser.add_argument("--report", help="Also write the run report to this CSV.")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Only show what would be invoiced.")
+
+    def _ids(self, model, field, values):
+        """Resolve natural keys to ids, failing on unknown ones."""
+        if values is None:
+            return None
+        found = dict(model.objects.filter(**{f"{field}__in": values})
+                     .values_list(field, "id"))
+        unknown = sorted(set(values) - set(found))
+        if unknown:
+            raise CommandError(f"Unknown {field}: {', '.join(unknown)}")
+        return list(found.values())
+
+    def handle(self, *args, **opts):
+        try:
+            tax_rate = Decimal(opts["tax_rate"])
+        except InvalidOperation:
+            raise CommandError(f"Not a number: {opts['tax_rate']!r}")
+
+        started = time.perf_counter()
+        report = billing.run(
+            client_ids=self._ids(Client, "client_number", opts["client"]),
+            matter_ids=self._ids(Matter, "matter_number", opts["matter"]),
+            until=_date(opts["until"]),
+            group_by=opts["group_by"],
+            invoice_date=_date(opts["invoice_date"]),
+            tax_rate=tax_rate,
+            notes=opts["notes"],
+            batch_size=max(opts["batch_size"], 1),
+            workers=opts["workers"],
+            dry_run=opts["dry_run"],
+            progress=lambda done, total: self.stdout.write(f"{done}/{total} matters"),
+        )
+
+        rows = report["invoices"]
+        for r in rows:
+            self.stdout.write(
+                f"{r['number'] or '(draft)':>8}  {r['client']:<6} {r['matter']:<12} "
+                f"{r['lines']:>4} lines {r['hours']:>8}h {r['total']:>12}")
+        if opts["report"]:
+            with open(opts["report"], "w", newline="") as fh:
+                writer = csv.DictWriter(fh, fieldnames=REPORT_FIELDS)
+                writer.writeheader()
+                writer.writerows(rows)
+        for matter_ids, error in report["failed"]:
+            self.stderr.write(self.style.WARNING(
+                f"batch of {len(matter_ids)} matters failed: {error}"))
+
+        if report["lost"]:
+            self.stderr.write(self.style.WARNING(
+                f"{len(report['lost'])} WIP items were taken by another biller "
+                "or are awaiting a WIP sync, and were left out."))
+
+        total = sum((r["total"] for r in rows), Decimal("0.00"))
+        verb = "Would draft" if opts["dry_run"] else "Drafted"
+        self.stdout.write(self.style.SUCCESS(
+            f"Done. {verb} {len(rows)} invoices totalling {total} for "
+            f"{report['matters']} matters, {len(report['failed'])} batches failed, "
+            f"in {time.perf_counter() - started:.1f}s."))
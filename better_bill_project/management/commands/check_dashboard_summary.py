@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from better_bill_project import summaries
+
+
+class Command(BaseCommand):
+    help = "Diff the dashboard summary against a full recompute of WIP and Ledger."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true",
+                            help="Rebuild the summary if any drift is found.")
+
+    def handle(self, *args, **opts):
+        mismatches = summaries.diff()
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS("Dashboard summary is consistent."))
+            return
+
+        for (fe_id, kind, status), got, exp in mismatches:
+            changed = ", ".join(
+                f"{f}: {got[f]} != {exp[f]}"
+                for f in summaries.VALUE_FIELDS if got[f] != exp[f])
+            self.stdout.write(f"fee_earner={fe_id} {kind}/{status}: {changed}")
+
+        if opts["fix"]:
+            rows = summaries.rebuild()
+            self.stdout.write(self.style.SUCCESS(
+                f"Rebuilt summary ({rows} rows) after {len(mismatches)} mismatches."))
+            return
+        raise CommandError(f"{len(mismatches)} summary rows out of step.")
@@ -0,0 +1,103 @@
+import re
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from better_bill_project import dashboard, teams
+from better_bill_project.models import (
+    Client, Invoice, Matter, Personnel, TimeEntry, WIP)
+
+# Plan lines that mean "read the whole table"
+SEQ_SCAN_PATTERNS = {
+    "postgresql": re.compile(r"Seq Scan on (\w+)"),
+    "sqlite": re.compile(r"\bSCAN (\w+)(?! USING (?:COVERING )?INDEX)"),
+}
+
+
+def canonical_queries():
+    """
+    The query shapes the views run on every page load, built with
+    representative parameter values from the current database.
+    """
+    fe_id = Personnel.objects.values_list("id", flat=True).first() or 0
+    client_id = Client.objects.values_list("id", flat=True).first() or 0
+    matter_id = Matter.objects.values_list("id", flat=True).first() or 0
+    team = teams.members(fe_id)
+    now = timezone.now()
+
+    return {
+        "index: unbilled WIP for team": (
+            WIP.objects.filter(status="unbilled", fee_earner_id__in=team)
+            .order_by("-created_at")[:10]),
+        # The ranked inner query (EXPLAIN can't wrap the rank filter's subquery)
+        "index: newest draft/posted invoices for team": (
+            dashboard.team_invoices(Invoice.objects.all(), team)
+            .filter(ledger__status__in=dashboard.INVOICE_STATUSES)
+            .annotate(panel_rank=Window(
+                RowNumber(), partition_by=[F("ledger__status")],
+                order_by=[F("created_at").desc(), F("id").desc()]))),
+        "view_invoice: invoices by status": (
+            Invoice.objects.filter(ledger__status="posted")
+            .order_by("-created_at", "-id")[:26]),
+        "view_invoice: invoices by client": (
+            Invoice.objects.filter(client_id=client_id)
+            .order_by("-created_at", "-id")[:26]),
+        "view_invoice: next page (keyset)": (
+            Invoice.objects.filter(
+                Q(created_at__lt=now) | Q(created_at=now, id__lt=1),
+                created_at__lte=now)
+            .order_by("-created_at", "-id")[:26]),
+        "record_time: recent entries for fee earner": (
+            TimeEntry.objects.filter(fee_earner_id=fe_id)
+            .order_by("-created_at")[:20]),
+        "wip_picker_api: first page of unbilled WIP for matter": (
+            WIP.objects.filter(status="unbilled", matter_id=matter_id)
+            .order_by("-created_at", "-id")[:51]),
+        "ajax_matter_options: open matters for client": (
+            Matter.objects.filter(client_id=client_id, closed_at__isnull=True)
+            .order_by("matter_number")),
+        "InvoiceForm: open matters led by fee earner": (
+            Matter.objects.filter(lead_fee_earner_id=fe_id, closed_at__isnull=True)
+            .values_list("client_id", flat=True).distinct()),
+    }
+
+
+class Command(BaseCommand):
+    help = ("Run EXPLAIN over the canonical view queries and report any that "
+            "fall back to sequential scans.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--analyze", action="store_true",
+                            help="Refresh planner statistics (ANALYZE) first.")
+        parser.add_argument("--verbose-plans", action="store_true",
+                            help="Print the full plan for every query.")
+        parser.add_argument("--fail", action="store_true",
+                            help="Exit non-zero if any query seq-scans.")
+
+    def handle(self, *args, **opts):
+        vendor = connection.vendor
+        pattern = SEQ_SCAN_PATTERNS.get(vendor)
+        if pattern is None:
+            raise CommandError(f"Unsupported database vendor: {vendor}")
+
+        if opts["analyze"]:
+            with connection.cursor() as cur:
+                cur.execute("ANALYZE")
+
+        offenders = []
+        for name, qs in canonical_queries().items():
+            plan = qs.explain()
+            scans = sorted(set(pattern.findall(plan)))
+            if opts["verbose_plans"]:
+                self.stdout.write(f"--- {name}\n{plan}\n")
+            if scans:
+                offenders.append(name)
+                self.stdout.write(self.style.WARNING(
+                    f"SEQ SCAN  {name}: {', '.join(scans)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"indexed   {name}"))
+
+        if offenders and opts["fail"]:
+            raise CommandError(f"{len(offenders)} queries use sequential scans.")
+        self.stdout.write(f"Done. {len(offenders)} sequential-scan queries.")
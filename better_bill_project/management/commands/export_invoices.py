@@ -0,0 +1,41 @@
+import sys
+from django.core.management.base import BaseCommand
+from better_bill_project.exports import (
+    EXPORT_KINDS, export_rows, stream_csv, stream_jsonl)
+
+
+class Command(BaseCommand):
+    help = "Stream invoices, invoice lines or ledger rows to CSV/JSONL."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--kind", choices=sorted(EXPORT_KINDS), default="invoices")
+        parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+        parser.add_argument("--output", "-o", default="-",
+                            help="Output file (default: stdout).")
+        # Same filters as the View Invoice page
+        parser.add_argument("--number", default="")
+        parser.add_argument("--client", default="", help="Client id.")
+        parser.add_argument("--matter", default="", help="Matter id.")
+        parser.add_argument("--status", default="", help="Ledger status.")
+        parser.add_argument("--date-from", default="", help="YYYY-MM-DD")
+        parser.add_argument("--date-to", default="", help="YYYY-MM-DD")
+
+    def handle(self, *args, **opts):
+        filters = {k: opts[k] for k in (
+            "number", "client", "matter", "status", "date_from", "date_to")}
+        header, rows = export_rows(opts["kind"], filters)
+        stream = stream_csv if opts["format"] == "csv" else stream_jsonl
+
+        out = sys.stdout if opts["output"] == "-" else open(
+            opts["output"], "w", newline="", encoding="utf-8")
+        count = 0
+        try:
+            for chunk in stream(header, rows):
+                out.write(chunk)
+                count += 1
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        if out is not sys.stdout:
+            self.stdout.write(self.style.SUCCESS(
+                f"Done. Wrote {count} lines to {opts['output']}"))
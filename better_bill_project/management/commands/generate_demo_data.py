@@ -0,0 +1,270 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from better_bill_project import summaries, teams
+from better_bill_project.ingest import ingest_time_entries
+from better_bill_project.models import (
+    ActivityCode, Client, Invoice, InvoiceLine, Ledger, Matter, Personnel, Role, WIP)
+from better_bill_project.numbering import format_invoice_number, reserve_numbers
+
+# Role name -> hourly rate
+ROLES = {
+    "Partner": Decimal("350.00"),
+    "Associate Partner": Decimal("275.00"),
+    "Trainee associate": Decimal("150.00"),
+    "Paralegal": Decimal("120.00"),
+    "Case administrator": Decimal("90.00"),
+    "Billing Administrator": Decimal("0.00"),
+    "Cashier": Decimal("0.00"),
+}
+FEE_EARNER_ROLES = ["Trainee associate", "Paralegal", "Case administrator"]
+ACTIVITIES = [
+    ("ATT", "Attendance"), ("CORR", "Correspondence"), ("DRAFT", "Drafting"),
+    ("RES", "Research"), ("CALL", "Telephone call"), ("MTG", "Meeting"),
+    ("REV", "Document review"), ("TRAV", "Travel"), ("COURT", "Court"),
+    ("NEG", "Negotiation"),
+]
+NAME_A = ["Ashford", "Bramley", "Carrow", "Dunmore", "Ellery", "Fenwick",
+          "Garside", "Holloway", "Ingram", "Jessop", "Kendal", "Lockwood"]
+NAME_B = ["Holdings", "Logistics", "Estates", "Foods", "Partners", "Trust",
+          "Engineering", "Retail", "Media", "Group", "Developments", "Ltd"]
+WORK = ["Reviewed", "Drafted", "Considered", "Discussed", "Prepared", "Amended"]
+WHAT = ["lease", "share purchase agreement", "witness statement", "disclosure",
+        "board minutes", "settlement terms", "title report", "employment contract"]
+
+# Prefixes keep generated rows apart from real data
+CLIENT_PREFIX = "G"
+MATTER_PREFIX = "GM"
+PERSON_PREFIX = "GP"
+BENCH_USERS = ("bench_partner", "bench_billing", "bench_fe")
+
+
+class Command(BaseCommand):
+    help = ("Generate a synthetic law-firm dataset (clients, matters, personnel "
+            "hierarchy, time entries/WIP, invoices/ledger) for benchmarking.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=2000)
+        parser.add_argument("--matters-per-client", type=int, default=3)
+        parser.add_argument("--personnel", type=int, default=300)
+        parser.add_argument("--time-entries", type=int, default=1_000_000)
+        parser.add_argument("--invoices", type=int, default=20_000)
+        parser.add_argument("--lines-per-invoice", type=int, default=8)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--password", default="bench",
+                            help=f"Password for the {', '.join(BENCH_USERS)} users.")
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **opts):
+        if Client.objects.filter(client_number__startswith=CLIENT_PREFIX).exists():
+            raise CommandError("Generated data already present (clients "
+                               f"{CLIENT_PREFIX}*). Use a fresh database.")
+        if opts["clients"] > 99999:
+            raise CommandError("--clients must be at most 99999.")
+        self.rng = random.Random(opts["seed"])
+        self.batch = opts["batch_size"]
+        started = time.perf_counter()
+
+        roles = self._roles()
+        managers, earners = self._personnel(roles, opts["personnel"])
+        self._users(opts["password"], managers, earners, roles)
+        activities = self._activities()
+        matters = self._clients_and_matters(
+            opts["clients"], opts["matters_per_client"], managers)
+        self._time_entries(opts["time_entries"], matters, managers + earners,
+                           activities)
+        self._invoices(opts["invoices"], opts["lines_per_invoice"])
+
+        self._step("Rebuilding reporting-line closure and dashboard summary")
+        teams.rebuild()
+        summaries.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Done. Generated dataset in {time.perf_counter() - started:.1f}s."))
+
+    def _step(self, msg):
+        """Progress line."""
+        self.stdout.write(f"- {msg}")
+
+    # --- Reference data ---
+
+    def _roles(self):
+        """Return {role name: Role}, creating missing roles."""
+        self._step("Roles")
+        roles = {}
+        for name, rate in ROLES.items():
+            roles[name], _ = Role.objects.get_or_create(role=name,
+                                                        defaults={"rate": rate})
+        return roles
+
+    def _personnel(self, roles, count):
+        """Partners/associate partners first, then fee earners reporting to them."""
+        self._step(f"{count} personnel")
+        n_managers = max(count // 10, 1)
+        managers = Personnel.objects.bulk_create([
+            Personnel(initials=f"{PERSON_PREFIX}{i:05d}", name=f"Manager {i}",
+                      role=roles["Partner" if i % 3 == 0 else "Associate Partner"])
+            for i in range(n_managers)
+        ], batch_size=self.batch)
+        earners = Personnel.objects.bulk_create([
+            Personnel(initials=f"{PERSON_PREFIX}{i:05d}", name=f"Fee Earner {i}",
+                      role=roles[self.rng.choice(FEE_EARNER_ROLES)],
+                      line_manager=self.rng.choice(managers))
+            for i in range(n_managers, count)
+        ], batch_size=self.batch)
+        # Non-fee-earning staff for the billing views
+        Personnel.objects.bulk_create([
+            Personnel(initials=f"{PERSON_PREFIX}B{i}", name=f"Billing {i}",
+                      role=roles["Billing Administrator"]) for i in range(2)
+        ] + [Personnel(initials=f"{PERSON_PREFIX}C0", name="Cashier 0",
+                       role=roles["Cashier"])])
+        return list(managers), list(earners)
+
+    def _users(self, password, managers, earners, roles):
+        """Log-in users for the benchmark runner (one hash for all)."""
+        self._step("Benchmark users")
+        User = get_user_model()
+        hashed = make_password(password)
+        billing = Personnel.objects.get(initials=f"{PERSON_PREFIX}B0")
+        partner = next(p for p in managers if p.role_id == roles["Partner"].pk)
+        fee_earner = earners[0] if earners else managers[-1]
+        # Ledger.permissions sits outside Meta, so migrate never creates it
+        post_perm = (Permission.objects.filter(codename="post_invoice").first()
+                     or Permission.objects.create(
+                         codename="post_invoice", name="Can post invoices",
+                         content_type=ContentType.objects.get_for_model(Ledger)))
+        for username, person in zip(BENCH_USERS, (partner, billing, fee_earner)):
+            user, _ = User.objects.update_or_create(
+                username=username, defaults={"password": hashed})
+            Personnel.objects.filter(pk=person.pk).update(user=user)
+            if person is not fee_earner:
+                user.user_permissions.add(post_perm)
+
+    def _activities(self):
+        """Activity codes (reuses existing codes with the same name)."""
+        for code, desc in ACTIVITIES:
+            ActivityCode.objects.get_or_create(
+                activity_code=code, defaults={"activity_description": desc})
+        return [code for code, _ in ACTIVITIES]
+
+    def _clients_and_matters(self, n_clients, per_client, managers):
+        """Clients and their matters; about one matter in ten is closed."""
+        self._step(f"{n_clients} clients, {n_clients * per_client} matters")
+        now = timezone.now()
+        clients = Client.objects.bulk_create([
+            Client(client_number=f"{CLIENT_PREFIX}{i:05d}",
+                   name=f"{self.rng.choice(NAME_A)} {self.rng.choice(NAME_B)} {i}",
+                   city=self.rng.choice(["London", "Leeds", "Bristol", "York"]))
+            for i in range(1, n_clients + 1)
+        ], batch_size=self.batch)
+        matters = []
+        n = 0
+        for client in clients:
+            for _ in range(per_client):
+                n += 1
+                opened = now - timedelta(days=self.rng.randint(30, 2000))
+                matters.append(Matter(
+                    matter_number=f"{MATTER_PREFIX}{n:07d}",
+                    description=f"{self.rng.choice(WHAT).title()} for {client.name}",
+                    client=client, lead_fee_earner=self.rng.choice(managers),
+                    opened_at=opened,
+                    closed_at=now if self.rng.random() < 0.1 else None))
+        Matter.objects.bulk_create(matters, batch_size=self.batch)
+        return [(m.matter_number, m.client.client_number, m.lead_fee_earner)
+                for m in matters]
+
+    # --- Transactions ---
+
+    def _time_entries(self, count, matters, people, activities):
+        """Time entries (and WIP) through the bulk ingestion path."""
+        self._step(f"{count} time entries / WIP")
+        team = {}
+        for p in people:
+            team.setdefault(p.line_manager_id or p.pk, []).append(p.initials)
+
+        def rows():
+            """Time on a matter is mostly logged by its lead's team."""
+            for _ in range(count):
+                number, client_number, lead = self.rng.choice(matters)
+                who = self.rng.choice(team.get(lead.pk) or [lead.initials])
+                yield {
+                    "matter_number": number,
+                    "client_number": client_number,
+                    "fee_earner_initials": who,
+                    "activity_code": self.rng.choice(activities),
+                    "hours_worked": f"{self.rng.randint(1, 60) / 10:.1f}",
+                    "narrative": f"{self.rng.choice(WORK)} {self.rng.choice(WHAT)}",
+                }
+
+        result = ingest_time_entries(rows(), chunk_size=self.batch, allow_closed=True)
+        if result["errors"]:
+            raise CommandError(f"Time entry generation failed: {result['errors'][:3]}")
+
+    def _invoices(self, count, lines_per_invoice):
+        """Invoice unbilled WIP matter by matter; ledger status ~10/50/40 draft/posted/paid."""
+        self._step(f"{count} invoices")
+        rates = dict(Personnel.objects.values_list("id", "role__rate"))
+        wip = (WIP.objects.filter(status="unbilled")
+               .order_by("matter_id", "id")
+               .values_list("id", "matter_id", "client_id", "fee_earner_id",
+                            "hours_worked", "narrative"))
+
+        groups, current = [], []
+        for row in wip.iterator(chunk_size=self.batch):
+            if current and (row[1] != current[0][1] or len(current) >= lines_per_invoice):
+                groups.append(current)
+                current = []
+                if len(groups) >= count:
+                    break
+            current.append(row)
+        if current and len(groups) < count:
+            groups.append(current)
+
+        today = timezone.localdate()
+        tax_rate = Decimal("20.00")
+        for start in range(0, len(groups), self.batch):
+            chunk = groups[start:start + self.batch]
+            numbers = reserve_numbers(len(chunk))
+            with transaction.atomic():
+                invoices = []
+                for number, rows in zip(numbers, chunk):
+                    inv = Invoice(number=format_invoice_number(number),
+                                  client_id=rows[0][2], matter_id=rows[0][1],
+                                  invoice_date=today - timedelta(
+                                      days=self.rng.randint(0, 365)),
+                                  tax_rate=tax_rate)
+                    inv.set_totals(sum(
+                        (Decimal(r[4]) * (rates.get(r[3]) or 0)).quantize(Decimal("0.01"))
+                        for r in rows))
+                    invoices.append(inv)
+                Invoice.objects.bulk_create(invoices)
+
+                lines, ledgers, wip_ids = [], [], []
+                for inv, rows in zip(invoices, chunk):
+                    for wid, _mid, _cid, fe_id, hours, narrative in rows:
+                        rate = rates.get(fe_id) or Decimal("0.00")
+                        lines.append(InvoiceLine(
+                            invoice=inv, wip_id=wid, desc=narrative[:255],
+                            hours=hours, rate=rate,
+                            amount=(Decimal(hours) * rate).quantize(Decimal("0.01"))))
+                        wip_ids.append(wid)
+                    roll = self.rng.random()
+                    status = "draft" if roll < 0.1 else "posted" if roll < 0.6 else "paid"
+                    ledgers.append(Ledger(
+                        invoice=inv, client_id=inv.client_id, matter_id=inv.matter_id,
+                        subtotal=inv.subtotal, tax=inv.tax_amount, total=inv.total,
+                        status=status,
+                        paid_at=timezone.now() if status == "paid" else None))
+                InvoiceLine.objects.bulk_create(lines, batch_size=self.batch)
+                Ledger.objects.bulk_create(ledgers, batch_size=self.batch)
+                for i in range(0, len(wip_ids), self.batch):
+                    WIP.objects.filter(id__in=wip_ids[i:i + self.batch]).update(
+                        status="billed")
+            self.stdout.write(f"  {min(start + self.batch, len(groups))}/{len(groups)}")
@@ -0,0 +1,70 @@
+import csv
+import json
+import sys
+import time
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from better_bill_project.ingest import DEFAULT_CHUNK_SIZE, ingest_time_entries
+
+
+def read_csv(fh):
+    """Yield row dicts from a CSV file with a header row."""
+    yield from csv.DictReader(fh)
+
+
+def read_jsonl(fh):
+    """Yield row dicts from a JSON-lines file, skipping blank lines."""
+    for line in fh:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+class Command(BaseCommand):
+    help = "Bulk-import time entries (and their WIP) from CSV or JSONL."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import, or '-' for stdin.")
+        parser.add_argument("--format", choices=["csv", "jsonl"],
+                            help="Defaults to the file extension.")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument("--strict", action="store_true",
+                            help="Stop at the first chunk with an invalid row.")
+        parser.add_argument("--allow-closed", action="store_true",
+                            help="Accept time on closed matters.")
+
+    def handle(self, *args, **opts):
+        path = opts["path"]
+        fmt = opts["format"] or ("jsonl" if path.endswith((".jsonl", ".json"))
+                                 else "csv")
+        reader = read_jsonl if fmt == "jsonl" else read_csv
+
+        if path == "-":
+            fh = sys.stdin
+        elif not Path(path).exists():
+            raise CommandError(f"File not found: {path}")
+        else:
+            fh = open(path, newline="", encoding="utf-8")
+
+        started = time.perf_counter()
+        try:
+            result = ingest_time_entries(
+                reader(fh),
+                chunk_size=opts["chunk_size"],
+                strict=opts["strict"],
+                allow_closed=opts["allow_closed"],
+            )
+        finally:
+            if fh is not sys.stdin:
+                fh.close()
+        elapsed = time.perf_counter() - started
+
+        for row_no, msg in result["errors"][:50]:
+            self.stderr.write(self.style.WARNING(f"row {row_no}: {msg}"))
+        if len(result["errors"]) > 50:
+            self.stderr.write(f"... {len(result['errors']) - 50} more errors")
+
+        rate = result["created"] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Done. Created {result['created']} entries "
+            f"({len(result['errors'])} errors) in {elapsed:.2f}s ({rate:,.0f}/s)."))
@@ -0,0 +1,54 @@
+import json
+import logging
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from better_bill_project import outbox
+
+log = logging.getLogger("better_bill_project.outbox")
+
+
+class Command(BaseCommand):
+    help = ("Apply queued TimeEntry -> WIP work from the outbox. Runs as a "
+            "long-lived worker unless --once is given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=outbox.DEFAULT_BATCH_SIZE)
+        parser.add_argument("--interval", type=float, default=1.0,
+                            help="Seconds to sleep when the outbox is empty.")
+        parser.add_argument("--stats-every", type=float, default=60.0,
+                            help="Log outbox lag every N seconds.")
+        parser.add_argument("--once", action="store_true",
+                            help="Drain what is due now, then exit.")
+        parser.add_argument("--stats", action="store_true",
+                            help="Print outbox lag as JSON and exit.")
+
+    def handle(self, *args, **opts):
+        if opts["stats"]:
+            self.stdout.write(json.dumps(outbox.lag()))
+            return
+
+        processed = failed = 0
+        last_stats = 0.0
+        try:
+            while True:
+                result = outbox.drain_once(opts["batch_size"])
+                processed += result["processed"]
+                failed += result["failed"]
+
+                now = time.monotonic()
+                if now - last_stats >= opts["stats_every"]:
+                    log.info("WIP outbox lag: %s", json.dumps(outbox.lag()))
+                    last_stats = now
+
+                if result["processed"] or result["failed"]:
+                    continue
+                if opts["once"]:
+                    break
+                close_old_connections()
+                time.sleep(opts["interval"])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done. Applied {processed} outbox rows ({failed} failed, will retry)."))
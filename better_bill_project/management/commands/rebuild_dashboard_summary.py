@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from better_bill_project import summaries
+
+
+class Command(BaseCommand):
+    help = "Rebuild the pre-aggregated dashboard summary from WIP and Ledger."
+
+    def handle(self, *args, **opts):
+        with transaction.atomic():
+            rows = summaries.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Done. Summary rows written: {rows}"))
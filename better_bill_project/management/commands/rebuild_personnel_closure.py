@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from better_bill_project import teams
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the reporting-line closure table from Personnel.line_manager "
+            "(after bulk imports or raw SQL changes).")
+
+    def handle(self, *args, **opts):
+        rows = teams.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Done. Closure rows written: {rows}"))
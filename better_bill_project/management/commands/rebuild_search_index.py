@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from better_bill_project import fulltext
+
+
+class Command(BaseCommand):
+    help = ("Recreate the narrative full-text index (SQLite: FTS5 tables and "
+            "triggers, fully re-indexed; Postgres: generated column and GIN index).")
+
+    def handle(self, *args, **opts):
+        fulltext.install()
+        self.stdout.write(self.style.SUCCESS(
+            f"Done. Full-text index ready on {connection.vendor}."))
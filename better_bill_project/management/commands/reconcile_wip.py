@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand, CommandError
+from better_bill_project import reconcile
+from better_bill_project.models import Matter, Personnel
+
+
+class Command(BaseCommand):
+    help = ("Report (and by default fix) drift between TimeEntry and WIP: "
+            "unbilled WIP is updated set-wise, billed/written-off is only reported.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--matter", nargs="*", default=None,
+                            help="Limit to these matter numbers.")
+        parser.add_argument("--fee-earner", nargs="*", default=None,
+                            help="Limit to these fee earner initials.")
+        parser.add_argument("--align-clients", action="store_true",
+                            help="First point time entries at their matter's "
+                                 "current client (after a matter moved client).")
+        parser.add_argument("--create-missing", action="store_true",
+                            help="Create WIP for time entries that have none.")
+        parser.add_argument("--batch-size", type=int,
+                            default=reconcile.DEFAULT_BATCH_SIZE)
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Only report drift.")
+
+    def _ids(self, model, field, values):
+        """Resolve natural keys to ids, failing on unknown ones."""
+        if values is None:
+            return None
+        found = dict(model.objects.filter(**{f"{field}__in": values})
+                     .values_list(field, "id"))
+        unknown = sorted(set(values) - set(found))
+        if unknown:
+            raise CommandError(f"Unknown {field}: {', '.join(unknown)}")
+        return list(found.values())
+
+    def _report(self, label, report):
+        """Print a drift report."""
+        self.stdout.write(f"{label}:")
+        if not report["by_status"] and not report["missing_wip"]:
+            self.stdout.write("  no drift")
+            return
+        for status, counts in report["by_status"].items():
+            fields = ", ".join(f"{f}={n}" for f, n in counts.items()
+                               if f != "rows" and n)
+            self.stdout.write(f"  {status}: {counts['rows']} rows ({fields})")
+        if report["missing_wip"]:
+            self.stdout.write(f"  time entries without WIP: {report['missing_wip']}")
+
+    def handle(self, *args, **opts):
+        scope = {
+            "matter_ids": self._ids(Matter, "matter_number", opts["matter"]),
+            "fee_earner_ids": self._ids(Personnel, "initials", opts["fee_earner"]),
+        }
+        self._report("Drift before", reconcile.drift(**scope))
+        if opts["dry_run"]:
+            return
+
+        if opts["align_clients"]:
+            n = reconcile.align_time_entry_clients(scope["matter_ids"])
+            self.stdout.write(f"Re-pointed {n} time entries to their matter's client.")
+        if opts["create_missing"]:
+            n = reconcile.create_missing_wip(**scope)
+            self.stdout.write(f"Created {n} missing WIP rows.")
+
+        result = reconcile.sync_wip(batch_size=opts["batch_size"], **scope)
+        after = reconcile.drift(**scope)
+        self._report("Drift after", after)
+        self.stdout.write(self.style.SUCCESS(
+            f"Done. Updated {result['updated']} WIP rows in {result['batches']} "
+            f"batches; {sum(s['rows'] for s in after['by_status'].values())} "
+            "rows still differ (billed/written off are left alone)."))
@@ -0,0 +1,151 @@
+import os
+import shutil
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from os import cpu_count
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from better_bill_project import pdfs
+from better_bill_project.filters import filter_invoices
+from better_bill_project.models import Invoice
+
+
+def _filename(number):
+    """Output name for an invoice PDF (same as the download)."""
+    return f"Invoice-{number}.pdf"
+
+
+def _pool(workers):
+    """A fresh render pool."""
+    return ProcessPoolExecutor(max_workers=max(workers, 1),
+                               initializer=pdfs.init_worker)
+
+
+class Command(BaseCommand):
+    help = ("Render invoice PDFs in bulk (e.g. month end) into a directory "
+            "or a zip archive, in parallel across CPU cores.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--status", default="posted",
+                            help="Ledger status to include ('' for all).")
+        parser.add_argument("--date-from", default="", help="YYYY-MM-DD")
+        parser.add_argument("--date-to", default="", help="YYYY-MM-DD")
+        out = parser.add_mutually_exclusive_group(required=True)
+        out.add_argument("--out-dir", help="Write one PDF per invoice here.")
+        out.add_argument("--zip", help="Write all PDFs into this zip archive.")
+        parser.add_argument("--workers", type=int, default=cpu_count() or 1)
+        parser.add_argument("--batch-size", type=int, default=200,
+                            help="Invoices loaded (and prefetched) per batch.")
+        parser.add_argument("--force", action="store_true",
+                            help="Re-render PDFs already in the output.")
+
+    def handle(self, *args, **opts):
+        filters = {"number": "", "client": "", "matter": "",
+                   "status": opts["status"], "date_from": opts["date_from"],
+                   "date_to": opts["date_to"]}
+        ids = list(filter_invoices(Invoice.objects.all(), filters)
+                   .order_by("id").values_list("id", flat=True))
+        if not ids:
+            self.stdout.write("No invoices match.")
+            return
+
+        # Resumability: skip anything already in the output. A zip is built
+        # as <zip>.part (seeded from an existing archive) and renamed when
+        # the run completes, so a killed run never leaves a broken archive;
+        # re-running it takes the PDFs it had rendered from the PDF cache.
+        archive = None
+        if opts["zip"]:
+            final = Path(opts["zip"])
+            part = final.with_name(final.name + ".part")
+            if final.exists() and not opts["force"]:
+                try:
+                    with zipfile.ZipFile(final):
+                        pass
+                except zipfile.BadZipFile:
+                    raise CommandError(f"Not a zip archive: {final}")
+                shutil.copyfile(final, part)
+                archive = zipfile.ZipFile(part, "a", zipfile.ZIP_DEFLATED)
+            else:
+                archive = zipfile.ZipFile(part, "w", zipfile.ZIP_DEFLATED)
+            done_names = set(archive.namelist())
+        else:
+            out_dir = Path(opts["out_dir"])
+            out_dir.mkdir(parents=True, exist_ok=True)
+            done_names = set() if opts["force"] else {
+                p.name for p in out_dir.glob("Invoice-*.pdf")}
+
+        def _emit(path, name):
+            """Copy a rendered PDF into the output."""
+            if archive is not None:
+                archive.write(path, name)
+            else:
+                # Copy under a temporary name so a killed run never leaves
+                # a truncated Invoice-N.pdf that a resume would skip
+                tmp = out_dir / f"{name}.part"
+                shutil.copyfile(path, tmp)
+                os.replace(tmp, out_dir / name)
+
+        total, written, skipped, failed = len(ids), 0, 0, []
+        started = time.perf_counter()
+        completed = False
+        try:
+            pool = _pool(opts["workers"])
+            try:
+                for i in range(0, total, opts["batch_size"]):
+                    batch = ids[i:i + opts["batch_size"]]
+                    jobs = {}
+                    for inv in pdfs.pdf_queryset().filter(id__in=batch):
+                        name = _filename(inv.number)
+                        if name in done_names:
+                            skipped += 1
+                            continue
+                        key = pdfs.invoice_key(inv)
+                        path = pdfs.cached_pdf(inv.pk, key)
+                        if path is not None:
+                            _emit(path, name)
+                            written += 1
+                            continue
+                        path = pdfs.cache_path(inv.pk, key)
+                        future = pool.submit(pdfs.write_pdf, pdfs.invoice_html(inv),
+                                             str(path))
+                        jobs[future] = (path, name)
+
+                    broken = False
+                    for future in as_completed(jobs):
+                        path, name = jobs[future]
+                        # One bad invoice (or a crashed worker) must not
+                        # abort the run: record it and carry on
+                        try:
+                            ok = future.result()
+                        except Exception as exc:
+                            broken |= isinstance(exc, BrokenProcessPool)
+                            failed.append(f"{name} ({type(exc).__name__}: {exc})")
+                            continue
+                        if ok:
+                            _emit(path, name)
+                            written += 1
+                        else:
+                            failed.append(name)
+                    if broken:
+                        pool.shutdown(cancel_futures=True)
+                        pool = _pool(opts["workers"])
+
+                    done = min(i + len(batch), total)
+                    rate = done / (time.perf_counter() - started)
+                    self.stdout.write(f"{done}/{total} invoices ({rate:,.1f}/s)")
+            finally:
+                pool.shutdown()
+            completed = True
+        finally:
+            if archive is not None:
+                archive.close()
+                if completed:
+                    os.replace(part, final)
+
+        for name in failed:
+            self.stderr.write(self.style.WARNING(f"render failed: {name}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Done. Wrote {written} PDFs, skipped {skipped} already present, "
+            f"{len(failed)} failed, in {time.perf_counter() - started:.1f}s."))
@@ -0,0 +1,224 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client as TestClient
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from better_bill_project import pdfs, teams
+from better_bill_project.pagination import keyset_page
+from better_bill_project.models import (
+    Client, Invoice, Ledger, Matter, Personnel, TimeEntry, WIP)
+
+
+class _Rollback(Exception):
+    """Raised to undo a benchmarked write."""
+
+
+def _git_commit():
+    """Current commit hash, or None outside a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+            text=True, cwd=settings.BASE_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+class Command(BaseCommand):
+    help = ("Time the main views (wall time and query count) against the "
+            "current database and write JSON results for comparison.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=10)
+        parser.add_argument("--warmup", type=int, default=2)
+        parser.add_argument("--only", nargs="*", default=None,
+                            help="Run only these scenario names.")
+        parser.add_argument("--output", "-o", help="Write JSON results here.")
+        parser.add_argument("--compare", help="Earlier results JSON to diff against.")
+        parser.add_argument("--partner-user", default="bench_partner")
+        parser.add_argument("--billing-user", default="bench_billing")
+        parser.add_argument("--fee-earner-user", default="bench_fe")
+
+    # --- Scenarios ---
+
+    def _scenarios(self, opts):
+        """name -> (username, callable(client) -> response)."""
+        partner = Personnel.objects.filter(
+            user__username=opts["partner_user"]).first()
+        if partner is None:
+            raise CommandError(f"No Personnel for user {opts['partner_user']!r}; "
+                               "run generate_demo_data first.")
+        team = teams.members(partner.pk)
+        matter = (Matter.objects.filter(lead_fee_earner=partner, closed_at__isnull=True,
+                                        wip_items__status="unbilled",
+                                        wip_items__fee_earner_id__in=team)
+                  .order_by("id").first())
+        invoice_id = (Ledger.objects.filter(status="posted")
+                      .order_by("-invoice_id").values_list("invoice_id", flat=True)
+                      .first() or Invoice.objects.values_list("id", flat=True).first())
+        # Cursor for page 50 of the unfiltered invoice list
+        deep_cursor = None
+        for _ in range(49):
+            page = keyset_page(Invoice.objects.all(), deep_cursor, per_page=25)
+            if not page.has_next:
+                break
+            deep_cursor = page.next_cursor
+
+        def create_invoice_post(c):
+            """Create an invoice from the matter's WIP, then roll it back."""
+            wip_ids = list(WIP.objects.filter(matter=matter, status="unbilled")
+                           .values_list("id", flat=True)[:20])
+            try:
+                with transaction.atomic():
+                    response = c.post(reverse("create-invoice"), {
+                        "client": matter.client_id, "matter": matter.pk,
+                        "notes": "", "wip_ids": wip_ids})
+                    raise _Rollback(response)
+            except _Rollback as exc:
+                return exc.args[0]
+
+        def invoice_pdf_uncached(c):
+            """Render from scratch (the cached copy is dropped first)."""
+            pdfs.invalidate(invoice_id)
+            return c.get(reverse("invoice-pdf", args=[invoice_id]))
+
+        partner_user, billing_user, fe_user = (
+            opts["partner_user"], opts["billing_user"], opts["fee_earner_user"])
+        scenarios = {
+            "index": (partner_user, lambda c: c.get(reverse("index"))),
+            "index (billing)": (billing_user, lambda c: c.get(reverse("index"))),
+            "record_time": (fe_user, lambda c: c.get(reverse("record-time"))),
+            "view_invoice": (billing_user, lambda c: c.get(reverse("view-invoice"))),
+            "view_invoice (page 50)": (billing_user, lambda c: c.get(
+                reverse("view-invoice"), {"cursor": deep_cursor or ""})),
+            "post_invoice_view": (partner_user, lambda c: c.get(reverse("post-invoice"))),
+            "invoice_pdf (cached)": (billing_user, lambda c: c.get(
+                reverse("invoice-pdf", args=[invoice_id]))),
+            "invoice_pdf (uncached)": (billing_user, invoice_pdf_uncached),
+        }
+        if matter is not None:
+            scenarios["create_invoice"] = (partner_user, lambda c: c.get(
+                reverse("create-invoice"),
+                {"client": matter.client_id, "matter": matter.pk}))
+            scenarios["create_invoice (POST)"] = (partner_user, create_invoice_post)
+            picker_filters = {"client": matter.client_id, "matter": matter.pk}
+            scenarios["wip_picker_api"] = (partner_user, lambda c: c.get(
+                reverse("wip-picker-api"), picker_filters))
+            scenarios["wip_picker_totals (all matching)"] = (partner_user, lambda c: c.post(
+                reverse("wip-picker-totals"),
+                {**picker_filters, "select_all": 1, "matching": 1}))
+        return scenarios
+
+    # --- Running ---
+
+    def _run(self, fn, client, iterations, warmup):
+        """Time fn(client); returns the result dict for one scenario."""
+        for _ in range(warmup):
+            self._consume(fn(client))
+        timings, queries, status = [], [], None
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                response = fn(client)
+                self._consume(response)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(len(ctx.captured_queries))
+            status = response.status_code
+        return {
+            "status": status,
+            "queries": max(queries),
+            "median_ms": round(statistics.median(timings), 2),
+            "p95_ms": round(_percentile(timings, 95), 2),
+            "min_ms": round(min(timings), 2),
+            "mean_ms": round(statistics.fmean(timings), 2),
+            "runs": iterations,
+        }
+
+    @staticmethod
+    def _consume(response):
+        """Read streaming bodies so their work is included in the timing."""
+        if getattr(response, "streaming", False):
+            for _chunk in response.streaming_content:
+                pass
+            response.close()
+
+    def handle(self, *args, **opts):
+        scenarios = self._scenarios(opts)
+        if opts["only"]:
+            unknown = set(opts["only"]) - set(scenarios)
+            if unknown:
+                raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+            scenarios = {k: v for k, v in scenarios.items() if k in opts["only"]}
+
+        clients = {}
+        results = {}
+        for name, (username, fn) in scenarios.items():
+            if username not in clients:
+                user = get_user_model().objects.filter(username=username).first()
+                if user is None:
+                    raise CommandError(f"No user {username!r}.")
+                clients[username] = TestClient()
+                clients[username].force_login(user)
+            results[name] = self._run(fn, clients[username],
+                                      opts["iterations"], opts["warmup"])
+            r = results[name]
+            self.stdout.write(f"{name:<26} {r['status']:>3}  {r['queries']:>4} q  "
+                              f"median {r['median_ms']:>9.2f} ms  p95 {r['p95_ms']:>9.2f} ms")
+
+        report = {
+            "meta": {
+                "commit": _git_commit(),
+                "timestamp": timezone.now().isoformat(),
+                "database": connection.vendor,
+                "python": platform.python_version(),
+                "iterations": opts["iterations"],
+                "rows": {
+                    "clients": Client.objects.count(),
+                    "matters": Matter.objects.count(),
+                    "personnel": Personnel.objects.count(),
+                    "time_entries": TimeEntry.objects.count(),
+                    "invoices": Invoice.objects.count(),
+                },
+            },
+            "results": results,
+        }
+        if opts["output"]:
+            with open(opts["output"], "w", encoding="utf-8") as fh:
+                json.dump(report, fh, indent=2)
+        if opts["compare"]:
+            self._compare(opts["compare"], results)
+        self.stdout.write(self.style.SUCCESS(
+            f"Done. Ran {len(results)} scenarios"
+            + (f"; results in {opts['output']}." if opts["output"] else ".")))
+
+    def _compare(self, path, results):
+        """Print median time and query-count changes against an earlier run."""
+        with open(path, encoding="utf-8") as fh:
+            before = json.load(fh)
+        self.stdout.write(f"\nCompared with {path} "
+                          f"(commit {before.get('meta', {}).get('commit')}):")
+        for name, now in results.items():
+            old = before.get("results", {}).get(name)
+            if not old:
+                self.stdout.write(f"{name:<26} (new)")
+                continue
+            change = ((now["median_ms"] - old["median_ms"]) / old["median_ms"] * 100
+                      if old["median_ms"] else 0.0)
+            line = (f"{name:<26} median {old['median_ms']:>9.2f} -> "
+                    f"{now['median_ms']:>9.2f} ms ({change:+.1f}%)  "
+                    f"queries {old['queries']} -> {now['queries']}")
+            slower = change > 10 or now["queries"] > old["queries"]
+            self.stdout.write(self.style.WARNING(line) if slower else line)
@@ -0,0 +1,128 @@
+# better_bill_project/middleware.py
+from __future__ import annotations
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+import json
+import logging
+import random
+import time
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import Template as DjangoTemplate
+
+metrics_log = logging.getLogger("better_bill_project.metrics")
+
+
+# --- Request metrics ---
+
+# Metrics for the request being handled, or None when it isn't sampled
+_current: ContextVar[RequestMetrics | None] = ContextVar(
+    "better_bill_request_metrics", default=None)
+
+
+class RequestMetrics:
+    """Counters collected for one sampled request."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_ms = 0.0
+        self.template_ms = 0.0
+        self.signatures = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute_wrapper: time the query and keep its SQL shape."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_ms += (time.perf_counter() - started) * 1000
+            self.queries += 1
+            self.signatures[sql] += 1
+
+    def duplicates(self, threshold):
+        """SQL run at least threshold times (likely N+1 loops), most first."""
+        return [(sql, n) for sql, n in self.signatures.most_common()
+                if n >= threshold]
+
+
+_template_render = DjangoTemplate.render
+
+
+def _timed_template_render(self, *args, **kwargs):
+    """Template.render that adds its wall time to the sampled request."""
+    metrics = _current.get()
+    if metrics is None:
+        return _template_render(self, *args, **kwargs)
+    started = time.perf_counter()
+    try:
+        return _template_render(self, *args, **kwargs)
+    finally:
+        metrics.template_ms += (time.perf_counter() - started) * 1000
+
+
+class RequestMetricsMiddleware:
+    """
+    For a sample of requests (REQUEST_METRICS_SAMPLE_RATE, 0..1) record SQL
+    query count and time, repeated query shapes, template and view time.
+    Results go to the "better_bill_project.metrics" logger as one JSON line
+    and, if REQUEST_METRICS_SERVER_TIMING is on, a Server-Timing header.
+    Unsampled requests only pay for one random() call.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.rate = float(getattr(settings, "REQUEST_METRICS_SAMPLE_RATE", 0.0))
+        self.dup_threshold = int(getattr(
+            settings, "REQUEST_METRICS_DUPLICATE_THRESHOLD", 3))
+        self.server_timing = bool(getattr(
+            settings, "REQUEST_METRICS_SERVER_TIMING", True))
+        if DjangoTemplate.render is not _timed_template_render:
+            DjangoTemplate.render = _timed_template_render
+
+    def __call__(self, request):
+        if self.rate <= 0 or random.random() >= self.rate:
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total_ms = (time.perf_counter() - started) * 1000
+        self._report(request, response, metrics, total_ms)
+        return response
+
+    def _report(self, request, response, metrics, total_ms):
+        """Emit the Server-Timing header and the structured log line."""
+        view_ms = max(total_ms - metrics.db_ms - metrics.template_ms, 0.0)
+        if self.server_timing:
+            response["Server-Timing"] = ", ".join([
+                f'db;dur={metrics.db_ms:.1f};desc="{metrics.queries} queries"',
+                f"tpl;dur={metrics.template_ms:.1f}",
+                f"view;dur={view_ms:.1f}",
+                f"total;dur={total_ms:.1f}",
+            ])
+
+        match = getattr(request, "resolver_match", None)
+        dups = metrics.duplicates(self.dup_threshold)
+        record = {
+            "method": request.method,
+            "path": request.path,
+            "view": match.view_name if match else None,
+            "status": response.status_code,
+            "queries": metrics.queries,
+            "db_ms": round(metrics.db_ms, 1),
+            "template_ms": round(metrics.template_ms, 1),
+            "view_ms": round(view_ms, 1),
+            "total_ms": round(total_ms, 1),
+            "duplicate_queries": [{"sql": sql[:200], "count": n}
+                                  for sql, n in dups[:5]],
+        }
+        level = logging.WARNING if dups else logging.INFO
+        metrics_log.log(level, json.dumps(record))
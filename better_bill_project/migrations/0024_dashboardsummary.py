@@ -0,0 +1,37 @@
+# Generated by Django 4.2.24 on 2026-10-17 12:15
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('better_bill_project', '0023_alter_personnel_line_manager'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('wip', 'WIP'), ('ledger', 'Ledger')], max_length=10)),
+                ('status', models.CharField(max_length=20)),
+                ('item_count', models.IntegerField(default=0)),
+                ('hours', models.DecimalField(decimal_places=1, default=Decimal('0.0'), max_digits=14)),
+                ('subtotal', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('tax', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('fee_earner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dashboard_summaries', to='better_bill_project.personnel')),
+            ],
+            options={
+                'ordering': ['fee_earner', 'kind', 'status'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dashboardsummary',
+            constraint=models.UniqueConstraint(fields=('fee_earner', 'kind', 'status'), name='uniq_dashboard_summary_key'),
+        ),
+    ]
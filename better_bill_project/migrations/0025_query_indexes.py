@@ -0,0 +1,53 @@
+# Generated by Django 4.2.24 on 2026-10-17 12:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('better_bill_project', '0024_dashboardsummary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['-created_at', 'id'], name='inv_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['invoice_date'], name='inv_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['client', '-created_at'], name='inv_client_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ledger',
+            index=models.Index(fields=['status', 'invoice'], name='ledger_status_inv_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='matter',
+            index=models.Index(condition=models.Q(('closed_at__isnull', True)), fields=['client', 'matter_number'], name='matter_open_client_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='matter',
+            index=models.Index(condition=models.Q(('closed_at__isnull', True)), fields=['lead_fee_earner', 'client'], name='matter_open_lead_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timeentry',
+            index=models.Index(fields=['fee_earner', '-created_at'], name='te_fe_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wip',
+            index=models.Index(fields=['status', 'fee_earner', '-created_at'], name='wip_status_fe_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wip',
+            index=models.Index(condition=models.Q(('status', 'unbilled')), fields=['fee_earner', '-created_at'], name='wip_unbilled_fe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wip',
+            index=models.Index(condition=models.Q(('status', 'unbilled')), fields=['matter', 'created_at'], name='wip_unbilled_matter_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.24 on 2026-10-17 12:18
+
+from django.db import migrations, models
+
+SEQUENCE_NAME = "invoice_number"
+PG_SEQUENCE = "better_bill_invoice_number_seq"
+
+
+def seed_sequence(apps, schema_editor):
+    """Start numbering after the highest existing numeric invoice number."""
+    Invoice = apps.get_model("better_bill_project", "Invoice")
+    Sequence = apps.get_model("better_bill_project", "InvoiceNumberSequence")
+    last = 0
+    for number in Invoice.objects.values_list("number", flat=True).iterator():
+        digits = "".join(ch for ch in number if ch.isdigit())
+        if digits:
+            last = max(last, int(digits))
+    Sequence.objects.update_or_create(
+        name=SEQUENCE_NAME, defaults={"last_value": last})
+
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(f"CREATE SEQUENCE IF NOT EXISTS {PG_SEQUENCE}")
+        schema_editor.execute(
+            "SELECT setval(%s, %s, false)", [PG_SEQUENCE, last + 1])
+
+
+def drop_sequence(apps, schema_editor):
+    """Remove the native sequence on Postgres."""
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(f"DROP SEQUENCE IF EXISTS {PG_SEQUENCE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('better_bill_project', '0025_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceNumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_sequence, reverse_code=drop_sequence),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.24 on 2026-10-17 12:22
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_totals(apps, schema_editor):
+    """Store each invoice's totals, computed exactly as the old properties did."""
+    Invoice = apps.get_model("better_bill_project", "Invoice")
+    InvoiceLine = apps.get_model("better_bill_project", "InvoiceLine")
+    cent = Decimal("0.01")
+
+    sums = dict(InvoiceLine.objects.values("invoice_id")
+                .annotate(s=Sum("amount")).values_list("invoice_id", "s"))
+    batch = []
+    for inv in Invoice.objects.only("id", "tax_rate").iterator(chunk_size=2000):
+        inv.subtotal = Decimal(sums.get(inv.id) or 0).quantize(cent)
+        inv.tax_amount = (inv.subtotal * (inv.tax_rate / Decimal("100"))).quantize(cent)
+        inv.total = (inv.subtotal + inv.tax_amount).quantize(cent)
+        batch.append(inv)
+        if len(batch) >= 1000:
+            Invoice.objects.bulk_update(batch, ["subtotal", "tax_amount", "total"])
+            batch = []
+    if batch:
+        Invoice.objects.bulk_update(batch, ["subtotal", "tax_amount", "total"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('better_bill_project', '0026_invoicenumbersequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='tax_amount',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+        migrations.RunPython(backfill_totals, reverse_code=migrations.RunPython.noop),
+    ]
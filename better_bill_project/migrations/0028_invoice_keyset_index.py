@@ -0,0 +1,29 @@
+# Generated by Django 4.2.24 on 2026-10-17 12:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('better_bill_project', '0027_invoice_totals'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='invoice',
+            name='inv_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='invoice',
+            name='inv_client_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['-created_at', '-id'], name='inv_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['client', '-created_at', '-id'], name='inv_client_created_idx'),
+        ),
+    ]
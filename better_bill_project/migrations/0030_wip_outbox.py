@@ -0,0 +1,30 @@
+# Generated by Django 4.2.24 on 2026-10-17 12:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('better_bill_project', '0029_invoice_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WipOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('time_entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='wip_outbox', to='better_bill_project.timeentry')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['available_at', 'id'], name='wip_outbox_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.24 on 2026-10-17 12:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_closure(apps, schema_editor):
+    """Fill the closure table from the existing line_manager links."""
+    Personnel = apps.get_model("better_bill_project", "Personnel")
+    PersonnelClosure = apps.get_model("better_bill_project", "PersonnelClosure")
+    parents = dict(Personnel.objects.values_list("id", "line_manager_id"))
+    rows = []
+    for person_id in parents:
+        rows.append(PersonnelClosure(ancestor_id=person_id,
+                                     descendant_id=person_id, depth=0))
+        seen, depth, node = {person_id}, 0, parents.get(person_id)
+        while node is not None and node not in seen:
+            depth += 1
+            rows.append(PersonnelClosure(ancestor_id=node,
+                                         descendant_id=person_id, depth=depth))
+            seen.add(node)
+            node = parents.get(node)
+    PersonnelClosure.objects.bulk_create(rows, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('better_bill_project', '0030_wip_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersonnelClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='better_bill_project.personnel')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='better_bill_project.personnel')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='personnel_closure_desc_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='personnelclosure',
+            constraint=models.UniqueConstraint(fields=('ancestor', 'descendant'), name='uniq_personnel_closure'),
+        ),
+        migrations.RunPython(build_closure, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+# (index name, table, column) for the type-ahead search (search.py)
+TRIGRAM_INDEXES = [
+    ("client_number_trgm_idx", "better_bill_project_client", "client_number"),
+    ("client_name_trgm_idx", "better_bill_project_client", "name"),
+    ("matter_number_trgm_idx", "better_bill_project_matter", "matter_number"),
+    ("matter_desc_trgm_idx", "better_bill_project_matter", "description"),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """pg_trgm GIN indexes on UPPER(col), as used by icontains/istartswith."""
+    if schema_editor.connection.vendor != "postgresql":
+        return  # other databases search an in-process prefix index
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" '
+            f'USING gin ((UPPER("{column}"::text)) gin_trgm_ops)')
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    """Drop the indexes (the extension is left installed)."""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, _table, _column in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('better_bill_project', '0031_personnel_closure'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def install(apps, schema_editor):
+    """tsvector column + GIN index (Postgres) or FTS5 table + triggers (SQLite)."""
+    from better_bill_project import fulltext
+    fulltext.install(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    """Drop the full-text structures."""
+    from better_bill_project import fulltext
+    fulltext.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('better_bill_project', '0032_search_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -5,6 +5,7 @@ from django.db import models
 from django.core.validators import MinValueValidator
 from django.core.exceptions import ValidationError
 from django.conf import settings
+from django.utils import timezone
 import traceback
 import logging
 log = logging.getLogger(__name__)
@@ -105,6 +106,13 @@ class Personnel(models.Model):
                     "line_manager": f"Line manager must be one of: {
                         ', '.join(ALLOWED_MANAGER_ROLES)}."
                 })
+            if self.pk and (self.line_manager_id == self.pk or
+                            PersonnelClosure.objects.filter(
+                                ancestor_id=self.pk,
+                                descendant_id=self.line_manager_id).exists()):
+                raise ValidationError({
+                    "line_manager": "Line manager cannot report to this person."
+                })
 
     def save(self, *args, **kwargs):
         """Ensure clean() is called on save."""
@@ -160,6 +168,32 @@ class Personnel(models.Model):
         return self.delegates.exclude(
             user__isnull=True).values_list("user_id", flat=True)
 
+# --- Reporting-line closure ---
+class PersonnelClosure(models.Model):
+    """
+    One row per (manager at any level, report) pair over line_manager, plus
+    a depth-0 row per person; maintained by teams.py.
+    """
+    ancestor   = models.ForeignKey("Personnel", on_delete=models.CASCADE,
+                                   related_name="descendant_links")
+    descendant = models.ForeignKey("Personnel", on_delete=models.CASCADE,
+                                   related_name="ancestor_links")
+    depth      = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["ancestor", "descendant"],
+                                    name="uniq_personnel_closure"),
+        ]
+        indexes = [
+            models.Index(fields=["descendant", "depth"],
+                         name="personnel_closure_desc_idx"),
+        ]
+
+    def __str__(self):
+        """String representation of PersonnelClosure."""
+        return f"{self.ancestor_id} > {self.descendant_id} ({self.depth})"
+
  # --- Matter lookup ---
 
 class Matter(models.Model):
@@ -176,6 +210,16 @@ class Matter(models.Model):
 
     class Meta:
         ordering = ["matter_number"]
+        indexes = [
+            # Open-matter dropdowns: filter(client_id=..., closed_at IS NULL)
+            models.Index(fields=["client", "matter_number"],
+                         condition=Q(closed_at__isnull=True),
+                         name="matter_open_client_idx"),
+            # Invoice form: open matters led by me, per client
+            models.Index(fields=["lead_fee_earner", "client"],
+                         condition=Q(closed_at__isnull=True),
+                         name="matter_open_lead_idx"),
+        ]
 
     def __str__(self):
         """String representation of Matter."""
@@ -216,6 +260,11 @@ class TimeEntry(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Recent entries per fee earner (record_time)
+            models.Index(fields=["fee_earner", "-created_at"],
+                         name="te_fe_created_idx"),
+        ]
 
     def clean(self):
         """Validate that matter belongs to client."""
@@ -270,6 +319,18 @@ class WIP(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Dashboard: filter(status=..., fee_earner_id__in=...) ORDER BY -created_at
+            models.Index(fields=["status", "fee_earner", "-created_at"],
+                         name="wip_status_fe_created_idx"),
+            # Hot subset: only unbilled rows are ever listed for billing
+            models.Index(fields=["fee_earner", "-created_at"],
+                         condition=Q(status="unbilled"),
+                         name="wip_unbilled_fe_idx"),
+            models.Index(fields=["matter", "created_at"],
+                         condition=Q(status="unbilled"),
+                         name="wip_unbilled_matter_idx"),
+        ]
 
 
     def clean(self):
@@ -320,6 +381,29 @@ class WIP(models.Model):
             self.hours_worked}h ({
             self.status})"
 
+# --- TimeEntry -> WIP outbox ---
+class WipOutbox(models.Model):
+    """
+    Pending WIP create/sync for a TimeEntry, written in the same transaction
+    as the entry and applied by the process_wip_outbox worker (outbox.py).
+    """
+    time_entry   = models.ForeignKey("TimeEntry", on_delete=models.CASCADE,
+                                     related_name="wip_outbox")
+    created_at   = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts     = models.PositiveIntegerField(default=0)
+    last_error   = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["available_at", "id"], name="wip_outbox_due_idx"),
+        ]
+
+    def __str__(self):
+        """String representation of WipOutbox."""
+        return f"WIP outbox #{self.pk} for TE id={self.time_entry_id}"
+
 # --- Invoices and Ledger ---
 
 class Invoice(models.Model):
@@ -333,26 +417,57 @@ class Invoice(models.Model):
     tax_rate     = models.DecimalField(max_digits=5, decimal_places=2,
                                        default=Decimal("0.00"),
                                        validators=[MinValueValidator(0)])
+    # Stored totals (kept in step with lines by recalculate_totals())
+    subtotal     = models.DecimalField(max_digits=12, decimal_places=2,
+                                       default=Decimal("0.00"))
+    tax_amount   = models.DecimalField(max_digits=12, decimal_places=2,
+                                       default=Decimal("0.00"))
+    total        = models.DecimalField(max_digits=12, decimal_places=2,
+                                       default=Decimal("0.00"))
     created_at   = models.DateTimeField(auto_now_add=True)
+    updated_at   = models.DateTimeField(auto_now=True)  # part of the PDF cache key
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Invoice lists are always newest first
+            # (created_at, id) is also the keyset pagination key
+            models.Index(fields=["-created_at", "-id"], name="inv_created_idx"),
+            models.Index(fields=["invoice_date"], name="inv_date_idx"),
+            models.Index(fields=["client", "-created_at", "-id"],
+                         name="inv_client_created_idx"),
+        ]
 
     def __str__(self):
         return f"INV {self.number} — {self.client.name}"
 
-    @property
-    def subtotal(self):
-        return sum((li.amount for li in self.lines.all()), Decimal("0.00"))
-
-    @property
-    def tax_amount(self):
-        return (
+    def set_totals(self, subtotal):
+        """Set subtotal, tax_amount and total from a line subtotal."""
+        self.subtotal = Decimal(subtotal).quantize(Decimal("0.01"))
+        self.tax_amount = (
             self.subtotal * (self.tax_rate / Decimal("100"))).quantize(Decimal("0.01"))
+        self.total = (self.subtotal + self.tax_amount).quantize(Decimal("0.01"))
+
+    def recalculate_totals(self, save=True):
+        """Recompute stored totals from the invoice lines (one aggregate query)."""
+        agg = self.lines.aggregate(s=models.Sum("amount"))
+        self.set_totals(agg["s"] or Decimal("0.00"))
+        if save:
+            self.save(update_fields=["subtotal", "tax_amount", "total",
+                                     "updated_at"])
 
-    @property
-    def total(self):
-        return (self.subtotal + self.tax_amount).quantize(Decimal("0.01"))
+
+class InvoiceNumberSequence(models.Model):
+    """
+    Counter row for invoice numbers (SQLite/other backends).
+    On Postgres a native SEQUENCE is used instead; see numbering.py.
+    """
+    name       = models.CharField(max_length=50, unique=True)
+    last_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        """String representation of InvoiceNumberSequence."""
+        return f"{self.name} @ {self.last_value}"
 
 
 class InvoiceLine(models.Model):
@@ -396,6 +511,10 @@ class Ledger(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Invoice lists filter on ledger__status and join back via invoice_id
+            models.Index(fields=["status", "invoice"], name="ledger_status_inv_idx"),
+        ]
 
     permissions = [
             ("post_invoice", "Can post invoices"),   # <- custom
@@ -404,3 +523,42 @@ class Ledger(models.Model):
     def __str__(self):
         """String representation of Ledger."""
         return f"Ledger for {self.invoice.number} — {self.total}"
+
+
+# --- Dashboard summary (pre-aggregated WIP / Ledger totals) ---
+
+class DashboardSummary(models.Model):
+    """
+    Running totals per fee earner, kind and status, maintained
+    incrementally by summaries.py so the dashboard never scans WIP/Ledger.
+    """
+    KIND_WIP = "wip"
+    KIND_LEDGER = "ledger"
+    KIND_CHOICES = [(KIND_WIP, "WIP"), (KIND_LEDGER, "Ledger")]
+
+    fee_earner = models.ForeignKey("Personnel", on_delete=models.CASCADE,
+                                   related_name="dashboard_summaries")
+    kind       = models.CharField(max_length=10, choices=KIND_CHOICES)
+    status     = models.CharField(max_length=20)
+    item_count = models.IntegerField(default=0)
+    hours      = models.DecimalField(max_digits=14, decimal_places=1,
+                                     default=Decimal("0.0"))
+    subtotal   = models.DecimalField(max_digits=14, decimal_places=2,
+                                     default=Decimal("0.00"))
+    tax        = models.DecimalField(max_digits=14, decimal_places=2,
+                                     default=Decimal("0.00"))
+    total      = models.DecimalField(max_digits=14, decimal_places=2,
+                                     default=Decimal("0.00"))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["fee_earner", "kind", "status"]
+        constraints = [
+            models.UniqueConstraint(fields=["fee_earner", "kind", "status"],
+                                    name="uniq_dashboard_summary_key"),
+        ]
+
+    def __str__(self):
+        """String representation of DashboardSummary."""
+        return f"{self.kind}/{self.status} for {self.fee_earner_id}: {
+            self.item_count} items, {self.hours}h, {self.total}"
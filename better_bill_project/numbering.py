@@ -0,0 +1,98 @@
+"""
+Invoice number allocation.
+
+Numbers come from a Postgres SEQUENCE (nextval never blocks and never
+hands out the same value twice) or, on other backends, from a counter row
+bumped with a single UPDATE. Each worker may reserve a block of numbers
+at once (settings.INVOICE_NUMBER_BLOCK_SIZE, default 1); unused numbers in
+a block are lost when the process exits. Numbering is not gapless at any
+block size: a sequence value taken by a transaction that rolls back is
+never returned, so callers reserve a number only once the invoice is
+certain to be written.
+"""
+from __future__ import annotations
+from collections import deque
+import os
+import threading
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from .models import InvoiceNumberSequence
+
+SEQUENCE_NAME = "invoice_number"
+PG_SEQUENCE = "better_bill_invoice_number_seq"
+NUMBER_WIDTH = 6
+
+
+def format_invoice_number(n: int) -> str:
+    """Render a sequence value as a zero-padded invoice number."""
+    return f"{n:0{NUMBER_WIDTH}d}"
+
+
+def _reserve_postgres(count: int) -> list[int]:
+    """Take count values from the native sequence in one round trip."""
+    with connection.cursor() as cur:
+        cur.execute(
+            "SELECT nextval(%s) FROM generate_series(1, %s)",
+            [PG_SEQUENCE, count])
+        return [row[0] for row in cur.fetchall()]
+
+
+def _reserve_table(count: int) -> list[int]:
+    """Bump the counter row by count and return the reserved range."""
+    with transaction.atomic():
+        updated = InvoiceNumberSequence.objects.filter(
+            name=SEQUENCE_NAME).update(last_value=F("last_value") + count)
+        if not updated:
+            InvoiceNumberSequence.objects.get_or_create(name=SEQUENCE_NAME)
+            InvoiceNumberSequence.objects.filter(
+                name=SEQUENCE_NAME).update(last_value=F("last_value") + count)
+        last = InvoiceNumberSequence.objects.values_list(
+            "last_value", flat=True).get(name=SEQUENCE_NAME)
+    return list(range(last - count + 1, last + 1))
+
+
+def reserve_numbers(count: int = 1) -> list[int]:
+    """Atomically reserve count invoice sequence values."""
+    if connection.vendor == "postgresql":
+        return _reserve_postgres(count)
+    return _reserve_table(count)
+
+
+class InvoiceNumberAllocator:
+    """Hands out invoice numbers from a per-process pre-allocated block."""
+
+    def __init__(self, block_size: int | None = None):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._pool: deque[int] = deque()
+        self._pid = os.getpid()
+
+    def _block_size(self) -> int:
+        """Configured block size (at least 1)."""
+        size = self.block_size or getattr(settings, "INVOICE_NUMBER_BLOCK_SIZE", 1)
+        return max(int(size), 1)
+
+    def next_number(self) -> str:
+        """Return the next invoice number, refilling the block when empty."""
+        with self._lock:
+            # Forked workers must not share a parent's block
+            if self._pid != os.getpid():
+                self._pool.clear()
+                self._pid = os.getpid()
+            if self._pool:
+                return format_invoice_number(self._pool.popleft())
+            # A counter-row bump inside an open transaction is undone if that
+            # transaction rolls back, so never cache spare numbers from it.
+            if connection.vendor != "postgresql" and connection.in_atomic_block:
+                return format_invoice_number(reserve_numbers(1)[0])
+            self._pool.extend(reserve_numbers(self._block_size()))
+            return format_invoice_number(self._pool.popleft())
+
+
+_allocator = InvoiceNumberAllocator()
+
+
+def next_invoice_number() -> str:
+    """Allocate the next invoice number. Call only when saving an invoice."""
+    return _allocator.next_number()
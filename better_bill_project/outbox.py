@@ -0,0 +1,145 @@
+"""
+Transactional outbox for TimeEntry -> WIP.
+
+Saving a TimeEntry only inserts a WipOutbox row, in the same transaction,
+so the entry and its pending WIP work commit (or roll back) together and
+the request does no WIP queries. The process_wip_outbox worker claims due
+rows in batches (SKIP LOCKED on Postgres, so several workers can run),
+applies them set-wise through reconcile.create_missing_wip/sync_wip and
+deletes them. A failing batch is retried row by row; rows that still fail
+are pushed back with exponential backoff and their error recorded.
+"""
+from __future__ import annotations
+from datetime import timedelta
+import logging
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from . import reconcile
+from .models import WipOutbox
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 3600
+
+
+def enqueue(time_entry_id):
+    """Queue a WIP create/sync for a TimeEntry (call inside its transaction)."""
+    WipOutbox.objects.create(time_entry_id=time_entry_id)
+    if getattr(settings, "WIP_OUTBOX_INLINE", False):
+        transaction.on_commit(lambda: process_time_entry(time_entry_id))
+
+
+def is_pending(time_entry_id):
+    """Whether a WIP create/sync for this TimeEntry is still queued."""
+    return WipOutbox.objects.filter(time_entry_id=time_entry_id).exists()
+
+
+def _apply(time_entry_ids):
+    """Create missing WIP and sync unbilled WIP for these time entries."""
+    reconcile.create_missing_wip(time_entry_ids=time_entry_ids)
+    reconcile.sync_wip(time_entry_ids=time_entry_ids)
+
+
+def _backoff(attempts):
+    """Delay before retry number attempts."""
+    return timedelta(seconds=min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1),
+                                 BACKOFF_MAX_SECONDS))
+
+
+def _claim(qs, limit=None):
+    """Lock and return due outbox rows, skipping rows other workers hold."""
+    if connection.features.has_select_for_update_skip_locked:
+        qs = qs.select_for_update(skip_locked=True)
+    qs = qs.order_by("id")
+    return list(qs[:limit] if limit else qs)
+
+
+def _process(events):
+    """Apply claimed events; delete the done ones, reschedule failures."""
+    te_ids = sorted({e.time_entry_id for e in events})
+    errors = {}
+    try:
+        with transaction.atomic():
+            _apply(te_ids)
+    except Exception:
+        log.warning("WIP outbox batch of %s failed; retrying one by one",
+                    len(te_ids), exc_info=True)
+        for te_id in te_ids:
+            try:
+                with transaction.atomic():
+                    _apply([te_id])
+            except Exception as exc:
+                errors[te_id] = f"{type(exc).__name__}: {exc}"
+
+    done = [e.pk for e in events if e.time_entry_id not in errors]
+    WipOutbox.objects.filter(pk__in=done).delete()
+
+    failed = [e for e in events if e.time_entry_id in errors]
+    now = timezone.now()
+    for e in failed:
+        e.attempts += 1
+        e.available_at = now + _backoff(e.attempts)
+        e.last_error = errors[e.time_entry_id][:2000]
+        log.error("WIP outbox #%s for TE id=%s failed (attempt %s): %s",
+                  e.pk, e.time_entry_id, e.attempts, e.last_error)
+    if failed:
+        WipOutbox.objects.bulk_update(
+            failed, ["attempts", "available_at", "last_error"])
+    return len(done), len(failed)
+
+
+def apply_pending(time_entry_ids):
+    """
+    Apply the queued events for these time entries (ids or a values()
+    subquery) now, in the caller's transaction, so billing never prices
+    WIP an edit has not reached yet. Rows another worker holds are left
+    to it; failures are rescheduled as usual.
+    """
+    events = _claim(WipOutbox.objects.filter(time_entry_id__in=time_entry_ids))
+    if events:
+        _process(events)
+
+
+def drain_once(batch_size=DEFAULT_BATCH_SIZE):
+    """Process one batch of due events. Returns {"processed", "failed"}."""
+    with transaction.atomic():
+        events = _claim(WipOutbox.objects.filter(available_at__lte=timezone.now()),
+                        batch_size)
+        if not events:
+            return {"processed": 0, "failed": 0}
+        processed, failed = _process(events)
+    return {"processed": processed, "failed": failed}
+
+
+def process_time_entry(time_entry_id):
+    """Apply pending events for one TimeEntry now (WIP_OUTBOX_INLINE mode)."""
+    try:
+        with transaction.atomic():
+            events = _claim(WipOutbox.objects.filter(time_entry_id=time_entry_id))
+            if events:
+                _process(events)
+    except Exception:
+        # The rows stay queued for the worker
+        log.exception("Inline WIP outbox processing failed for TE id=%s",
+                      time_entry_id)
+
+
+def lag():
+    """
+    Outbox backlog: pending/due/failing row counts and the age in seconds
+    of the oldest pending row (0 when empty).
+    """
+    now = timezone.now()
+    stats = WipOutbox.objects.aggregate(
+        pending=Count("id"),
+        due=Count("id", filter=Q(available_at__lte=now)),
+        failing=Count("id", filter=Q(attempts__gt=0)),
+        oldest=Min("created_at"),
+    )
+    oldest = stats.pop("oldest")
+    stats["oldest_age_seconds"] = round((now - oldest).total_seconds(), 1) if oldest else 0
+    return stats
@@ -0,0 +1,126 @@
+"""
+Keyset (cursor) pagination for newest-first lists.
+
+Pages are fetched with WHERE (created_at, id) < (last seen) ... LIMIT n+1
+instead of OFFSET, so any page costs the same as the first one on the
+(-created_at, -id) index. Cursors are signed, opaque tokens; a missing or
+tampered cursor simply means "first page". Totals come from
+approximate_count(), which never runs a COUNT(*) per page view.
+"""
+from __future__ import annotations
+import hashlib
+import json
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+CURSOR_SALT = "better_bill.keyset"
+
+
+def encode_cursor(created_at, pk, direction):
+    """Return an opaque token for a position and direction ("next"/"prev")."""
+    return signing.dumps([created_at.isoformat(), pk, direction],
+                         salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token):
+    """Return (created_at, pk, direction), or None for a missing/bad token."""
+    if not token:
+        return None
+    try:
+        ts, pk, direction = signing.loads(token, salt=CURSOR_SALT)
+        created_at = parse_datetime(ts)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    if created_at is None or direction not in ("next", "prev"):
+        return None
+    return created_at, int(pk), direction
+
+
+class KeysetPage:
+    """One page of results plus the cursors to move either way."""
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def keyset_page(qs, cursor=None, per_page=25):
+    """
+    Return a KeysetPage of qs ordered newest first by (created_at, id).
+    cursor is a token from a previous page (or None for the first page).
+    """
+    pos = decode_cursor(cursor)
+    if pos is None:
+        rows = list(qs.order_by("-created_at", "-id")[:per_page + 1])
+        more_after, more_before = len(rows) > per_page, False
+        rows = rows[:per_page]
+    else:
+        ts, pk, direction = pos
+        if direction == "next":
+            rows = list(qs.filter(
+                Q(created_at__lt=ts) | Q(created_at=ts, id__lt=pk),
+                created_at__lte=ts,
+            ).order_by("-created_at", "-id")[:per_page + 1])
+            more_after, more_before = len(rows) > per_page, True
+            rows = rows[:per_page]
+        else:
+            rows = list(qs.filter(
+                Q(created_at__gt=ts) | Q(created_at=ts, id__gt=pk),
+                created_at__gte=ts,
+            ).order_by("created_at", "id")[:per_page + 1])
+            more_after, more_before = True, len(rows) > per_page
+            rows = rows[:per_page][::-1]
+
+    next_cursor = prev_cursor = None
+    if rows and more_after:
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].pk, "next")
+    if rows and more_before:
+        prev_cursor = encode_cursor(rows[0].created_at, rows[0].pk, "prev")
+    return KeysetPage(rows, next_cursor, prev_cursor)
+
+
+def _estimated_rows(model):
+    """Planner row estimate for a whole table (Postgres), or None."""
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cur:
+        cur.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [model._meta.db_table])
+        row = cur.fetchone()
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+
+def approximate_count(qs, key_parts):
+    """
+    Cheap total for a list: the planner estimate for an unfiltered table on
+    Postgres, otherwise an exact COUNT(*) cached for LIST_COUNT_CACHE_TIMEOUT
+    seconds under key_parts (e.g. the filter values).
+    """
+    if not qs.query.where:
+        estimate = _estimated_rows(qs.model)
+        if estimate:
+            return estimate
+    digest = hashlib.sha1(json.dumps(key_parts, sort_keys=True, default=str)
+                          .encode()).hexdigest()
+    key = f"better_bill:count:{qs.model._meta.label_lower}:{digest}"
+    return cache.get_or_set(key, qs.count,
+                            getattr(settings, "LIST_COUNT_CACHE_TIMEOUT", 60))
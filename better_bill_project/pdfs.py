@@ -0,0 +1,237 @@
+"""
+Invoice PDF rendering and cache.
+
+PDFs are rendered in a small process pool, so a gunicorn worker never
+loads the invoice for the PDF, builds its HTML or runs pisa itself; pool
+tasks take only the invoice id and key. Files are kept on disk under
+settings.PDF_CACHE_DIR as "<invoice id>-<key>.pdf". The key hashes the
+invoice id, its ledger status and Invoice.updated_at, so a stale PDF is
+never served; post/settle/unsettle/delete also drop an invoice's files
+(and re-render in the background) via refresh()/invalidate(). A request
+for a PDF that is not ready waits only briefly (PDF_RENDER_WAIT) and
+then gets 202 and polls.
+The key doubles as the HTTP ETag.
+"""
+from __future__ import annotations
+from concurrent.futures import Future, ProcessPoolExecutor
+import hashlib
+from io import BytesIO
+import logging
+import os
+from pathlib import Path
+import tempfile
+import threading
+from urllib.parse import urlparse
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.db import close_old_connections, connections
+from django.template.loader import render_to_string
+from xhtml2pdf import pisa
+from .models import Invoice
+
+log = logging.getLogger(__name__)
+
+
+# --- Keys and storage ---
+
+def pdf_key(invoice_id, status, updated_at) -> str:
+    """Content key for one rendering of an invoice."""
+    raw = f"{invoice_id}:{status}:{updated_at.isoformat() if updated_at else ''}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def invoice_pdf_key(pk):
+    """Current key for invoice pk (one small query), or None if it doesn't exist."""
+    row = (Invoice.objects.filter(pk=pk)
+           .values_list("updated_at", "ledger__status").first())
+    if row is None:
+        return None
+    updated_at, status = row
+    return pdf_key(pk, status or "draft", updated_at)
+
+
+def _cache_dir() -> Path:
+    """Directory holding rendered PDFs (created on demand)."""
+    path = Path(getattr(settings, "PDF_CACHE_DIR", None)
+                or Path(tempfile.gettempdir()) / "better_bill_pdf")
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def cache_path(pk, key) -> Path:
+    """Where the PDF for (pk, key) lives."""
+    return _cache_dir() / f"{pk}-{key}.pdf"
+
+
+def cached_pdf(pk, key):
+    """Path of an already rendered PDF, or None."""
+    path = cache_path(pk, key)
+    return path if path.exists() else None
+
+
+def invalidate(pk):
+    """Delete every cached rendering of invoice pk."""
+    for path in _cache_dir().glob(f"{pk}-*.pdf"):
+        path.unlink(missing_ok=True)
+
+
+# --- Rendering ---
+
+def link_callback(uri, rel):
+    """
+    Resolve static/media URIs for xhtml2pdf.
+    Supports:
+      - /static/... (Django staticfiles)
+      - /media/...  (user uploads)
+      - absolute http(s) URLs (leave as-is; xhtml2pdf can fetch some)
+    """
+    parsed = urlparse(uri)
+    if parsed.scheme in ("http", "https"):
+        return uri  # allow remote if needed (or block if you prefer)
+    if uri.startswith(settings.STATIC_URL):
+        path = uri.replace(settings.STATIC_URL, "", 1)
+        abs_path = finders.find(path)  # in collected static or app dirs
+        if abs_path:
+            return abs_path
+    if uri.startswith(settings.MEDIA_URL):
+        path = uri.replace(settings.MEDIA_URL, "", 1)
+        return os.path.join(settings.MEDIA_ROOT, path)
+    return uri
+
+
+PDF_SELECT_RELATED = ("client", "matter", "ledger")
+PDF_PREFETCH_RELATED = ("lines", "lines__wip",
+                        "lines__wip__fee_earner", "lines__wip__activity_code")
+
+
+def pdf_queryset():
+    """Invoices with everything the PDF template reads, loaded up front."""
+    return (Invoice.objects
+            .select_related(*PDF_SELECT_RELATED)
+            .prefetch_related(*PDF_PREFETCH_RELATED))
+
+
+def invoice_key(inv) -> str:
+    """Cache key for a loaded invoice (ledger selected), without a query."""
+    ledger = getattr(inv, "ledger", None)
+    return pdf_key(inv.pk, ledger.status if ledger else "draft", inv.updated_at)
+
+
+def invoice_html(inv):
+    """Render the PDF template for a loaded invoice (see pdf_queryset())."""
+    ledger = getattr(inv, "ledger", None)
+    return render_to_string("better_bill_project/invoice_pdf.html", {
+        "inv": inv,
+        "subtotal": ledger.subtotal if ledger else inv.subtotal,
+        "tax":      ledger.tax      if ledger else inv.tax_amount,
+        "total":    ledger.total    if ledger else inv.total,
+        "status":   ledger.status   if ledger else "draft",
+    })
+
+
+def write_pdf(html, path) -> bool:
+    """Convert HTML to a PDF file at path (atomically). Runs in the pool."""
+    pdf_io = BytesIO()
+    result = pisa.CreatePDF(src=html, dest=pdf_io, encoding="utf-8",
+                            link_callback=link_callback)
+    if result.err:
+        return False
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".part")
+    with os.fdopen(fd, "wb") as fh:
+        fh.write(pdf_io.getvalue())
+    os.replace(tmp, path)
+    return True
+
+
+def render_pdf(pk, key=None) -> bool:
+    """
+    Pool task: load invoice pk, build its HTML and write its PDF. key=None
+    renders the current version; a key that is no longer current (the
+    invoice changed or went away meanwhile) renders nothing.
+    """
+    close_old_connections()
+    inv = pdf_queryset().filter(pk=pk).first()
+    if inv is None or (key is not None and invoice_key(inv) != key):
+        return False
+    return write_pdf(invoice_html(inv), cache_path(pk, invoice_key(inv)))
+
+
+def init_worker():
+    """
+    Pool initializer: make sure Django is configured in spawned workers,
+    and let forked ones open their own database connections rather than
+    use (or close) the web worker's.
+    """
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+    for conn in connections.all(initialized_only=True):
+        conn.connection = None
+
+
+# Re-entrant: a future that is already done runs _forget() inside render()
+_lock = threading.RLock()
+_pool = None
+_pool_pid = None
+_pending: dict[str, Future] = {}
+
+
+def _executor():
+    """The shared process pool, or None when PDF_RENDER_WORKERS is 0."""
+    global _pool, _pool_pid
+    workers = int(getattr(settings, "PDF_RENDER_WORKERS", 2))
+    if workers <= 0:
+        return None
+    # A forked web worker must not reuse its parent's pool
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker)
+        _pool_pid = os.getpid()
+        _pending.clear()
+    return _pool
+
+
+def _forget(key, future):
+    """Done callback: stop sharing a finished render (unless replaced already)."""
+    with _lock:
+        if _pending.get(key) is future:
+            del _pending[key]
+
+
+def render(pk, key) -> Future:
+    """
+    Start rendering version key of invoice pk to its cache file and return
+    a Future that resolves to True on success. Concurrent requests for the
+    same key share one render; with no pool configured the render runs
+    inline.
+    """
+    with _lock:
+        pool = _executor()
+        if pool is None:
+            done = Future()
+            done.set_result(render_pdf(pk, key))
+            return done
+        future = _pending.get(key)
+        if future is None:
+            future = pool.submit(render_pdf, pk, key)
+            _pending[key] = future
+            future.add_done_callback(lambda f: _forget(key, f))
+        return future
+
+
+def refresh(pk):
+    """
+    Drop cached PDFs for invoice pk and queue a render of its current
+    version. Does no queries itself; without a pool the next download
+    renders instead.
+    """
+    invalidate(pk)
+    with _lock:
+        pool = _executor()
+    if pool is None:
+        return
+    try:
+        pool.submit(render_pdf, pk)
+    except Exception:
+        log.exception("Background PDF render failed for invoice id=%s", pk)
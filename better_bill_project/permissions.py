@@ -1,3 +1,8 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+from .models import Personnel
+
 # --- Role aliases (case-insensitive) ---
 ROLE_BILLING = {"billing administrator"}
 ROLE_PARTNER = {"partner"}
@@ -6,10 +11,11 @@ ROLE_ASSOC_PARTNER = {"associate partner"}
 class Scope:
     def __init__(self, p):
         self.p = p
+        self._rn = (getattr(getattr(
+            p, "role", None), "role", "") or "").strip().lower()
 
     def _role_name(self) -> str:
-        return (getattr(getattr(
-            self.p, "role", None), "role", "") or "").strip().lower()
+        return self._rn
 
     def is_admin(self) -> bool:
         u = getattr(self.p, "user", None)
@@ -38,3 +44,164 @@ class Scope:
 
     def can_mark_paid(self) -> bool:
         return self.is_admin()
+
+
+# --- Per-request capabilities (resolved once, cached across requests) ---
+
+CAPS_VERSION_KEY = "better_bill:caps:version"
+
+
+def _caps_timeout():
+    """Seconds a cached Personnel/Role lookup stays valid."""
+    return getattr(settings, "ROLE_CACHE_TIMEOUT", 300)
+
+
+def _max_age():
+    """Seconds before the version rolls over even without a Personnel/Role change."""
+    return max(int(getattr(settings, "ROLE_CACHE_MAX_AGE", 10)), 1)
+
+
+def invalidate_capabilities():
+    """Bump the cache version so every user's roles are re-read."""
+    cache.set(CAPS_VERSION_KEY, time.time_ns(), None)
+
+
+def _load_personnel(user):
+    """
+    Personnel (+ Role) for a user: one query, then served from the cache.
+    A save bumps the version only in the worker's own cache unless a shared
+    backend is configured, so the version also rolls over every
+    ROLE_CACHE_MAX_AGE seconds (wall clock, so all workers agree); a
+    demoted user keeps their old access elsewhere for at most that long.
+    """
+    version = cache.get_or_set(CAPS_VERSION_KEY, time.time_ns(), None)
+    bucket = int(time.time()) // _max_age()
+    key = f"better_bill:caps:{version}.{bucket}:{user.pk}"
+    hit = cache.get(key)
+    if hit is not None:
+        return hit[0]
+    p = Personnel.objects.select_related("role").filter(user_id=user.pk).first()
+    cache.set(key, (p,), _caps_timeout())
+    return p
+
+
+class Capabilities:
+    """
+    Everything the views, decorators and context processors ask about a
+    user's role, computed once per request from Personnel + Role.
+    """
+
+    def __init__(self, user, personnel):
+        self.user = user
+        self.personnel = personnel
+        self.is_authenticated = bool(getattr(user, "is_authenticated", False))
+        self.is_superuser = bool(getattr(user, "is_superuser", False))
+
+        p = personnel
+        # Lower-cased Role.role, as used by the views' role-name helpers
+        self.role_name = (p.role.role if p and p.role_id else "").strip().lower()
+        # Canonical key, as used by the Personnel.is_* properties
+        self.role_key = p._role_key() if p else ""
+
+        # Personnel property equivalents
+        self.p_is_admin = bool(p) and (self.is_superuser or self.role_key == "admin")
+        self.p_is_cashier = self.role_key == "cashier"
+        self.p_is_billing = self.role_key == "billing"
+        self.p_is_partner = self.role_key == "partner"
+        self.p_is_assoc = self.role_key == "associate_partner"
+        self.p_is_fee_earner = self.role_key == "fee_earner"
+
+        # Role-name equivalents
+        rn = self.role_name
+        self.rn_billing = (rn == "billing administrator" or "billing" in rn
+                           or rn in {"accounts", "finance"})
+        self.rn_partner = rn == "partner"
+        self.rn_assoc = rn == "associate partner"
+
+        self._flags = None
+
+    def has_perm(self, perm):
+        """Proxy to the user's (already per-request cached) permissions."""
+        return bool(self.is_authenticated and self.user.has_perm(perm))
+
+    @property
+    def can_view_invoices(self):
+        """Admin, Billing, Partner or Associate Partner."""
+        if self.is_superuser:
+            return True
+        return bool(self.personnel) and (
+            self.rn_billing or self.rn_partner or self.rn_assoc)
+
+    @property
+    def can_log_time(self):
+        """Allowed to log time = not admin, not billing, not cashier."""
+        if self.is_superuser or not self.personnel:
+            return False
+        return not (self.rn_billing or self.p_is_cashier)
+
+    @property
+    def is_partner_or_assoc(self):
+        """Partner / Associate Partner by role name (superuser included)."""
+        if self.is_superuser:
+            return True
+        return bool(self.personnel) and (self.rn_partner or self.rn_assoc)
+
+    @property
+    def is_billing_only(self):
+        """True only for Billing role (plus superuser override)."""
+        return self.is_superuser or (bool(self.personnel) and self.rn_billing)
+
+    def flags(self, view_perm):
+        """Dashboard flags (see views._effective_flags), memoized."""
+        if self._flags is None:
+            self._flags = self._compute_flags(view_perm)
+        return self._flags
+
+    def _compute_flags(self, view_perm):
+        """Compute can_view_invoices / can_log_time for the dashboard."""
+        flags = {"can_view_invoices": False, "can_log_time": False}
+        if not self.is_authenticated:
+            return flags
+        if self.is_superuser:
+            return {"can_view_invoices": True, "can_log_time": False}
+        if self.has_perm(view_perm):
+            flags["can_view_invoices"] = True
+        if not self.personnel:
+            return flags
+
+        rn = self.role_name
+        has_billing_kw = any(k in rn for k in ROLE_BILLING)
+        is_manager_kw = any(k in rn for k in ROLE_PARTNER | ROLE_ASSOC_PARTNER)
+        flags["can_view_invoices"] = bool(
+            flags["can_view_invoices"]
+            or self.p_is_admin or self.p_is_billing or self.p_is_cashier
+            or self.p_is_partner or self.p_is_assoc
+            or has_billing_kw or is_manager_kw)
+        flags["can_log_time"] = not (
+            self.p_is_billing or self.p_is_cashier or has_billing_kw)
+        return flags
+
+
+_CAPS_ATTR = "_better_bill_caps"
+
+
+def capabilities_for(user):
+    """Return the Capabilities for user, memoized on the user object."""
+    caps = getattr(user, _CAPS_ATTR, None)
+    if caps is not None:
+        return caps
+
+    p = None
+    if getattr(user, "is_authenticated", False):
+        p = _load_personnel(user)
+        # Prime user.personnel_profile so later lookups don't query again
+        Personnel._meta.get_field("user").remote_field.set_cached_value(user, p)
+        if p is not None:
+            Personnel._meta.get_field("user").set_cached_value(p, user)
+
+    caps = Capabilities(user, p)
+    try:
+        setattr(user, _CAPS_ATTR, caps)
+    except AttributeError:
+        pass
+    return caps
@@ -0,0 +1,128 @@
+"""
+Server side of the create-invoice WIP picker.
+
+The page no longer renders a client's unbilled WIP; the picker fetches it
+a page at a time (keyset pagination, newest first) filtered by matter, fee
+earner, activity, date range and narrative text. Totals for the selection
+are computed here with the same rate rules as the invoice itself
+(billing.invoice_line), so what the biller sees is what gets billed.
+
+A selection is either explicit ids, or "everything matching the filters"
+minus unticked ids; the latter is posted as the filter values rather than
+thousands of wip_ids, and create_invoice resolves it with selected_wip().
+"""
+from __future__ import annotations
+from decimal import Decimal
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from . import billing
+from . import fulltext
+from .models import WIP
+from .pagination import keyset_page
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+FILTER_FIELDS = ("client", "matter", "fee_earner", "activity",
+                 "date_from", "date_to", "q")
+
+
+def _int(value):
+    """Positive int from a submitted string, or None."""
+    try:
+        value = int(value or 0)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+def _ids(values):
+    """Positive ints from a list of submitted strings (bad ones dropped)."""
+    return [i for i in map(_int, values) if i]
+
+
+def wip_filters(params):
+    """Read the picker filter values (as submitted strings) from a GET/POST mapping."""
+    return {f: (params.get(f) or "").strip() for f in FILTER_FIELDS}
+
+
+def filter_wip(qs, filters):
+    """Apply wip_filters() values to a WIP queryset. No client, no rows."""
+    client_id = _int(filters["client"])
+    if not client_id:
+        return qs.none()
+    qs = qs.filter(matter__client_id=client_id)
+    for field, column in (("matter", "matter_id"), ("fee_earner", "fee_earner_id"),
+                          ("activity", "activity_code_id")):
+        value = _int(filters[field])
+        if value:
+            qs = qs.filter(**{column: value})
+    date_from = parse_date(filters["date_from"] or "")
+    date_to = parse_date(filters["date_to"] or "")
+    if date_from:
+        qs = qs.filter(created_at__date__gte=date_from)
+    if date_to:
+        qs = qs.filter(created_at__date__lte=date_to)
+    if filters["q"]:
+        qs = qs.filter(fulltext.match_q(WIP, filters["q"]))
+    return qs
+
+
+def matching(filters):
+    """Unbilled WIP matching the picker filters."""
+    return filter_wip(billing.billable_wip(), filters)
+
+
+def page(filters, cursor=None, per_page=DEFAULT_PAGE_SIZE):
+    """One page of picker rows as JSON-ready dicts, plus cursors."""
+    per_page = max(1, min(per_page or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+    result = keyset_page(matching(filters), cursor, per_page)
+    rows = []
+    for w in result:
+        line = billing.invoice_line(w)
+        rows.append({
+            "id": w.pk,
+            "created": timezone.localtime(w.created_at).strftime("%Y-%m-%d %H:%M"),
+            "matter": w.matter.matter_number,
+            "fee_earner": w.fee_earner.initials,
+            "activity": str(w.activity_code),
+            "narrative": w.narrative,
+            "hours": line.hours,
+            "rate": line.rate,
+            "amount": line.amount,
+        })
+    return {"results": rows, "next": result.next_cursor,
+            "previous": result.previous_cursor}
+
+
+def totals(qs):
+    """
+    Item count, hours and value of a WIP queryset, priced like invoice_line().
+
+    Rows are grouped by (hours, rate) in the database, so only a handful of
+    distinct pairs come back however many items match; each line is rounded
+    to the penny before summing, exactly as on the invoice.
+    """
+    items, hours, value = 0, Decimal("0.0"), Decimal("0.00")
+    for h, rate, n in (qs.order_by()
+                       .values("hours_worked", "fee_earner__role__rate")
+                       .annotate(n=Count("id"))
+                       .values_list("hours_worked", "fee_earner__role__rate", "n")):
+        h = Decimal(h)
+        items += n
+        hours += h * n
+        value += (h * (rate or Decimal("0.00"))).quantize(billing.CENT) * n
+    return {"items": items, "hours": hours, "value": value}
+
+
+def selected_wip(params):
+    """
+    The selection a picker form posts: everything matching its filters
+    (select_all=1) except exclude_ids, or else exactly wip_ids (whatever
+    their status now, so billing.claim_wip() can report ones lost since).
+    """
+    if params.get("select_all"):
+        return (matching(wip_filters(params))
+                .exclude(id__in=_ids(params.getlist("exclude_ids"))))
+    return WIP.objects.filter(id__in=_ids(params.getlist("wip_ids")))
@@ -0,0 +1,182 @@
+"""
+Set-based TimeEntry -> WIP reconciliation.
+
+create_or_sync_wip keeps one WIP in step when one TimeEntry is saved.
+This module does the same for many rows at once, e.g. after a matter is
+moved to another client or a fee earner's entries are corrected in bulk:
+one UPDATE ... FROM per batch copies the TimeEntry fields onto its
+unbilled WIP row. Billed and written-off WIP is never changed, only
+reported. Dashboard totals are adjusted for any fee earner/hours changes.
+"""
+from __future__ import annotations
+from collections import defaultdict
+import logging
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.utils import timezone
+from . import summaries
+from .models import Matter, TimeEntry, WIP
+
+log = logging.getLogger(__name__)
+
+# WIP fields copied from its TimeEntry
+SYNC_FIELDS = ("client", "matter", "fee_earner", "activity_code",
+               "hours_worked", "narrative")
+DEFAULT_BATCH_SIZE = 2000
+
+
+def _scope_wip(qs, matter_ids=None, fee_earner_ids=None, time_entry_ids=None):
+    """Narrow a WIP queryset; a row matches on either its own or its entry's values."""
+    if matter_ids is not None:
+        qs = qs.filter(Q(matter_id__in=matter_ids)
+                       | Q(time_entry__matter_id__in=matter_ids))
+    if fee_earner_ids is not None:
+        qs = qs.filter(Q(fee_earner_id__in=fee_earner_ids)
+                       | Q(time_entry__fee_earner_id__in=fee_earner_ids))
+    if time_entry_ids is not None:
+        qs = qs.filter(time_entry_id__in=time_entry_ids)
+    return qs
+
+
+def _scope_entries(qs, matter_ids=None, fee_earner_ids=None, time_entry_ids=None):
+    """Narrow a TimeEntry queryset the same way."""
+    if matter_ids is not None:
+        qs = qs.filter(matter_id__in=matter_ids)
+    if fee_earner_ids is not None:
+        qs = qs.filter(fee_earner_id__in=fee_earner_ids)
+    if time_entry_ids is not None:
+        qs = qs.filter(id__in=time_entry_ids)
+    return qs
+
+
+def _mismatch(field):
+    """Q for WIP rows whose field differs from their TimeEntry's."""
+    attname = WIP._meta.get_field(field).attname
+    return ~Q(**{attname: F(f"time_entry__{attname}")})
+
+
+def _any_mismatch():
+    """Q for WIP rows that differ from their TimeEntry in any synced field."""
+    q = Q()
+    for field in SYNC_FIELDS:
+        q |= _mismatch(field)
+    return q
+
+
+def drift(**scope):
+    """
+    Count WIP rows that disagree with their TimeEntry, per field and status,
+    plus time entries with no WIP at all.
+    Returns {"by_status": {status: {field: n, "rows": n}}, "missing_wip": n}.
+    """
+    rows = (_scope_wip(WIP.objects.all(), **scope)
+            .values("status")
+            .annotate(rows=Count("id", filter=_any_mismatch()),
+                      **{field: Count("id", filter=_mismatch(field))
+                         for field in SYNC_FIELDS})
+            .order_by("status"))
+    by_status = {r.pop("status"): r for r in rows if r["rows"]}
+    missing = _scope_entries(TimeEntry.objects.filter(wip__isnull=True),
+                             **scope).count()
+    return {"by_status": by_status, "missing_wip": missing}
+
+
+def _update_sql(n_ids):
+    """UPDATE ... FROM copying TimeEntry fields onto unbilled WIP rows."""
+    qn = connection.ops.quote_name
+    wip, te = WIP._meta.db_table, TimeEntry._meta.db_table
+    distinct = "IS DISTINCT FROM" if connection.vendor == "postgresql" else "IS NOT"
+    cols = [WIP._meta.get_field(f).column for f in SYNC_FIELDS]
+    te_cols = [TimeEntry._meta.get_field(f).column for f in SYNC_FIELDS]
+    sets = ", ".join(f"{qn(c)} = {qn(te)}.{qn(t)}" for c, t in zip(cols, te_cols))
+    differs = " OR ".join(f"{qn(wip)}.{qn(c)} {distinct} {qn(te)}.{qn(t)}"
+                          for c, t in zip(cols, te_cols))
+    return (
+        f"UPDATE {qn(wip)} SET {sets}, {qn('updated_at')} = %s "
+        f"FROM {qn(te)} "
+        f"WHERE {qn(wip)}.{qn('time_entry_id')} = {qn(te)}.{qn('id')} "
+        f"AND {qn(wip)}.{qn('status')} = 'unbilled' "
+        f"AND {qn(wip)}.{qn('id')} IN ({', '.join(['%s'] * n_ids)}) "
+        f"AND ({differs})"
+    )
+
+
+def _sync_batch(ids):
+    """Reconcile one batch of unbilled WIP ids. Returns rows updated."""
+    with transaction.atomic():
+        # Old/new (fee earner, hours) for rows whose summary bucket changes
+        moved = list(WIP.objects
+                     .filter(id__in=ids, status="unbilled")
+                     .filter(_mismatch("fee_earner") | _mismatch("hours_worked"))
+                     .select_for_update(of=("self",))
+                     .values_list("fee_earner_id", "hours_worked",
+                                  "time_entry__fee_earner_id",
+                                  "time_entry__hours_worked"))
+        with connection.cursor() as cur:
+            cur.execute(_update_sql(len(ids)), [timezone.now(), *ids])
+            updated = cur.rowcount
+        if moved:
+            summaries.replace_wip_rows([(m[0], m[1]) for m in moved],
+                                       [(m[2], m[3]) for m in moved])
+    return updated
+
+
+def align_time_entry_clients(matter_ids=None):
+    """
+    Point time entries at their matter's current client (after a matter was
+    moved to another client). Only entries whose WIP is still unbilled, or
+    which have no WIP, are changed. Returns rows updated.
+    """
+    qs = (TimeEntry.objects
+          .exclude(client_id=F("matter__client_id"))
+          .filter(Q(wip__status="unbilled") | Q(wip__isnull=True)))
+    if matter_ids is not None:
+        qs = qs.filter(matter_id__in=matter_ids)
+    ids = list(qs.values_list("id", flat=True))
+    if not ids:
+        return 0
+    return TimeEntry.objects.filter(id__in=ids).update(client_id=Subquery(
+        Matter.objects.filter(pk=OuterRef("matter_id")).values("client_id")[:1]))
+
+
+def create_missing_wip(**scope):
+    """Create unbilled WIP for time entries that have none. Returns rows created."""
+    missing = list(_scope_entries(TimeEntry.objects.filter(wip__isnull=True), **scope)
+                   .values_list("id", "client_id", "matter_id", "fee_earner_id",
+                                "activity_code_id", "hours_worked", "narrative"))
+    if not missing:
+        return 0
+    with transaction.atomic():
+        WIP.objects.bulk_create([
+            WIP(time_entry_id=te_id, client_id=cid, matter_id=mid,
+                fee_earner_id=fe_id, activity_code_id=ac_id,
+                hours_worked=hours, narrative=narrative, status="unbilled")
+            for te_id, cid, mid, fe_id, ac_id, hours, narrative in missing
+        ], batch_size=DEFAULT_BATCH_SIZE)
+        summaries.add_wip_rows((m[3], m[5]) for m in missing)
+    return len(missing)
+
+
+def sync_wip(batch_size=DEFAULT_BATCH_SIZE, dry_run=False, **scope):
+    """
+    Bring unbilled WIP in line with its TimeEntry, batch by batch.
+    scope: matter_ids / fee_earner_ids / time_entry_ids (lists) to limit the
+    rows considered; rows matching on either the WIP or the TimeEntry side
+    are included. Returns {"checked": n, "updated": n, "batches": n}.
+    """
+    ids = list(_scope_wip(WIP.objects.filter(status="unbilled"), **scope)
+               .filter(_any_mismatch())
+               .order_by("id").values_list("id", flat=True))
+    result = defaultdict(int, checked=len(ids))
+    if dry_run:
+        return dict(result, updated=0, batches=0)
+
+    # Stay under the backend's bound-parameter limit
+    limit = connection.features.max_query_params or batch_size + 1
+    size = max(1, min(batch_size, limit - 1))
+    for i in range(0, len(ids), size):
+        result["updated"] += _sync_batch(ids[i:i + size])
+        result["batches"] += 1
+    log.info("WIP sync: %(checked)s drifted, %(updated)s updated in "
+             "%(batches)s batches", result)
+    return dict(result)
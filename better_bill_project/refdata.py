@@ -0,0 +1,68 @@
+"""
+Process-local cache of reference data: activity codes and personnel
+(with their roles).
+
+These tables change rarely but feed dropdowns on most pages. Each list is
+loaded once per process and reused until either
+  - a Role/ActivityCode/Personnel save or delete bumps the shared cache
+    version (signals.py), or
+  - REFDATA_CACHE_TIMEOUT seconds pass, which bounds staleness when each
+    worker has its own cache backend.
+The cached model instances are shared between requests: treat them as
+read-only.
+"""
+from __future__ import annotations
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from .models import ActivityCode, Personnel
+
+REFDATA_VERSION_KEY = "better_bill:refdata:version"
+
+_lists = {}            # name -> (version, loaded_at, value)
+_lock = threading.Lock()
+
+
+def _ttl():
+    """Seconds a process keeps a list before reloading it anyway."""
+    return getattr(settings, "REFDATA_CACHE_TIMEOUT", 300)
+
+
+def invalidate():
+    """Bump the version so every process reloads its lists."""
+    cache.set(REFDATA_VERSION_KEY, time.time_ns(), None)
+
+
+def _get(name, load):
+    """The named list, reloaded if the version moved on or the TTL ran out."""
+    version = cache.get_or_set(REFDATA_VERSION_KEY, time.time_ns(), None)
+    hit = _lists.get(name)
+    if hit and hit[0] == version and time.monotonic() - hit[1] < _ttl():
+        return hit[2]
+    with _lock:
+        value = load()
+        _lists[name] = (version, time.monotonic(), value)
+    return value
+
+
+def activity_codes():
+    """All activity codes, ordered by code."""
+    return _get("activity_codes", lambda: tuple(
+        ActivityCode.objects.order_by("activity_code")))
+
+
+def personnel():
+    """All personnel (role loaded), ordered by name."""
+    return _get("personnel", lambda: tuple(
+        Personnel.objects.select_related("role").order_by("name")))
+
+
+def activity_code_choices():
+    """(id, label) pairs for an activity code <select>."""
+    return [(a.pk, str(a)) for a in activity_codes()]
+
+
+def personnel_choices():
+    """(id, label) pairs for a fee earner <select>, ordered by initials."""
+    return [(p.pk, str(p)) for p in sorted(personnel(), key=lambda p: p.initials)]
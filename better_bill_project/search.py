@@ -0,0 +1,244 @@
+"""
+Type-ahead search over clients and matters (search_api view).
+
+Postgres matches with (I)LIKE on the number/name/description columns,
+served by pg_trgm GIN indexes (migration 0032), so both prefix and
+substring lookups stay indexed however many clients there are.
+
+Other databases use an in-process prefix index instead: every word of
+each number/name/description is kept in a sorted list and looked up with
+bisect, so a query costs a few binary searches rather than a table scan.
+The index is rebuilt when a Client or Matter changes (via a cache version,
+see invalidate()) or after SEARCH_INDEX_MAX_AGE seconds, which bounds
+staleness when each worker has its own cache.
+"""
+from __future__ import annotations
+from bisect import bisect_left
+from collections import defaultdict
+import re
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Case, Exists, IntegerField, OuterRef, Q, Value, When
+from .models import Client, Matter
+
+SEARCH_VERSION_KEY = "better_bill:search:version"
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def invalidate():
+    """Bump the version so every process rebuilds its prefix index."""
+    cache.set(SEARCH_VERSION_KEY, time.time_ns(), None)
+
+
+def _words(text):
+    """Lower-cased words of a string."""
+    return _WORD_RE.findall((text or "").lower())
+
+
+def _client_label(number, name):
+    """Display text for a client result (as Client.__str__)."""
+    return f"{number} - {name}"
+
+
+def _matter_label(number, description):
+    """Display text for a matter result (as the matter dropdowns)."""
+    return f"{number} — {description}"
+
+
+# --- Postgres: trigram-indexed LIKE ---
+
+def _rank(number_field, text_field, term):
+    """0 for a number prefix match, 1 for a text prefix match, else 2."""
+    return Case(
+        When(**{f"{number_field}__istartswith": term}, then=Value(0)),
+        When(**{f"{text_field}__istartswith": term}, then=Value(1)),
+        default=Value(2), output_field=IntegerField())
+
+
+def _match_all(words, number_field, text_field):
+    """Q requiring every word to occur in the number or text."""
+    q = Q()
+    for word in words:
+        q &= (Q(**{f"{number_field}__icontains": word})
+              | Q(**{f"{text_field}__icontains": word}))
+    return q
+
+
+def _open_matters(lead_id=None):
+    """Open matters (led by lead_id if given)."""
+    qs = Matter.objects.filter(closed_at__isnull=True)
+    if lead_id is not None:
+        qs = qs.filter(lead_fee_earner_id=lead_id)
+    return qs
+
+
+def _sql_clients(term, words, open_only, lead_id, limit):
+    """Client matches from the database."""
+    qs = Client.objects.filter(_match_all(words, "client_number", "name"))
+    if open_only or lead_id is not None:
+        qs = qs.filter(Exists(_open_matters(lead_id).filter(client_id=OuterRef("pk"))))
+    rows = (qs.annotate(rank=_rank("client_number", "name", term))
+            .order_by("rank", "name", "id")
+            .values_list("id", "client_number", "name")[:limit])
+    return [{"id": pk, "text": _client_label(number, name)}
+            for pk, number, name in rows]
+
+
+def _sql_matters(term, words, client_id, open_only, lead_id, limit):
+    """Matter matches from the database."""
+    qs = Matter.objects.filter(_match_all(words, "matter_number", "description"))
+    if client_id:
+        qs = qs.filter(client_id=client_id)
+    if open_only or lead_id is not None:
+        qs = qs.filter(closed_at__isnull=True)
+    if lead_id is not None:
+        qs = qs.filter(lead_fee_earner_id=lead_id)
+    rows = (qs.annotate(rank=_rank("matter_number", "description", term))
+            .order_by("rank", "matter_number")
+            .values_list("id", "matter_number", "description", "client_id")[:limit])
+    return [{"id": pk, "text": _matter_label(number, desc), "client": cid}
+            for pk, number, desc, cid in rows]
+
+
+# --- Other databases: in-process sorted prefix index ---
+
+class PrefixIndex:
+    """Sorted (word, id) pairs per kind, plus the rows to filter and label."""
+
+    def __init__(self):
+        """Load every client and matter."""
+        self.clients = {}
+        self.matters = {}
+        # client id -> lead fee earner ids of its open matters
+        self.open_leads = defaultdict(set)
+        client_words, matter_words = [], []
+        for pk, number, name in Client.objects.values_list(
+                "id", "client_number", "name").iterator(chunk_size=5000):
+            self.clients[pk] = (number, name)
+            client_words += [(w, pk) for w in {*_words(number), *_words(name)}]
+        for pk, number, desc, cid, lead_id, closed in Matter.objects.values_list(
+                "id", "matter_number", "description", "client_id",
+                "lead_fee_earner_id", "closed_at").iterator(chunk_size=5000):
+            self.matters[pk] = (number, desc, cid, lead_id, closed is None)
+            matter_words += [(w, pk) for w in {*_words(number), *_words(desc)}]
+            if closed is None:
+                self.open_leads[cid].add(lead_id)
+        self.client_words = sorted(client_words)
+        self.matter_words = sorted(matter_words)
+
+    @staticmethod
+    def _prefixed(pairs, prefix):
+        """Ids with a word starting with prefix."""
+        ids = set()
+        i = bisect_left(pairs, (prefix,))
+        while i < len(pairs) and pairs[i][0].startswith(prefix):
+            ids.add(pairs[i][1])
+            i += 1
+        return ids
+
+    def _match(self, pairs, words):
+        """Ids with a word starting with each of the query words."""
+        ids = None
+        for word in sorted(words, key=len, reverse=True):
+            found = self._prefixed(pairs, word)
+            ids = found if ids is None else ids & found
+            if not ids:
+                break
+        return ids or set()
+
+    def clients_for(self, term, words, open_only, lead_id, limit):
+        """Client matches, number-prefix hits first."""
+        hits = []
+        for pk in self._match(self.client_words, words):
+            number, name = self.clients[pk]
+            leads = self.open_leads.get(pk, ())
+            if lead_id is not None and lead_id not in leads:
+                continue
+            if open_only and not leads:
+                continue
+            rank = (0 if number.lower().startswith(term)
+                    else 1 if name.lower().startswith(term) else 2)
+            hits.append((rank, name, pk, number))
+        return [{"id": pk, "text": _client_label(number, name)}
+                for _, name, pk, number in sorted(hits)[:limit]]
+
+    def matters_for(self, term, words, client_id, open_only, lead_id, limit):
+        """Matter matches, number-prefix hits first."""
+        hits = []
+        for pk in self._match(self.matter_words, words):
+            number, desc, cid, lead, is_open = self.matters[pk]
+            if client_id and cid != client_id:
+                continue
+            if (open_only or lead_id is not None) and not is_open:
+                continue
+            if lead_id is not None and lead != lead_id:
+                continue
+            rank = (0 if number.lower().startswith(term)
+                    else 1 if desc.lower().startswith(term) else 2)
+            hits.append((rank, number, pk, desc, cid))
+        return [{"id": pk, "text": _matter_label(number, desc), "client": cid}
+                for _, number, pk, desc, cid in sorted(hits)[:limit]]
+
+
+_index = None          # (version, built_at, PrefixIndex)
+_index_lock = threading.Lock()
+
+
+def _max_age():
+    """Seconds before a process rebuilds its index regardless of version."""
+    return getattr(settings, "SEARCH_INDEX_MAX_AGE", 300)
+
+
+def prefix_index():
+    """This process's PrefixIndex, rebuilt if stale."""
+    global _index
+    version = cache.get_or_set(SEARCH_VERSION_KEY, time.time_ns(), None)
+    current = _index
+    if (current is None or current[0] != version
+            or time.monotonic() - current[1] > _max_age()):
+        with _index_lock:
+            current = _index
+            if (current is None or current[0] != version
+                    or time.monotonic() - current[1] > _max_age()):
+                current = (version, time.monotonic(), PrefixIndex())
+                _index = current
+    return current[2]
+
+
+def _use_sql():
+    """Postgres has trigram indexes; elsewhere use the prefix index."""
+    return connection.vendor == "postgresql"
+
+
+# --- Entry points ---
+
+def search(kind, term, client_id=None, open_only=False, lead_id=None,
+           limit=DEFAULT_LIMIT):
+    """
+    Top matches for term. kind is "client" or "matter".
+    client_id limits matters to one client; open_only keeps open matters
+    (clients: those with any); lead_id keeps matters led by that fee earner
+    (clients: those with such an open matter).
+    Returns [{"id", "text"(, "client")}].
+    """
+    term = (term or "").strip().lower()
+    words = _words(term)
+    if not words:
+        return []
+    limit = max(1, min(limit, MAX_LIMIT))
+    if kind == "client":
+        if _use_sql():
+            return _sql_clients(term, words, open_only, lead_id, limit)
+        return prefix_index().clients_for(term, words, open_only, lead_id, limit)
+    if kind == "matter":
+        if _use_sql():
+            return _sql_matters(term, words, client_id, open_only, lead_id, limit)
+        return prefix_index().matters_for(term, words, client_id, open_only,
+                                          lead_id, limit)
+    raise ValueError(f"Unknown search kind: {kind!r}")
@@ -2,9 +2,11 @@ from __future__ import annotations
 from typing import Any
 import logging
 from django.db import transaction
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
-from .models import TimeEntry, WIP
+from .models import ActivityCode, Client, Matter, Personnel, Role, TimeEntry, WIP
+from . import choices, fragments, outbox, refdata, search, summaries, teams
+from .permissions import invalidate_capabilities
 
 log = logging.getLogger(__name__)
 
@@ -14,78 +16,86 @@ def create_or_sync_wip(sender: type[TimeEntry],
                        instance: TimeEntry,
                        created: bool, **kwargs: Any) -> None:
     """
-    Ensure there's a 1:1 WIP row for each TimeEntry.
-    - Create on first save.
-    - If updating and WIP exists & is UNBILLED, sync selected fields.
-    - If updating and WIP missing (legacy rows), create it.
+    Queue the 1:1 WIP create/sync for this TimeEntry in the outbox.
+    The row commits with the entry; process_wip_outbox applies it (creating
+    the WIP, or syncing it while still UNBILLED).
     """
-    def _sync() -> None:
-        """Inner function to handle WIP creation/syncing."""
-        try:
-            if created:
-                obj, made = WIP.objects.get_or_create(
-                    time_entry=instance,
-                    defaults={
-                        "client": instance.client,
-                        "matter": instance.matter,
-                        "fee_earner": instance.fee_earner,
-                        "activity_code": instance.activity_code,
-                        "hours_worked": instance.hours_worked,
-                        "narrative": instance.narrative,
-                        "status": "unbilled",
-                    },
-                )
-                log.info(
-                    "WIP %s for TE id=%s (created=%s)",
-                    getattr(obj, "id", None),
-                    instance.id, made)
-                return
-
-            # Updates
-            try:
-                wip = instance.wip
-            except WIP.DoesNotExist:
-                wip = WIP.objects.create(
-                    time_entry=instance,
-                    client=instance.client,
-                    matter=instance.matter,
-                    fee_earner=instance.fee_earner,
-                    activity_code=instance.activity_code,
-                    hours_worked=instance.hours_worked,
-                    narrative=instance.narrative,
-                    status="unbilled",
-                )
-                log.info("WIP created for legacy TE id=%s -> WIP id=%s",
-                         instance.id, wip.id)
-                return
-
-            # Don’t mutate billed/written-off items
-            if wip.status != "unbilled":
-                log.info("Skip WIP sync for TE id=%s (status=%s)",
-                         instance.id, wip.status)
-                return
-
-            changed_fields: list[str] = []
-            for field, value in {
-                "client": instance.client,
-                "matter": instance.matter,
-                "fee_earner": instance.fee_earner,
-                "activity_code": instance.activity_code,
-                "hours_worked": instance.hours_worked,
-                "narrative": instance.narrative,
-            }.items():
-                if getattr(wip, field) != value:
-                    setattr(wip, field, value)
-                    changed_fields.append(field)
-
-            if changed_fields:
-                wip.save(update_fields=changed_fields + ["updated_at"])
-                log.info("WIP id=%s synced fields=%s for TE id=%s",
-                         wip.id, ", ".join(changed_fields), instance.id)
-        except Exception:
-            log.exception(
-                "create_or_sync_wip failed for TE id=%s",
-                getattr(instance, "id", None))
-
-    # Run after the transaction commits (safe with views that use atomic blocks)
-    transaction.on_commit(_sync)
+    outbox.enqueue(instance.pk)
+
+
+@receiver(post_delete, sender=WIP,
+          dispatch_uid="better_bill_wip_post_delete")
+def drop_wip_from_summary(sender: type[WIP], instance: WIP, **kwargs: Any) -> None:
+    """Keep dashboard totals in step when a WIP row (or its TimeEntry) is deleted."""
+    summaries.remove_wip(instance.fee_earner_id, instance.hours_worked,
+                         status=instance.status)
+
+
+@receiver([post_save, post_delete], sender=Personnel,
+          dispatch_uid="better_bill_personnel_caps")
+@receiver([post_save, post_delete], sender=Role,
+          dispatch_uid="better_bill_role_caps")
+def drop_cached_capabilities(sender: Any, **kwargs: Any) -> None:
+    """Role or profile changed: cached capabilities are stale for everyone."""
+    transaction.on_commit(invalidate_capabilities)
+
+
+@receiver([post_save, post_delete], sender=Personnel,
+          dispatch_uid="better_bill_personnel_refdata")
+@receiver([post_save, post_delete], sender=Role,
+          dispatch_uid="better_bill_role_refdata")
+@receiver([post_save, post_delete], sender=ActivityCode,
+          dispatch_uid="better_bill_activitycode_refdata")
+def drop_reference_data(sender: Any, **kwargs: Any) -> None:
+    """Dropdown reference lists changed: reload them in every process."""
+    transaction.on_commit(refdata.invalidate)
+
+
+@receiver([post_save, post_delete], sender=Matter,
+          dispatch_uid="better_bill_matter_options")
+def drop_cached_matter_options(sender: Any, **kwargs: Any) -> None:
+    """A matter was added, edited, closed or removed: re-render the dropdowns."""
+    transaction.on_commit(fragments.invalidate_matter_options)
+
+
+@receiver([post_save, post_delete], sender=Matter,
+          dispatch_uid="better_bill_matter_choices")
+def drop_eligible_choices(sender: Any, **kwargs: Any) -> None:
+    """Open-matter client/lead sets used by the forms are stale."""
+    transaction.on_commit(choices.invalidate)
+
+
+@receiver([post_save, post_delete], sender=Client,
+          dispatch_uid="better_bill_client_search")
+@receiver([post_save, post_delete], sender=Matter,
+          dispatch_uid="better_bill_matter_search")
+def drop_search_index(sender: Any, **kwargs: Any) -> None:
+    """Client/matter names or status changed: rebuild type-ahead indexes."""
+    transaction.on_commit(search.invalidate)
+
+
+@receiver(post_save, sender=Personnel,
+          dispatch_uid="better_bill_personnel_closure")
+def sync_reporting_line(sender: type[Personnel], instance: Personnel,
+                        raw: bool = False, **kwargs: Any) -> None:
+    """Keep the reporting-line closure table in step with line_manager."""
+    if raw:
+        return
+    teams.sync_person(instance.pk, instance.line_manager_id)
+
+
+@receiver(pre_delete, sender=Personnel,
+          dispatch_uid="better_bill_personnel_pre_delete")
+def remember_direct_reports(sender: type[Personnel], instance: Personnel,
+                            **kwargs: Any) -> None:
+    """Note who reports to this person; SET_NULL won't send their saves."""
+    instance._direct_reports = teams.direct_reports(instance.pk)
+
+
+@receiver(post_delete, sender=Personnel,
+          dispatch_uid="better_bill_personnel_closure_delete")
+def detach_direct_reports(sender: type[Personnel], instance: Personnel,
+                          **kwargs: Any) -> None:
+    """Former reports of a deleted manager now sit at the top level."""
+    for person_id in getattr(instance, "_direct_reports", ()):
+        teams.sync_person(person_id, None, force=True)
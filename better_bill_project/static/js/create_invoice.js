@@ -53,7 +53,8 @@ document.addEventListener('DOMContentLoaded', () => {
     matter.innerHTML = '<option value="">Loading matters…</option>';
 
     try {
-      const r = await fetch(`${ajaxUrl}?client=${encodeURIComponent(cid)}`, {
+      // mine=1: only matters I lead (the invoice form rejects the rest)
+      const r = await fetch(`${ajaxUrl}?client=${encodeURIComponent(cid)}&mine=1`, {
         headers: {
           'X-Requested-With': 'XMLHttpRequest',
           'Accept': 'text/html'
@@ -0,0 +1,15 @@
+// "Select all on this page" boxes for the bulk post/delete/settle forms.
+// A header box with data-select-all="<form id>" ticks every row box
+// attached to that form.
+document.addEventListener('DOMContentLoaded', () => {
+  document.querySelectorAll('input[data-select-all]').forEach(toggle => {
+    const rows = () => document.querySelectorAll(
+      `input[name="invoice_ids"][form="${toggle.dataset.selectAll}"]`);
+    toggle.addEventListener('change', () => {
+      rows().forEach(box => {box.checked = toggle.checked;});
+    });
+    rows().forEach(box => box.addEventListener('change', () => {
+      toggle.checked = [...rows()].every(b => b.checked);
+    }));
+  });
+});
@@ -0,0 +1,76 @@
+// Type-ahead search for <select data-typeahead="client|matter"> pickers.
+// The server renders only the selected option; typing in the search box
+// above the select fills it from the search API (views.search_api).
+document.addEventListener('DOMContentLoaded', () => {
+  const DEBOUNCE_MS = 150;
+
+  /**
+   * Build the search URL for a select from its data-typeahead-* attributes
+   */
+  function searchUrl(select, term) {
+    const qs = new URLSearchParams(select.dataset.typeaheadParams || '');
+    qs.set('kind', select.dataset.typeahead);
+    qs.set('q', term);
+    // Narrow matters to the client picked in another select
+    const clientFrom = select.dataset.typeaheadClientFrom;
+    const clientSelect = clientFrom ? document.querySelector(clientFrom) : null;
+    if (clientSelect && clientSelect.value) {qs.set('client', clientSelect.value);}
+    return `${select.dataset.typeaheadUrl}?${qs}`;
+  }
+
+  /**
+   * Replace the select's options (keeping the blank one) with results
+   */
+  function fill(select, results) {
+    const blank = select.options[0] && select.options[0].value === ''
+      ? select.options[0].cloneNode(true) : null;
+    select.innerHTML = '';
+    if (blank) {select.appendChild(blank);}
+    for (const r of results) {
+      select.appendChild(new Option(r.text, r.id));
+    }
+    // A single hit is picked straight away
+    if (results.length === 1) {
+      select.value = String(results[0].id);
+      select.dispatchEvent(new Event('change', {bubbles: true}));
+    }
+  }
+
+  /**
+   * Add a search box above one select
+   */
+  function attach(select) {
+    const input = document.createElement('input');
+    input.type = 'search';
+    input.className = 'form-control form-control-sm mb-1';
+    input.placeholder = `Search ${select.dataset.typeahead}s…`;
+    input.autocomplete = 'off';
+    input.setAttribute('aria-controls', select.id);
+    select.parentNode.insertBefore(input, select);
+
+    let timer = null;
+    let controller = null;
+    input.addEventListener('input', () => {
+      clearTimeout(timer);
+      const term = input.value.trim();
+      if (!term) {return;}
+      timer = setTimeout(async () => {
+        if (controller) {controller.abort();}
+        controller = new AbortController();
+        try {
+          const r = await fetch(searchUrl(select, term), {
+            headers: {'Accept': 'application/json'},
+            signal: controller.signal
+          });
+          if (!r.ok) {throw new Error(`HTTP ${r.status}`);}
+          const data = await r.json();
+          fill(select, data.results || []);
+        } catch (err) {
+          if (err.name !== 'AbortError') {console.error('Search failed:', err);}
+        }
+      }, DEBOUNCE_MS);
+    });
+  }
+
+  document.querySelectorAll('select[data-typeahead]').forEach(attach);
+});
@@ -2,12 +2,12 @@
   document.addEventListener('DOMContentLoaded', function() {
     const client = document.getElementById('id_ledger_client');
     const matter = document.getElementById('id_ledger_matter');
-    const url = "{% url 'ajax-matter-options' %}";
+    const url = window.appUrls.ajaxMatterOptions;
     async function loadMatters(cid){
-      const r = await fetch(`${url}?client=${cid}`, {headers:{'X-Requested-With':'XMLHttpRequest'}});
-      matter.innerHTML = await r.text();
       // Preserve selected value if it exists in new list
-      const current = "{{ filters.matter }}";
+      const current = matter.value;
+      const r = await fetch(`${url}?client=${encodeURIComponent(cid)}`, {headers:{'X-Requested-With':'XMLHttpRequest'}});
+      matter.innerHTML = await r.text();
       if (current) { Array.from(matter.options).forEach(o => { if (o.value === current) {o.selected = true;} }); }
     }
     if (client) {
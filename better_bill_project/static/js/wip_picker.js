@@ -0,0 +1,219 @@
+// Paged WIP picker on the create-invoice page (views.wip_picker_api).
+// Rows are fetched a page at a time; the selection is either explicit ids
+// or "all matching the filters" minus unticked ids, and its hours/value
+// come from the server (views.wip_picker_totals).
+document.addEventListener('DOMContentLoaded', () => {
+  const root = document.getElementById('wip-picker');
+  const form = root ? root.closest('form') : null;
+  const client = document.getElementById('id_inv_client');
+  const matter = document.getElementById('id_inv_matter');
+  if (!root || !form || !client || !matter) {return;}
+
+  const DEBOUNCE_MS = 250;
+  const rowsEl = document.getElementById('wip-rows');
+  const emptyEl = document.getElementById('wip-empty');
+  const prevBtn = document.getElementById('wip-prev');
+  const nextBtn = document.getElementById('wip-next');
+  const selectAll = document.getElementById('wip-select-all');
+  const selectPage = document.getElementById('wip-select-page');
+  const selectionEl = document.getElementById('wip-selection');
+  const matchingEl = document.getElementById('wip-matching');
+  const totalsEl = document.getElementById('wip-totals');
+  const filterEls = root.querySelectorAll('[name="fee_earner"], [name="activity"], [name="date_from"], [name="date_to"], [name="q"]');
+
+  // Explicit mode: ticked ids. Select-all mode: unticked ids.
+  const picked = new Set();
+  // Matter filter: follows the matter select, cleared when the client changes
+  let matterId = matter.value || new URLSearchParams(window.location.search).get('matter') || '';
+  let cursors = {next: null, previous: null};
+  let pageController = null;
+  let totalsController = null;
+  let totalsTimer = null;
+
+  /**
+   * Current filters (client/matter from the invoice form) as URL params
+   */
+  function filterParams() {
+    const qs = new URLSearchParams();
+    qs.set('client', client.value || '');
+    qs.set('matter', matterId);
+    filterEls.forEach(el => qs.set(el.name, el.value));
+    return qs;
+  }
+
+  /**
+   * Hidden inputs carrying the selection with the form
+   */
+  function syncSelectionInputs() {
+    selectionEl.innerHTML = '';
+    const name = selectAll.checked ? 'exclude_ids' : 'wip_ids';
+    picked.forEach(id => {
+      const input = document.createElement('input');
+      input.type = 'hidden';
+      input.name = name;
+      input.value = id;
+      selectionEl.appendChild(input);
+    });
+  }
+
+  function isSelected(id) {
+    return selectAll.checked ? !picked.has(id) : picked.has(id);
+  }
+
+  function describe(t) {
+    return `${t.items} items, ${t.hours}h, £${t.value}`;
+  }
+
+  /**
+   * Ask the server for the selection's (and optionally all matching) totals
+   */
+  function refreshTotals(withMatching = false) {
+    clearTimeout(totalsTimer);
+    totalsTimer = setTimeout(async () => {
+      syncSelectionInputs();
+      if (totalsController) {totalsController.abort();}
+      totalsController = new AbortController();
+      const body = new FormData(form);
+      if (withMatching) {body.set('matching', '1');}
+      try {
+        const r = await fetch(root.dataset.totalsUrl, {
+          method: 'POST', body, headers: {'Accept': 'application/json'},
+          signal: totalsController.signal
+        });
+        if (!r.ok) {throw new Error(`HTTP ${r.status}`);}
+        const data = await r.json();
+        totalsEl.textContent = `Selected: ${describe(data.selected)}`;
+        if (data.matching) {matchingEl.textContent = describe(data.matching);}
+      } catch (err) {
+        if (err.name !== 'AbortError') {console.error('WIP totals failed:', err);}
+      }
+    }, DEBOUNCE_MS);
+  }
+
+  function cell(text, className) {
+    const td = document.createElement('td');
+    td.textContent = text;
+    if (className) {td.className = className;}
+    return td;
+  }
+
+  function render(results) {
+    rowsEl.innerHTML = '';
+    for (const w of results) {
+      const tr = document.createElement('tr');
+      const box = document.createElement('input');
+      box.type = 'checkbox';
+      box.className = 'form-check-input';
+      box.value = w.id;
+      box.checked = isSelected(String(w.id));
+      const tdBox = document.createElement('td');
+      tdBox.appendChild(box);
+      tr.appendChild(tdBox);
+      tr.appendChild(cell(w.created));
+      tr.appendChild(cell(w.matter));
+      tr.appendChild(cell(w.fee_earner));
+      tr.appendChild(cell(w.hours));
+      tr.appendChild(cell(w.activity));
+      const narrative = cell(w.narrative, 'text-truncate');
+      narrative.style.maxWidth = '420px';
+      tr.appendChild(narrative);
+      tr.appendChild(cell(w.amount, 'text-end'));
+      rowsEl.appendChild(tr);
+    }
+    emptyEl.classList.toggle('d-none', results.length > 0);
+    syncPageBox();
+  }
+
+  function pageBoxes() {
+    return [...rowsEl.querySelectorAll('input[type="checkbox"]')];
+  }
+
+  function syncPageBox() {
+    const boxes = pageBoxes();
+    selectPage.checked = boxes.length > 0 && boxes.every(b => b.checked);
+  }
+
+  /**
+   * Load one page of rows (cursor = null for the first page)
+   */
+  async function loadPage(cursor = null) {
+    if (pageController) {pageController.abort();}
+    pageController = new AbortController();
+    const qs = filterParams();
+    if (cursor) {qs.set('cursor', cursor);}
+    try {
+      const r = await fetch(`${root.dataset.url}?${qs}`, {
+        headers: {'Accept': 'application/json'}, signal: pageController.signal
+      });
+      if (!r.ok) {throw new Error(`HTTP ${r.status}`);}
+      const data = await r.json();
+      cursors = {next: data.next, previous: data.previous};
+      prevBtn.disabled = !data.previous;
+      nextBtn.disabled = !data.next;
+      render(data.results || []);
+    } catch (err) {
+      if (err.name !== 'AbortError') {console.error('WIP picker failed:', err);}
+    }
+  }
+
+  /**
+   * Filters changed: start again from the first page with nothing selected
+   */
+  function reset() {
+    picked.clear();
+    selectAll.checked = false;
+    loadPage();
+    refreshTotals(true);
+  }
+
+  rowsEl.addEventListener('change', e => {
+    const box = e.target;
+    if (box.type !== 'checkbox') {return;}
+    // In select-all mode a ticked box means "not excluded"
+    if (box.checked === !selectAll.checked) {picked.add(box.value);}
+    else {picked.delete(box.value);}
+    syncPageBox();
+    refreshTotals();
+  });
+
+  selectPage.addEventListener('change', () => {
+    pageBoxes().forEach(box => {
+      box.checked = selectPage.checked;
+      if (box.checked === !selectAll.checked) {picked.add(box.value);}
+      else {picked.delete(box.value);}
+    });
+    refreshTotals();
+  });
+
+  selectAll.addEventListener('change', () => {
+    picked.clear();
+    pageBoxes().forEach(box => {box.checked = selectAll.checked;});
+    syncPageBox();
+    refreshTotals();
+  });
+
+  prevBtn.addEventListener('click', () => loadPage(cursors.previous));
+  nextBtn.addEventListener('click', () => loadPage(cursors.next));
+
+  let filterTimer = null;
+  filterEls.forEach(el => {
+    el.addEventListener(el.type === 'search' ? 'input' : 'change', () => {
+      clearTimeout(filterTimer);
+      filterTimer = setTimeout(reset, DEBOUNCE_MS);
+    });
+    // Enter in a filter must not submit the invoice
+    el.addEventListener('keydown', e => {if (e.key === 'Enter') {e.preventDefault();}});
+  });
+  client.addEventListener('change', () => {
+    matterId = '';
+    reset();
+  });
+  matter.addEventListener('change', () => {
+    matterId = matter.value;
+    reset();
+  });
+
+  form.addEventListener('submit', syncSelectionInputs);
+
+  if (client.value) {reset();}
+});
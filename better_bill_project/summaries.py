@@ -0,0 +1,419 @@
+"""
+Incrementally maintained dashboard totals.
+
+Every change to WIP status/hours or Ledger status is mirrored here as a
+delta on DashboardSummary, keyed by (fee_earner, kind, status). Ledger
+amounts are attributed to fee earners pro rata to their invoice lines,
+with rounding pennies given to the largest share so that per-invoice
+shares always add back up to the ledger figures.
+"""
+from __future__ import annotations
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal, ROUND_DOWN
+import logging
+import threading
+from django.db import connection
+from django.db.models import Case, Count, F, Q, Sum, When
+from .models import DashboardSummary, InvoiceLine, Ledger, WIP
+
+log = logging.getLogger(__name__)
+
+ZERO_H = Decimal("0.0")
+ZERO = Decimal("0.00")
+TENTH = Decimal("0.1")
+CENT = Decimal("0.01")
+
+WIP_KIND = DashboardSummary.KIND_WIP
+LEDGER_KIND = DashboardSummary.KIND_LEDGER
+
+VALUE_FIELDS = ("item_count", "hours", "subtotal", "tax", "total")
+
+
+def _hours(value):
+    """Normalise an aggregated hours value (SQLite sums decimals as floats)."""
+    return Decimal(value or 0).quantize(TENTH)
+
+
+def _money(value):
+    """Normalise an aggregated money value to pennies."""
+    return Decimal(value or 0).quantize(CENT)
+
+
+def _empty():
+    """Return a zeroed value dict."""
+    return {"item_count": 0, "hours": ZERO_H,
+            "subtotal": ZERO, "tax": ZERO, "total": ZERO}
+
+
+def _merge(target, deltas, sign=1):
+    """Add sign * deltas into target (a defaultdict(_empty))."""
+    for key, vals in deltas.items():
+        d = target[key]
+        for f in VALUE_FIELDS:
+            d[f] += sign * vals[f]
+    return target
+
+
+def _moved(old_deltas, new_deltas):
+    """One delta set taking old_deltas out and putting new_deltas in."""
+    return _merge(_merge(defaultdict(_empty), old_deltas, -1), new_deltas)
+
+
+def _key_q(key):
+    """Q matching one summary row."""
+    fe_id, kind, status = key
+    return Q(fee_earner_id=fe_id, kind=kind, status=status)
+
+
+def _update(keys, deltas):
+    """One UPDATE adding each key's deltas to its row (CASE keyed on the row)."""
+    match = Q()
+    for key in keys:
+        match |= _key_q(key)
+    DashboardSummary.objects.filter(match).update(**{
+        f: Case(*[When(_key_q(key), then=F(f) + deltas[key][f]) for key in keys],
+                default=F(f), output_field=DashboardSummary._meta.get_field(f))
+        for f in VALUE_FIELDS
+    })
+
+
+def _write(deltas):
+    """
+    Write {(fee_earner_id, kind, status): values} to the summary table with
+    F() increments, so concurrent writers don't lose updates: one insert
+    for missing rows, then one set-based UPDATE (split only where the
+    backend caps bind parameters). Keys go in sorted order so concurrent
+    writers meet shared rows in the same order.
+    """
+    keys = sorted(key for key, vals in deltas.items()
+                  if key[0] and any(vals[f] for f in VALUE_FIELDS))
+    if not keys:
+        return
+    # Create any missing rows in one statement (ON CONFLICT DO NOTHING)
+    DashboardSummary.objects.bulk_create(
+        [DashboardSummary(fee_earner_id=fe_id, kind=kind, status=status)
+         for fe_id, kind, status in keys],
+        ignore_conflicts=True)
+    # Per key: 4 params in each field's WHEN, 3 in the WHERE
+    limit = connection.features.max_query_params
+    per_stmt = max(1, limit // (4 * len(VALUE_FIELDS) + 3)) if limit else len(keys)
+    for i in range(0, len(keys), per_stmt):
+        _update(keys[i:i + per_stmt], deltas)
+
+
+_deferred = threading.local()
+
+
+@contextmanager
+def deferred():
+    """
+    Collect every summary delta made inside the block and write them once,
+    as the block exits, instead of as each change happens. Used inside
+    multi-statement transactions (billing batches, bulk ledger actions) so
+    the shared per-fee-earner rows are locked only for the short tail of
+    the transaction. Nothing is written if the block raises.
+    """
+    outer = getattr(_deferred, "deltas", None)
+    if outer is not None:  # already collecting; the outer block writes
+        yield
+        return
+    _deferred.deltas = defaultdict(_empty)
+    try:
+        yield
+        pending = _deferred.deltas
+    finally:
+        _deferred.deltas = None
+    _write(pending)
+
+
+def _apply(deltas, sign=1):
+    """Apply sign * deltas now, or at the end of the enclosing deferred() block."""
+    pending = getattr(_deferred, "deltas", None)
+    if pending is not None:
+        _merge(pending, deltas, sign)
+    else:
+        _write(_merge(defaultdict(_empty), deltas, sign))
+
+
+# --- WIP ---
+
+def _wip_deltas(rows, status):
+    """Group (fee_earner_id, hours) pairs into summary deltas."""
+    deltas = defaultdict(_empty)
+    for fe_id, hours in rows:
+        d = deltas[(fe_id, WIP_KIND, status)]
+        d["item_count"] += 1
+        d["hours"] += Decimal(hours or 0)
+    return deltas
+
+
+def add_wip(fee_earner_id, hours, status="unbilled"):
+    """Count a newly created WIP row."""
+    _apply(_wip_deltas([(fee_earner_id, hours)], status))
+
+
+def add_wip_rows(rows, status="unbilled"):
+    """Count many new WIP rows at once. rows: iterable of (fee_earner_id, hours)."""
+    _apply(_wip_deltas(rows, status))
+
+
+def remove_wip(fee_earner_id, hours, status):
+    """Remove a deleted WIP row from the totals."""
+    _apply(_wip_deltas([(fee_earner_id, hours)], status), sign=-1)
+
+
+def replace_wip_rows(old_rows, new_rows, status="unbilled"):
+    """
+    Re-count WIP rows whose fee earner and/or hours changed.
+    old_rows/new_rows: matching iterables of (fee_earner_id, hours).
+    """
+    _apply(_moved(_wip_deltas(old_rows, status), _wip_deltas(new_rows, status)))
+
+
+def move_wip(rows, old_status, new_status):
+    """
+    Move WIP rows between statuses.
+    rows: iterable of (fee_earner_id, hours) or WIP instances.
+    """
+    pairs = [
+        (r.fee_earner_id, r.hours_worked) if isinstance(r, WIP) else tuple(r)
+        for r in rows
+    ]
+    if not pairs or old_status == new_status:
+        return
+    _apply(_moved(_wip_deltas(pairs, old_status), _wip_deltas(pairs, new_status)))
+
+
+# --- Ledger ---
+
+def _allocate(amount, weights):
+    """
+    Split amount across weights, rounding down to the penny and giving the
+    remainder to the largest weight so the shares sum exactly to amount.
+    """
+    keys = sorted(weights)
+    if not keys:
+        return {}
+    total_w = sum(weights.values())
+    if not total_w:
+        shares = {k: ZERO for k in keys}
+        shares[keys[0]] = amount
+        return shares
+    shares = {
+        k: (amount * weights[k] / total_w).quantize(CENT, rounding=ROUND_DOWN)
+        for k in keys
+    }
+    biggest = max(keys, key=lambda k: (weights[k], -k))
+    shares[biggest] += amount - sum(shares.values())
+    return shares
+
+
+def _ledger_shares(subtotal, tax, total, lines):
+    """
+    Attribute one ledger's amounts to fee earners.
+    lines: iterable of (fee_earner_id, line_count, hours, amount).
+    """
+    per_fe = {fe_id: (n, _hours(hours), _money(amount))
+              for fe_id, n, hours, amount in lines if fe_id}
+    weights = {fe_id: v[2] for fe_id, v in per_fe.items()}
+    sub_s = _allocate(subtotal, weights)
+    tax_s = _allocate(tax, weights)
+    tot_s = _allocate(total, weights)
+    return {
+        fe_id: {"item_count": n, "hours": hours, "subtotal": sub_s[fe_id],
+                "tax": tax_s[fe_id], "total": tot_s[fe_id]}
+        for fe_id, (n, hours, _amount) in per_fe.items()
+    }
+
+
+def _ledger_deltas(ledger, status):
+    """Build summary deltas for a single ledger under the given status."""
+    lines = (InvoiceLine.objects
+             .filter(invoice_id=ledger.invoice_id)
+             .values("wip__fee_earner_id")
+             .annotate(n=Count("id"), hours=Sum("hours"), amount=Sum("amount"))
+             .values_list("wip__fee_earner_id", "n", "hours", "amount"))
+    shares = _ledger_shares(ledger.subtotal, ledger.tax, ledger.total, lines)
+    return {(fe_id, LEDGER_KIND, status): vals for fe_id, vals in shares.items()}
+
+
+def add_ledger(ledger):
+    """Count a newly created ledger (lines must already exist)."""
+    _apply(_ledger_deltas(ledger, ledger.status))
+
+
+def _ledgers_shares(ledgers):
+    """[(ledger, {fe_id: values})] for many ledgers, one query for all their lines."""
+    by_invoice = {ledger.invoice_id: ledger for ledger in ledgers}
+    if not by_invoice:
+        return []
+    lines = defaultdict(list)
+    for inv_id, fe_id, n, hours, amount in (
+            InvoiceLine.objects
+            .filter(invoice_id__in=by_invoice)
+            .values("invoice_id", "wip__fee_earner_id")
+            .annotate(n=Count("id"), hours=Sum("hours"), amount=Sum("amount"))
+            .values_list("invoice_id", "wip__fee_earner_id", "n", "hours", "amount")):
+        lines[inv_id].append((fe_id, n, hours, amount))
+    return [
+        (ledger, _ledger_shares(ledger.subtotal, ledger.tax, ledger.total,
+                                lines[inv_id]))
+        for inv_id, ledger in by_invoice.items()
+    ]
+
+
+def _ledgers_deltas(shares, status=None):
+    """Fold _ledgers_shares() into deltas, under status or each ledger's own."""
+    deltas = defaultdict(_empty)
+    for ledger, per_fe in shares:
+        for fe_id, vals in per_fe.items():
+            d = deltas[(fe_id, LEDGER_KIND, status or ledger.status)]
+            for f in VALUE_FIELDS:
+                d[f] += vals[f]
+    return deltas
+
+
+def add_ledgers(ledgers):
+    """Count many newly created ledgers at once (lines must already exist)."""
+    _apply(_ledgers_deltas(_ledgers_shares(ledgers)))
+
+
+def remove_ledgers(ledgers):
+    """Remove many ledgers from the totals (call before their lines are deleted)."""
+    _apply(_ledgers_deltas(_ledgers_shares(ledgers)), sign=-1)
+
+
+def move_ledgers(ledgers, old_status, new_status):
+    """Move many ledgers' amounts between status buckets (one lines query)."""
+    if old_status == new_status:
+        return
+    shares = _ledgers_shares(ledgers)
+    _apply(_moved(_ledgers_deltas(shares, old_status),
+                  _ledgers_deltas(shares, new_status)))
+
+
+def remove_ledger(ledger):
+    """Remove a ledger from the totals (call before its lines are deleted)."""
+    _apply(_ledger_deltas(ledger, ledger.status), sign=-1)
+
+
+def move_ledger(ledger, old_status, new_status):
+    """Move a ledger's amounts from one status bucket to another."""
+    if old_status == new_status:
+        return
+    _apply(_moved(_ledger_deltas(ledger, old_status),
+                  _ledger_deltas(ledger, new_status)))
+
+
+# --- Full recompute / consistency ---
+
+def recompute():
+    """Compute the summary from scratch: {(fe_id, kind, status): values}."""
+    result = defaultdict(_empty)
+
+    wip_rows = (WIP.objects
+                .values("fee_earner_id", "status")
+                .annotate(n=Count("id"), hours=Sum("hours_worked"))
+                .order_by())
+    for row in wip_rows:
+        d = result[(row["fee_earner_id"], WIP_KIND, row["status"])]
+        d["item_count"] = row["n"]
+        d["hours"] = _hours(row["hours"])
+
+    ledgers = {
+        inv_id: (status, subtotal, tax, total)
+        for inv_id, status, subtotal, tax, total in Ledger.objects.values_list(
+            "invoice_id", "status", "subtotal", "tax", "total").iterator()
+    }
+    line_rows = (InvoiceLine.objects
+                 .values("invoice_id", "wip__fee_earner_id")
+                 .annotate(n=Count("id"), hours=Sum("hours"), amount=Sum("amount"))
+                 .order_by("invoice_id"))
+
+    def _flush(inv_id, lines):
+        """Fold one invoice's lines into the result."""
+        if inv_id not in ledgers:
+            return
+        status, subtotal, tax, total = ledgers[inv_id]
+        for fe_id, vals in _ledger_shares(subtotal, tax, total, lines).items():
+            d = result[(fe_id, LEDGER_KIND, status)]
+            for f in VALUE_FIELDS:
+                d[f] += vals[f]
+
+    current, lines = None, []
+    for row in line_rows.iterator():
+        if row["invoice_id"] != current:
+            _flush(current, lines)
+            current, lines = row["invoice_id"], []
+        lines.append((row["wip__fee_earner_id"], row["n"],
+                      row["hours"], row["amount"]))
+    _flush(current, lines)
+
+    return dict(result)
+
+
+def rebuild():
+    """Replace the summary table with a full recompute. Returns row count."""
+    rows = [
+        DashboardSummary(fee_earner_id=fe_id, kind=kind, status=status, **vals)
+        for (fe_id, kind, status), vals in recompute().items()
+        if fe_id
+    ]
+    DashboardSummary.objects.all().delete()
+    DashboardSummary.objects.bulk_create(rows, batch_size=1000)
+    log.info("Dashboard summary rebuilt: %s rows", len(rows))
+    return len(rows)
+
+
+def diff():
+    """
+    Compare stored summary rows against a full recompute.
+    Returns a list of (key, stored_values, expected_values) mismatches.
+    """
+    expected = recompute()
+    stored = {
+        (s.fee_earner_id, s.kind, s.status): {f: getattr(s, f) for f in VALUE_FIELDS}
+        for s in DashboardSummary.objects.all()
+    }
+    mismatches = []
+    for key in sorted(set(expected) | set(stored), key=str):
+        exp = expected.get(key, _empty())
+        got = stored.get(key, _empty())
+        if any(exp[f] != got[f] for f in VALUE_FIELDS):
+            mismatches.append((key, got, exp))
+    return mismatches
+
+
+# --- Reads ---
+
+def dashboard_totals(team_ids=None):
+    """
+    Return totals for the dashboard, optionally scoped to fee earners
+    (a list of ids or a subquery such as teams.members()):
+      wip_hours, draft_subtotal/tax/total, posted_subtotal/tax/total.
+    """
+    qs = DashboardSummary.objects.filter(
+        kind__in=[WIP_KIND, LEDGER_KIND],
+        status__in=["unbilled", "draft", "posted"])
+    if team_ids is not None:
+        qs = qs.filter(fee_earner_id__in=team_ids)
+    rows = (qs.values("kind", "status")
+            .annotate(hours=Sum("hours"), subtotal=Sum("subtotal"),
+                      tax=Sum("tax"), total=Sum("total"))
+            .order_by())
+    by_key = {(r["kind"], r["status"]): r for r in rows}
+
+    def _val(kind, status, field):
+        """Read one aggregated value (zero if there are no rows)."""
+        return (by_key.get((kind, status)) or {}).get(field)
+
+    return {
+        "wip_hours": _hours(_val(WIP_KIND, "unbilled", "hours")),
+        "draft_subtotal": _money(_val(LEDGER_KIND, "draft", "subtotal")),
+        "draft_tax": _money(_val(LEDGER_KIND, "draft", "tax")),
+        "draft_total": _money(_val(LEDGER_KIND, "draft", "total")),
+        "posted_subtotal": _money(_val(LEDGER_KIND, "posted", "subtotal")),
+        "posted_tax": _money(_val(LEDGER_KIND, "posted", "tax")),
+        "posted_total": _money(_val(LEDGER_KIND, "posted", "total")),
+    }
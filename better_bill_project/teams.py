@@ -0,0 +1,114 @@
+"""
+Reporting-line closure table over Personnel.line_manager.
+
+PersonnelClosure holds one (ancestor, descendant, depth) row for every
+person and each of their managers, all the way up, plus a depth-0 row for
+the person themselves. A manager's whole team is then
+    PersonnelClosure.objects.filter(ancestor=me).values("descendant")
+which the views use as a subquery (fee_earner_id IN (SELECT ...)), so the
+team is resolved by an indexed join inside the WIP/Invoice queries instead
+of an id list built in Python.
+
+sync_person() keeps the table in step when one person is saved (signals.py);
+rebuild() recomputes it from scratch after bulk loads.
+"""
+from __future__ import annotations
+import logging
+from django.db import transaction
+from .models import Personnel, PersonnelClosure
+
+log = logging.getLogger(__name__)
+
+BATCH_SIZE = 2000
+
+
+def members(ancestor_id):
+    """Subquery of the person's own id and everyone reporting to them, at any depth."""
+    return (PersonnelClosure.objects
+            .filter(ancestor_id=ancestor_id)
+            .values("descendant_id"))
+
+
+def closure_rows(parents):
+    """
+    Closure rows for {person_id: line_manager_id}.
+    Returns (ancestor_id, descendant_id, depth) tuples; a reporting-line
+    cycle is cut where it closes (and logged).
+    """
+    rows = []
+    for person_id in parents:
+        rows.append((person_id, person_id, 0))
+        seen = {person_id}
+        depth, node = 0, parents.get(person_id)
+        while node is not None:
+            if node in seen:
+                log.error("Reporting-line cycle at Personnel id=%s", person_id)
+                break
+            depth += 1
+            rows.append((node, person_id, depth))
+            seen.add(node)
+            node = parents.get(node)
+    return rows
+
+
+def rebuild():
+    """Recompute the whole closure table. Returns rows written."""
+    parents = dict(Personnel.objects.values_list("id", "line_manager_id"))
+    rows = closure_rows(parents)
+    with transaction.atomic():
+        PersonnelClosure.objects.all().delete()
+        PersonnelClosure.objects.bulk_create(
+            [PersonnelClosure(ancestor_id=a, descendant_id=d, depth=n)
+             for a, d, n in rows],
+            batch_size=BATCH_SIZE)
+    return len(rows)
+
+
+def sync_person(person_id, line_manager_id, force=False):
+    """
+    Re-hang a person's subtree under line_manager_id (None = top level).
+    Unless force is set this is a no-op when the stored parent already
+    matches, so ordinary saves cost one indexed lookup.
+    """
+    with transaction.atomic():
+        stored = dict(PersonnelClosure.objects
+                      .filter(descendant_id=person_id, depth__lte=1)
+                      .values_list("depth", "ancestor_id"))
+        if not force and 0 in stored and stored.get(1) == line_manager_id:
+            return
+        if 0 not in stored:
+            PersonnelClosure.objects.create(
+                ancestor_id=person_id, descendant_id=person_id, depth=0)
+
+        subtree = list(PersonnelClosure.objects.filter(ancestor_id=person_id)
+                       .values_list("descendant_id", "depth"))
+        subtree_ids = [d for d, _ in subtree]
+
+        # Drop links from old managers above the subtree ...
+        (PersonnelClosure.objects
+         .filter(descendant_id__in=subtree_ids)
+         .exclude(ancestor_id__in=subtree_ids)
+         .delete())
+        if line_manager_id is None:
+            return
+        if line_manager_id in subtree_ids:
+            log.error("Personnel id=%s cannot report to id=%s (cycle); "
+                      "left at top level", person_id, line_manager_id)
+            return
+
+        # ... and link every new manager to every member of the subtree
+        above = list(PersonnelClosure.objects.filter(descendant_id=line_manager_id)
+                     .values_list("ancestor_id", "depth"))
+        PersonnelClosure.objects.bulk_create(
+            [PersonnelClosure(ancestor_id=a, descendant_id=d, depth=ad + dd + 1)
+             for a, ad in above for d, dd in subtree],
+            batch_size=BATCH_SIZE)
+
+
+def direct_reports(person_id):
+    """
+    Ids of a person's direct reports, for re-hanging them at the top level
+    once the person is deleted (SET_NULL does not send their save signals).
+    """
+    return list(Personnel.objects.filter(line_manager_id=person_id)
+                .values_list("id", flat=True))
@@ -18,6 +18,8 @@ urlpatterns = [
          name="view-invoice"),
     path("invoices/post/", login_required(post_invoice_view),
          name="post-invoice"),
+    path("invoices/export/", views.export_invoices,
+         name="invoice-export"),
     path("time-entry/<int:pk>/delete/", delete_time_entry,
          name="timeentry-delete"),
     path("invoices/<int:pk>/", views.invoice_detail,
@@ -50,6 +52,14 @@ urlpatterns = [
     # Ajax endpoint for dynamic matter options
     path("ajax/matter-options/", views.ajax_matter_options,
          name="ajax-matter-options"),
+    # Type-ahead search for client/matter pickers
+    path("api/search/", views.search_api,
+         name="search-api"),
+    # Paged WIP picker for create_invoice
+    path("api/wip/", views.wip_picker_api,
+         name="wip-picker-api"),
+    path("api/wip/totals/", views.wip_picker_totals,
+         name="wip-picker-totals"),
     # Delete time entry
     path("time-entry/<int:pk>/delete/", delete_time_entry,
          name="timeentry-delete"),
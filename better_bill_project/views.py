@@ -1,54 +1,69 @@
-import os # for path manipulations
+import logging # for diagnostics
 from decimal import Decimal # for precise decimal arithmetic
 from django.utils import timezone # for timezone-aware date/time
-from django.core.paginator import Paginator # for paginating querysets
-from django.utils.dateparse import parse_date # for parsing date strings
 from django.db.models import Sum # for aggregations
 from django.shortcuts import render, redirect, get_object_or_404 # common shortcuts
-from io import BytesIO # for in-memory byte streams
+from concurrent.futures import TimeoutError as FuturesTimeout # PDF render wait
 from django.conf import settings # for accessing project settings
 from django.http import HttpResponse, HttpResponseServerError # for HTTP responses
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.http import FileResponse, Http404 # for cached PDFs
+from django.http import JsonResponse # for the search API
 from django.contrib import messages # for user messages
+from django.core.paginator import Paginator # for ranked search results
 from django.urls import reverse # for URL reversing
 from django.template.loader import render_to_string # for rendering templates to strings
 from .forms import TimeEntryForm, InvoiceForm, TimeEntryQuickEditForm # custom forms
-from .models import TimeEntry, Client, Matter, ALLOWED_MANAGER_ROLES
-from .models import WIP, Invoice, InvoiceLine, Ledger, Personnel, ActivityCode
-from django.db.models import Exists, OuterRef # for complex queries
+from .models import TimeEntry, Client, Matter
+from .models import Invoice, InvoiceLine, Ledger, Personnel
+from . import summaries # pre-aggregated dashboard totals
+from .numbering import next_invoice_number # atomic invoice numbers
+from .billing import DEFAULT_TAX_RATE, claim_wip, invoice_line # shared billing rules
+from . import picker # paged WIP picker for create_invoice
+from .filters import invoice_filters, filter_invoices # shared invoice filters
+from .pagination import keyset_page, approximate_count # cursor pagination
+from .exports import EXPORT_KINDS, export_rows, stream_csv, stream_jsonl
+from .permissions import capabilities_for # memoized role/capability lookup
 from django.db import transaction # for atomic transactions
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.auth.decorators import user_passes_test
 from django.core.exceptions import PermissionDenied
 from django.views.decorators.http import require_POST # for HTTP method restriction
-from django.contrib.staticfiles import finders # for static file finding
-from urllib.parse import urlparse # for URL parsing
-from xhtml2pdf import pisa # for PDF generation
+from django.views.decorators.http import etag # for conditional GETs
+from django.views.decorators.cache import cache_control # for revalidation headers
+from . import pdfs # pooled PDF rendering + cache
+from . import teams # reporting-line closure (team scoping)
+from . import dashboard # dashboard panels and totals
+from . import fragments # cached HTML fragments
+from . import search # type-ahead client/matter search
+from . import fulltext # narrative full-text search
+from . import refdata # cached activity codes/personnel
+from . import ledgers # bulk post/delete/settle
+from . import outbox # queued TimeEntry -> WIP work
+
+log = logging.getLogger(__name__)
 
 def _p(user):
     """Return Personnel profile for user, or None if not found."""
-    return getattr(user, "personnel_profile", None)
+    return capabilities_for(user).personnel
 
 def is_cashier(user):
     """Return True if user is cashier."""
-    p = _p(user)
-    return bool(p and p.is_cashier)
+    return capabilities_for(user).p_is_cashier
 
 def is_partner(user):
     """Return True if user is partner."""
-    p = _p(user)
-    return bool(p and p.is_partner)
+    return capabilities_for(user).p_is_partner
 
 
 def is_assoc(user):
     """Return True if user is associate partner."""
-    p = _p(user)
-    return bool(p and p.is_associate_partner)
+    return capabilities_for(user).p_is_assoc
 
 
 def is_billing(user):
     """Return True if user is billing administrator."""
-    p = _p(user)
-    return bool(p and p.is_billing)
+    return capabilities_for(user).p_is_billing
 
 
 def is_partner_or_assoc(user):
@@ -70,17 +85,8 @@ def is_view_invoices(user):
 
 def is_time_entry_user(user) -> bool:
     """Allowed to log time = not admin, not billing."""
-    if getattr(user, "is_superuser", False):
-        return False  # admin cannot record hours
-    p = _personnel(user)
-    if not p:
-        return False
-    # treat any 'billing' role as not allowed to record time
-    if _is_billing(p):
-        return False
-    if getattr(p, "is_cashier", False):
-        return False
-    return True
+    # admin cannot record hours; any 'billing' role or cashier neither
+    return capabilities_for(user).can_log_time
 
 
 
@@ -105,17 +111,8 @@ ROLE_ASSOC_PARTNER = {"associate partner"}
 
 # ---- Role utilities ----
 def _personnel(user):
-    """Return the Personnel object for a user, regardless of related_name."""
-    if not getattr(user, "is_authenticated", False):
-        return None
-    for rel in ("personnel_profile", "personnel", "profile"):
-        p = getattr(user, rel, None)
-        if p is not None:
-            return p
-    try:
-        return Personnel.objects.select_related("role").filter(user=user).first()
-    except Exception:
-        return None
+    """Return the Personnel object (with role) for a user, or None."""
+    return capabilities_for(user).personnel
 
 def _role_name(p) -> str:
     """Return the Personnel's role name in lowercase, or empty string."""
@@ -145,19 +142,7 @@ def _is_admin(user, p=None) -> bool:
 def can_view_invoices_user(user) -> bool:
     """Only Admin, Billing, Partner,
     Associate Partner can see invoices (not fee earners)."""
-    if getattr(user, "is_superuser", False):
-        return True
-
-    p = _personnel(user)
-    if not p:
-        return False
-
-    # Explicit, no cashier references
-    if _is_billing(p) or _is_partner(p) or _is_assoc(p):
-        return True
-
-    # Everyone else (fee earners etc.) -> no
-    return False
+    return capabilities_for(user).can_view_invoices
 
 
 # ---- Robust flag resolver ----
@@ -174,77 +159,23 @@ def _effective_flags(user):
       True otherwise (if Personnel exists).
       Works even if your Personnel booleans aren't set,
       by falling back to role name keywords.
+    Computed once per request (see permissions.Capabilities.flags).
     """
-    flags = {"can_view_invoices": False, "can_log_time": False}
-    if not getattr(user, "is_authenticated", False):
-        return flags
-
-    # Superuser is always allowed
-    if getattr(user, "is_superuser", False):
-        flags["can_view_invoices"] = True
-        flags["can_log_time"] = False  # admin can’t record hours
-        return flags
+    return capabilities_for(user).flags(PERM_VIEW_INV)
 
 
-    # Permission fallback (keep if you've set perms)
-    try:
-        if user.has_perm(PERM_VIEW_INV):
-            flags["can_view_invoices"] = True
-    except Exception:
-        pass
-
-    p = _personnel(user)
-    if not p:
-        return flags
-
-    # Pull booleans if your Personnel has them; default to False if missing
-    p_is_admin   = bool(getattr(p, "is_admin", False))
-    p_is_billing = bool(getattr(p, "is_billing", False))
-    p_is_cashier = bool(getattr(p, "is_cashier", False))
-    p_is_partner = bool(getattr(p, "is_partner", False))
-    p_is_assoc   = bool(getattr(p, "is_associate_partner", False))
-
-    # Role name tolerance
-    rn = _role_name(p)  # already lower-cased in your helper
-    # quick keyword tests
-    has_billing_kw = any(k in rn for k in BILLING_KEYWORDS)
-    is_manager_kw  = any(k in rn for k in MANAGER_KEYWORDS)
-
-    # Compute
-    can_view = (
-        flags["can_view_invoices"]                # from perms above, if any
-        or p_is_admin or p_is_billing or p_is_cashier or p_is_partner or p_is_assoc
-        or has_billing_kw or is_manager_kw
-    )
-    # Time logging: block billing/cashier (by boolean or keyword)
-    is_billingish = p_is_billing or p_is_cashier or has_billing_kw
-    can_log = not is_billingish
-
-    flags["can_view_invoices"] = bool(can_view)
-    flags["can_log_time"] = bool(can_log)
-    return flags
-
-
-def _team_personnel_ids(me: Personnel | None):
+def _team_members(me: Personnel | None):
     """
     Return None => no filtering (see all).
-    Return []   => filter but matches nothing (guest).
-    Return [ids] => filter to these fee earners.
+    Return a subquery of fee earner ids => the person plus everyone under
+    them in the reporting line, at any depth (teams.members).
     """
     if not me:
-        return []
+        return Personnel.objects.none().values("id")
     # Admin or Billing => see everything
     if getattr(me, "is_admin", False) or _is_billing(me):
         return None
-
-    ids = [me.id]
-    rn = _role_name(me)
-    if rn in ALLOWED_MANAGER_ROLES:
-        try:
-            ids += list(me.delegates.values_list("id", flat=True))
-        except Exception:
-            pass
-    return ids
+    return teams.members(me.id)
 
 def require_invoice_access(viewfunc):
     """Decorator to require invoice view permission."""
@@ -258,10 +189,7 @@ def require_invoice_access(viewfunc):
 
 def _is_billing_only(user):
     """True only for Billing role (plus superuser override)."""
-    if getattr(user, "is_superuser", False):
-        return True
-    p = _personnel(user)
-    return bool(p) and _is_billing(p)
+    return capabilities_for(user).is_billing_only
 
 
 # Index
@@ -271,19 +199,8 @@ def index(request):
     """ Dashboard view showing WIP and invoices based on roles/permissions. """
     me = _personnel(request.user)
 
-    p = me
-    rn = _role_name(p) if p else "<none>"
-    info = {
-        "is_superuser": bool(getattr(request.user, "is_superuser", False)),
-        "p_exists": bool(p),
-        "p_is_admin": bool(getattr(p, "is_admin", False)) if p else False,
-        "p_is_billing": bool(getattr(p, "is_billing", False)) if p else False,
-        "p_is_cashier": bool(getattr(p, "is_cashier", False)) if p else False,
-        "p_is_partner": bool(getattr(p, "is_partner", False)) if p else False,
-        "p_is_assoc": bool(getattr(p, "is_associate_partner", False)) if p else False,
-        "role_name": rn,
-    }
-    print("DASHBOARD ROLES:", info)  # shows up in runserver console
+    log.debug("Dashboard roles for user id=%s: role=%r",
+              request.user.pk, _role_name(me) if me else "<none>")
 
     context = {
         "wip_items": [],
@@ -308,62 +225,15 @@ def index(request):
     context["can_log_time"] = flags["can_log_time"]
 
     # ----- Team scoping -----
-    team_ids = _team_personnel_ids(me)  # may be None, [], or [ids]
+    team = _team_members(me)  # None or a subquery of fee earner ids
     # Admin/Billing see everything (clear filter)
     if getattr(request.user, "is_superuser", False) or any(
         k in _role_name(me) for k in BILLING_KEYWORDS) or getattr(
             me, "is_admin", False) or getattr(me, "is_billing", False):
-        team_ids = None
-
-    # ----- Unbilled WIP -----
-    wip_qs = (WIP.objects
-              .select_related("matter", "client")
-              .filter(status="unbilled")
-              .order_by("-created_at"))
-    if team_ids:
-        wip_qs = wip_qs.filter(fee_earner_id__in=team_ids)
-
-    context["wip_items"] = list(wip_qs[:10])
-    context["wip_total_hours"] = wip_qs.aggregate(
-        total=Sum("hours_worked"))["total"] or Decimal("0.0")
-
-    # ----- Invoices (only when allowed) -----
-    if context["can_view_invoices"]:
-        invoice_base = (Invoice.objects
-                        .select_related("client", "matter", "ledger"))
-
-        if team_ids:
-            invoice_base = (invoice_base
-                .annotate(has_team_work=Exists(
-                    InvoiceLine.objects.filter(
-                        invoice_id=OuterRef("pk"),
-                        wip__fee_earner_id__in=team_ids
-                    )
-                ))
-                .filter(has_team_work=True))
-
-        draft_qs  = invoice_base.filter(
-            ledger__status="draft").order_by("-created_at")[:10]
-        posted_qs = invoice_base.filter(
-            ledger__status="posted").order_by("-created_at")[:10]
-
-        draft_totals = draft_qs.aggregate(
-            subtotal=Sum("ledger__subtotal"),
-            tax=Sum("ledger__tax"), total=Sum("ledger__total"))
-        post_totals  = posted_qs.aggregate(
-            subtotal=Sum("ledger__subtotal"),
-            tax=Sum("ledger__tax"), total=Sum("ledger__total"))
-
-        context.update({
-            "draft_invoices": list(draft_qs),
-            "draft_subtotal": draft_totals["subtotal"] or Decimal("0.00"),
-            "draft_tax":      draft_totals["tax"]      or Decimal("0.00"),
-            "draft_total":    draft_totals["total"]    or Decimal("0.00"),
-            "posted_invoices": list(posted_qs),
-            "post_subtotal":  post_totals["subtotal"]  or Decimal("0.00"),
-            "post_tax":       post_totals["tax"]       or Decimal("0.00"),
-            "post_total":     post_totals["total"]     or Decimal("0.00"),
-        })
+        team = None
+
+    # ----- WIP, invoices and totals (dashboard.py: three queries) -----
+    context.update(dashboard.panels(team, context["can_view_invoices"]))
 
     return render(request, "better_bill_project/index.html", context)
 
@@ -394,7 +264,7 @@ def record_time(request):
     if is_partner:
         if fe_filter:
             base_qs = base_qs.filter(fee_earner_id=fe_filter)
-        fee_earners = Personnel.objects.order_by("name")
+        fee_earners = refdata.personnel()
     else:
         if personnel_for_user:
             base_qs = base_qs.filter(fee_earner=personnel_for_user)
@@ -402,8 +272,16 @@ def record_time(request):
             base_qs = base_qs.none()
         fee_earners = None
 
-    recent_entries = base_qs[:20]
-    activity_codes = ActivityCode.objects.all().order_by("activity_code")
+    # Narrative search: ranked full-text matches, paged
+    search_q = (request.GET.get("q") or "").strip()
+    if search_q:
+        page_obj = Paginator(fulltext.search(base_qs, search_q), 20).get_page(
+            request.GET.get("page"))
+        recent_entries = page_obj.object_list
+    else:
+        page_obj = None
+        recent_entries = base_qs[:20]
+    activity_codes = refdata.activity_codes()
 
     # --- Handle "quick edit" update submissions ---
     if request.method == "POST" and request.POST.get("update_id"):
@@ -418,8 +296,8 @@ def record_time(request):
                     request, "You cannot edit this entry.")
                 return redirect("record-time")
 
-        # Only allow edits when still unbilled
-        if not hasattr(te, "wip") or te.wip.status != "unbilled":
+        # Only allow edits when still unbilled (or its WIP not made yet)
+        if not _unbilled_or_pending(te):
             messages.error(
                 request, "This entry is billed and can’t be edited.")
             return redirect("record-time")
@@ -450,9 +328,11 @@ def record_time(request):
         form = TimeEntryForm(user=request.user)
         form_qe = None
 
-        return render(request, "better_bill_project/record.html", {
+    return render(request, "better_bill_project/record.html", {
         "form": form,
         "recent_entries": recent_entries,
+        "page_obj": page_obj,
+        "search_q": search_q,
         "is_partner": is_partner,
         "fee_earners": fee_earners,
         "selected_fe": fe_filter,
@@ -487,8 +367,8 @@ def delete_time_entry(request, pk):
         pk=pk
     )
 
-    # Only allow deletes when still UNBILLED
-    if not hasattr(te, "wip") or te.wip.status != "unbilled":
+    # Only allow deletes when still UNBILLED (or its WIP not made yet)
+    if not _unbilled_or_pending(te):
         messages.error(
             request, "This entry has been billed and can’t be deleted.")
         return _back_to_record_time(request)
@@ -505,6 +385,17 @@ def delete_time_entry(request, pk):
     return _back_to_record_time(request)
 
 
+def _unbilled_or_pending(te):
+    """
+    Whether a time entry can still be edited or deleted: its WIP is
+    unbilled, or the WIP is still queued in the outbox (the worker applies
+    the entry as it is then, and a delete drops the queued row with it).
+    """
+    if hasattr(te, "wip"):
+        return te.wip.status == "unbilled"
+    return outbox.is_pending(te.pk)
+
+
 def _back_to_record_time(request):
     """
     Preserve the current fee earner filter (?fe=) if it was present.
@@ -516,87 +407,107 @@ def _back_to_record_time(request):
     # Fallback: simple redirect (or use HTTP_REFERER if you prefer)
     return redirect("record-time")
 
+def _matter_options_args(request):
+    """(client id, lead fee earner id) from the query; mine=1 limits to my matters."""
+    try:
+        client_id = int(request.GET.get("client") or 0)
+    except ValueError:
+        client_id = 0
+    lead_id = None
+    if request.GET.get("mine"):
+        me = _personnel(request.user)
+        lead_id = me.pk if me else 0
+    return client_id, lead_id
+
+
+def _matter_options_etag(request):
+    """ETag for ajax_matter_options: bumps whenever any Matter changes."""
+    return fragments.matter_options_etag(*_matter_options_args(request))
+
+
 # --- AJAX: returns option list for matters by client (value = matter_number)
+@cache_control(private=True, no_cache=True)
+@etag(_matter_options_etag)
 def ajax_matter_options(request):
     """ Given a client ID in GET, return HTML options for that client's open matters."""
-    client_id = request.GET.get("client")
-    matters = Matter.objects.filter(
-        client_id=client_id, closed_at__isnull=True).order_by(
-            "matter_number") if client_id else []
-    html = render_to_string("partials/matter_options.html", {"matters": matters})
+    client_id, lead_id = _matter_options_args(request)
+    if not client_id:
+        html = render_to_string("partials/matter_options.html", {"matters": []})
+    else:
+        html = fragments.matter_options(client_id, lead_id)
     return HttpResponse(html)
 
 
-def _next_invoice_number():
+# --- Type-ahead search for client/matter pickers (JSON) ---
+@login_required
+def search_api(request):
     """
-    Generate the next 6-digit sequential invoice number as a string.
-    Starts at '000001'. Uses latest existing Invoice.number if numeric.
+    GET ?kind=client|matter&q=...; optional client=<id> (matters), open=1,
+    mine=1 (only what I lead), limit=N. Returns {"results": [{"id", "text"}]}.
     """
-    last = Invoice.objects.order_by("-id").first()
-    n = 0
-    if last:
-        # try to parse numeric Invoice.number safely
-        try:
-            n = int("".join(ch for ch in last.number if ch.isdigit()))
-        except (TypeError, ValueError):
-            n = last.id or 0  # fallback
-    return f"{n + 1:06d}"
+    kind = request.GET.get("kind", "client")
+    if kind not in ("client", "matter"):
+        return HttpResponseBadRequest("kind must be client or matter")
+    try:
+        client_id = int(request.GET.get("client") or 0) or None
+        limit = int(request.GET.get("limit") or search.DEFAULT_LIMIT)
+    except ValueError:
+        return HttpResponseBadRequest("client and limit must be integers")
+    lead_id = None
+    if request.GET.get("mine"):
+        me = _personnel(request.user)
+        lead_id = me.pk if me else 0
+    results = search.search(kind, request.GET.get("q"), client_id=client_id,
+                            open_only=bool(request.GET.get("open")),
+                            lead_id=lead_id, limit=limit)
+    return JsonResponse({"results": results})
 
 @login_required
 def create_invoice(request):
     """ Create an invoice from selected unbilled WIP items.
     """
-    readonly_number = _next_invoice_number()
+    # The real number is only reserved when the invoice is saved
+    readonly_number = "Assigned on save"
     readonly_date = timezone.localdate()
-    readonly_tax = Decimal("20.00")  # percent
+    readonly_tax = DEFAULT_TAX_RATE
 
     if request.method == "POST":
         form = InvoiceForm(request.POST, user=request.user)
         if form.is_valid():
-            wip_ids = request.POST.getlist("wip_ids")
-            if not wip_ids:
+            # Either explicit wip_ids or "all matching the picker filters"
+            if not (request.POST.get("select_all") or request.POST.getlist("wip_ids")):
                 messages.error(request, "Select at least one WIP item to invoice.")
             else:
-                with transaction.atomic():
+                with transaction.atomic(), summaries.deferred():
                     inv = form.save(commit=False)
-                    inv.number = readonly_number
-                    inv.invoice_date = readonly_date
-                    inv.tax_rate = readonly_tax
-                    inv.save()
-
-                    items = list(
-                        WIP.objects
-                        .select_related("fee_earner__role", "matter", "matter__client")
-                        .filter(id__in=wip_ids, status="unbilled")
-                    )
+                    items, lost = claim_wip(picker.selected_wip(request.POST)
+                                            .filter(matter__client_id=inv.client_id))
+                    if lost:
+                        messages.warning(
+                            request,
+                            f"{len(lost)} selected WIP items were billed by someone "
+                            "else or have time entry changes still being "
+                            "applied, and have been left out.", extra_tags="invoice")
                     if not items:
                         messages.error(request,
                                        "Selected WIP items are no longer available.")
                         return redirect("create-invoice")
 
-                    lines = []
-                    for w in items:
-                        rate = getattr(
-                            getattr(
-                                w.fee_earner, "role", None), "rate", Decimal("0.00"))
-                        amount = (
-                            Decimal(
-                                w.hours_worked) * rate).quantize(Decimal("0.01"))
-                        desc = w.narrative or f"{
-                            w.matter.matter_number} — {w.activity_code or 'Work'}"
-                        lines.append(InvoiceLine(
-                            invoice=inv, wip=w, desc=desc,
-                            hours=w.hours_worked, rate=rate, amount=amount
-                        ))
+                    # Only now is there certainly an invoice to number
+                    lines = [invoice_line(w, inv) for w in items]
+                    inv.number = next_invoice_number()
+                    inv.invoice_date = readonly_date
+                    inv.tax_rate = readonly_tax
+                    inv.set_totals(sum((li.amount for li in lines), Decimal("0.00")))
+                    inv.save()
                     InvoiceLine.objects.bulk_create(lines)
-                    WIP.objects.filter(
-                        id__in=[w.id for w in items]).update(status="billed")
 
-                    Ledger.objects.create(
+                    ledger = Ledger.objects.create(
                         invoice=inv, client=inv.client, matter=inv.matter,
                         subtotal=inv.subtotal, tax=inv.tax_amount, total=inv.total,
                         status="draft",
                     )
+                    summaries.add_ledger(ledger)
 
                     messages.success(
                         request, "Invoice created successfully.", extra_tags="invoice")
@@ -604,34 +515,15 @@ def create_invoice(request):
     else:
         form = InvoiceForm(request.GET, user=request.user or None)
 
-    # --- Build WIP list for current selection (works for GET and invalid POST) ---
-    # Start from a base queryset so we don't lose results when only 'matter' is set.
-    cid = form.data.get("client") or None
-    mid = form.data.get("matter") or None
-
-    wip_qs = (WIP.objects
-            .select_related(
-                "matter", "matter__client", "fee_earner", "activity_code")
-            .filter(status="unbilled"))
-
-    if cid:
-        wip_qs = wip_qs.filter(matter__client_id=cid)
-    if mid:
-        try:
-            wip_qs = wip_qs.filter(matter_id=int(mid))
-        except (TypeError, ValueError):
-            pass
-
-
-    wip_items = wip_qs.order_by("matter__matter_number", "created_at")
-
-
     return render(
         request,
         "better_bill_project/create_invoice.html",
         {
             "form": form,
-            "wip_items": wip_items,
+            # WIP itself is loaded page by page by the picker (wip_picker_api)
+            "wip_filters": picker.wip_filters(request.GET),
+            "fee_earner_choices": refdata.personnel_choices(),
+            "activity_choices": refdata.activity_code_choices(),
             "readonly_number": readonly_number,
             "readonly_date": readonly_date,
             "readonly_tax": readonly_tax,
@@ -640,6 +532,38 @@ def create_invoice(request):
 
 
 
+# --- WIP picker for create_invoice (JSON) ---
+@login_required
+def wip_picker_api(request):
+    """
+    GET client=<id> plus optional matter, fee_earner, activity, date_from,
+    date_to, q filters; cursor and per_page for paging. Returns
+    {"results": [...], "next": cursor, "previous": cursor}.
+    """
+    try:
+        per_page = int(request.GET.get("per_page") or picker.DEFAULT_PAGE_SIZE)
+    except ValueError:
+        return HttpResponseBadRequest("per_page must be an integer")
+    return JsonResponse(picker.page(picker.wip_filters(request.GET),
+                                    request.GET.get("cursor"), per_page))
+
+
+@login_required
+@require_POST
+def wip_picker_totals(request):
+    """
+    POST the picker selection (wip_ids, or select_all=1 + filters +
+    exclude_ids). Returns {"selected": totals} and, with matching=1, the
+    totals of everything matching the filters as "matching".
+    """
+    data = {"selected": picker.totals(
+        picker.selected_wip(request.POST).filter(status="unbilled"))}
+    if request.POST.get("matching"):
+        data["matching"] = picker.totals(
+            picker.matching(picker.wip_filters(request.POST)))
+    return JsonResponse(data)
+
+
 # View Invoice
 @login_required
 @require_invoice_access
@@ -647,61 +571,29 @@ def view_invoice(request):
     """ List and filter invoices with pagination and totals.
     """
     # --- Filters from GET ---
-    number = (request.GET.get("number") or "").strip()
-    client = (request.GET.get("client") or "").strip()
-    matter = (request.GET.get("matter") or "").strip()
-    status = (request.GET.get("status") or "").strip()        # comes from Ledger.status
-    date_from = parse_date(request.GET.get("date_from") or "")
-    date_to   = parse_date(request.GET.get("date_to") or "")
-
-    filters = {
-        "number": number,
-        "client": client,
-        "matter": matter,
-        "status": status,
-        "date_from": request.GET.get("date_from") or "",
-        "date_to": request.GET.get("date_to") or "",
-    }
+    filters = invoice_filters(request.GET)
+    client = filters["client"]
 
     # --- Base queryset ---
     qs = (
         Invoice.objects
         .select_related("client", "matter", "ledger")
-        .prefetch_related("lines")           # used if you need per-invoice sums
-        .order_by("-created_at")
     )
 
     # --- Apply filters safely ---
-    if number:
-        qs = qs.filter(number__icontains=number)
-    if client:
-        qs = qs.filter(client_id=client)
-    if matter:
-        qs = qs.filter(matter_id=matter)
-    if status:
-        # filter via related Ledger.status
-        qs = qs.filter(ledger__status=status)
-    if date_from:
-        qs = qs.filter(invoice_date__gte=date_from)
-    if date_to:
-        qs = qs.filter(invoice_date__lte=date_to)
-
-    # --- Dropdown data ---
-    clients = Client.objects.order_by("name")
-    # You can narrow matters by client if selected; else show all
-    if client:
-        matters = Matter.objects.filter(
-            client_id=client).order_by("matter_number")
-    else:
-        matters = Matter.objects.order_by(
-            "matter_number")[:500]  # cap to avoid huge lists
+    qs = filter_invoices(qs, filters)
+
+    # --- Dropdown data: only the selected values; the rest come from search_api ---
+    selected_client = (Client.objects.filter(pk=client).first()
+                       if client.isdigit() else None)
+    selected_matter = (Matter.objects.filter(pk=filters["matter"]).first()
+                       if filters["matter"].isdigit() else None)
 
-    # --- Pagination ---
-    paginator = Paginator(qs, 25)
-    page_number = request.GET.get("page") or 1
-    page_obj = paginator.get_page(page_number)
+    # --- Pagination (keyset on created_at/id; no OFFSET, no COUNT per page) ---
+    page_obj = keyset_page(qs, request.GET.get("cursor"), per_page=25)
+    total_count = approximate_count(qs, filters)
 
-    # --- Page totals (fallback to Invoice computed props if no Ledger) ---
+    # --- Page totals (fallback to stored Invoice totals if no Ledger) ---
     page_subtotal = Decimal("0.00")
     page_tax = Decimal("0.00")
     page_total = Decimal("0.00")
@@ -717,99 +609,117 @@ def view_invoice(request):
 
     return render(request, "better_bill_project/view_invoice.html", {
         "page_obj": page_obj,
+        "total_count": total_count,
         "filters": filters,
-        "clients": clients,
-        "matters": matters,
+        "selected_client": selected_client,
+        "selected_matter": selected_matter,
         "page_subtotal": page_subtotal,
         "page_tax": page_tax,
         "page_total": page_total,
     })
 
+# Export Invoices / Lines / Ledger
+@login_required
+@require_invoice_access
+def export_invoices(request):
+    """ Stream invoices, invoice lines or ledger rows as CSV or JSONL,
+    using the same filters as view_invoice.
+    """
+    kind = request.GET.get("kind") or "invoices"
+    fmt = request.GET.get("format") or "csv"
+    if kind not in EXPORT_KINDS or fmt not in ("csv", "jsonl"):
+        return HttpResponseBadRequest("Unknown export kind or format.")
+
+    header, rows = export_rows(kind, invoice_filters(request.GET))
+    if fmt == "csv":
+        resp = StreamingHttpResponse(stream_csv(header, rows),
+                                     content_type="text/csv")
+    else:
+        resp = StreamingHttpResponse(stream_jsonl(header, rows),
+                                     content_type="application/x-ndjson")
+    stamp = timezone.localdate().isoformat()
+    resp["Content-Disposition"] = f'attachment; filename="{kind}-{stamp}.{fmt}"'
+    return resp
+
+def _ledger_list(request, status, param):
+    """A keyset page of invoices in ledger status, paged by the ?<param>= cursor."""
+    qs = Invoice.objects.select_related("client", "ledger").filter(ledger__status=status)
+    page = keyset_page(qs, request.GET.get(param), per_page=25)
+    totals = qs.aggregate(total=Sum("ledger__total"))
+    return page, totals["total"] or Decimal("0.00")
+
+
+def _page_url(request, param, cursor):
+    """This page's URL with one list's cursor replaced (others kept)."""
+    query = request.GET.copy()
+    query[param] = cursor
+    return f"?{query.urlencode()}"
+
+
 @login_required
 @permission_required(PERM_POST_INV, raise_exception=True)
 def post_invoice_view(request):
     """
-    Partners can:
-      - POST a draft invoice
+    Partners can, for one invoice (invoice_id) or many (invoice_ids):
+      - POST draft invoices
       -> ledger.status = 'posted'
-      - DELETE a draft invoice
+      - DELETE draft invoices
       -> remove invoice & ledger, and revert WIP lines to 'unbilled'
+    Billing users can also SETTLE posted invoices (-> 'paid').
+    Each action is a few set-based statements whatever the count (ledgers.py).
     """
     if request.method == "POST":
         action = request.POST.get("action")
-        pk = request.POST.get("invoice_id")
-        invoice = get_object_or_404(
-            Invoice.objects.select_related("ledger"), pk=pk)
-
-        if action == "post":
-            if not invoice.ledger:
-                messages.error(
-                    request, "Invoice has no ledger; cannot post.",
-                    extra_tags="invoice")
-                return redirect("post-invoice")
-            if invoice.ledger.status == "posted":
-                messages.info(
-                    request, "Invoice is already posted.", extra_tags="invoice")
-                return redirect("post-invoice")
-
-            invoice.ledger.status = "posted"
-            invoice.ledger.save(update_fields=["status"])
-            messages.success(
-                request, f"Invoice {invoice.number} posted.", extra_tags="invoice")
+        ids = [int(pk) for pk in (request.POST.getlist("invoice_ids")
+                                  or [request.POST.get("invoice_id")])
+               if str(pk or "").isdigit()]
+        if not ids:
+            messages.error(request, "Select at least one invoice.", extra_tags="invoice")
             return redirect("post-invoice")
 
+        if action == "post":
+            done = ledgers.post(ids)
+            done_msg = "{} invoice(s) posted."
+            skip_msg = "{} invoice(s) skipped: only drafts can be posted."
         elif action == "delete":
-            # Only allow delete while draft
-            if not invoice.ledger or invoice.ledger.status != "draft":
-                messages.error(
-                    request, "Only draft invoices can be deleted.",
-                    extra_tags="invoice")
-                return redirect("post-invoice")
-
-            with transaction.atomic():
-                # Revert any WIP used by its lines back to 'unbilled'
-                wip_ids = list(invoice.lines.values_list("wip_id", flat=True))
-                if wip_ids:
-                    WIP.objects.filter(id__in=wip_ids).update(status="unbilled")
-                # Deleting invoice will cascade delete lines;
-                # OneToOne ledger will be deleted too
-                invoice.delete()
-            messages.success(
-                request, "Draft invoice deleted and WIP reverted to unbilled.",
-                extra_tags="invoice")
-            return redirect("post-invoice")
-
+            done = ledgers.delete_drafts(ids)
+            done_msg = "{} draft invoice(s) deleted and WIP reverted to unbilled."
+            skip_msg = "{} invoice(s) skipped: only drafts can be deleted."
+        elif action == "settle":
+            if not _is_billing_only(request.user):
+                raise PermissionDenied
+            done = ledgers.settle(ids)
+            done_msg = "{} invoice(s) marked as settled."
+            skip_msg = "{} invoice(s) skipped: only posted invoices can be settled."
         else:
             messages.error(request, "Unknown action.", extra_tags="invoice")
             return redirect("post-invoice")
 
-    # GET: list draft + posted with totals
-    drafts = (
-        Invoice.objects.select_related("client", "ledger")
-        .filter(ledger__status="draft")
-        .order_by("-created_at")
-    )
-    posted = (
-        Invoice.objects.select_related("client", "ledger")
-        .filter(ledger__status="posted")
-        .order_by("-created_at")
-    )
-    draft_totals = drafts.aggregate(
-        subtotal=Sum("ledger__subtotal"),
-        tax=Sum("ledger__tax"),
-        total=Sum("ledger__total")
-    )
-    posted_totals = posted.aggregate(
-        subtotal=Sum("ledger__subtotal"),
-        tax=Sum("ledger__tax"),
-        total=Sum("ledger__total")
-    )
+        if done:
+            messages.success(request, done_msg.format(len(done)), extra_tags="invoice")
+        skipped = len(set(ids)) - len(done)
+        if skipped:
+            messages.warning(request, skip_msg.format(skipped), extra_tags="invoice")
+        return redirect("post-invoice")
+
+    # GET: draft + posted lists, each paged separately, with totals
+    drafts, draft_total = _ledger_list(request, "draft", "drafts_cursor")
+    posted, posted_total = _ledger_list(request, "posted", "posted_cursor")
+    pages = {}
+    for name, page, param in (("drafts", drafts, "drafts_cursor"),
+                              ("posted", posted, "posted_cursor")):
+        pages[f"{name}_next_url"] = (
+            _page_url(request, param, page.next_cursor) if page.has_next else None)
+        pages[f"{name}_prev_url"] = (
+            _page_url(request, param, page.previous_cursor) if page.has_previous else None)
 
     return render(request, "better_bill_project/post_invoice.html", {
         "drafts": drafts,
         "posted": posted,
-        "draft_total": draft_totals["total"] or Decimal("0.00"),
-        "posted_total": posted_totals["total"] or Decimal("0.00"),
+        "draft_total": draft_total,
+        "posted_total": posted_total,
+        "can_settle": _is_billing_only(request.user),
+        **pages,
     })
 
 # Invoice Detail View
@@ -856,71 +766,53 @@ def invoice_detail(request, pk):
 
 # PDF Viewer
 
-def _xhtml2pdf_link_callback(uri, rel):
-    """
-    Resolve static/media URIs for xhtml2pdf.
-    Supports:
-      - /static/... (Django staticfiles)
-      - /media/...  (user uploads)
-      - absolute http(s) URLs (leave as-is; xhtml2pdf can fetch some)
-    """
-    parsed = urlparse(uri)
-    if parsed.scheme in ("http", "https"):
-        return uri  # allow remote if needed (or block if you prefer)
-    if uri.startswith(settings.STATIC_URL):
-        path = uri.replace(settings.STATIC_URL, "", 1)
-        abs_path = finders.find(path)  # in collected static or app dirs
-        if abs_path:
-            return abs_path
-    if uri.startswith(settings.MEDIA_URL):
-        path = uri.replace(settings.MEDIA_URL, "", 1)
-        return os.path.join(settings.MEDIA_ROOT, path)
-    return uri
+def _invoice_pdf_etag(request, pk):
+    """ETag for invoice_pdf: the PDF cache key (changes on status/edits)."""
+    return pdfs.invoice_pdf_key(pk)
+
+
+def _pdf_pending():
+    """202 asking the browser to come back shortly for a PDF being rendered."""
+    resp = HttpResponse(
+        '<meta http-equiv="refresh" content="1">Preparing PDF…', status=202)
+    resp["Retry-After"] = "1"
+    resp["Cache-Control"] = "no-store"
+    return resp
+
 
 # PDF generation view
 @login_required
 @require_invoice_access
+@etag(_invoice_pdf_etag)
 def invoice_pdf(request, pk):
-    """ Render an invoice as PDF and return as HTTP response."""
-    inv = get_object_or_404(
-        Invoice.objects
-        .select_related("client", "matter", "ledger")
-        .prefetch_related("lines", "lines__wip",
-                          "lines__wip__fee_earner", "lines__wip__activity_code"),
-        pk=pk
-    )
-
-    subtotal = inv.ledger.subtotal if getattr(inv, "ledger", None) else inv.subtotal
-    tax      = inv.ledger.tax      if getattr(inv, "ledger", None) else inv.tax_amount
-    total    = inv.ledger.total    if getattr(inv, "ledger", None) else inv.total
-    status   = inv.ledger.status   if getattr(inv, "ledger", None) else "draft"
-
-    html = render_to_string(
-        "better_bill_project/invoice_pdf.html",
-        {"inv": inv, "subtotal": subtotal, "tax": tax, "total": total,
-         "status": status},
-        request=request,
-    )
-
-    # ensure relative links work (static/css/images)
-    base_href = request.build_absolute_uri("/")
-    html = html.replace("<head>", f'<head><base href="{base_href}">', 1)
-
-    # Render HTML -> PDF
-    pdf_io = BytesIO()
-    result = pisa.CreatePDF(
-        src=html,
-        dest=pdf_io,
-        encoding="utf-8",
-        link_callback=_xhtml2pdf_link_callback,
-    )
-    if result.err:
-
-        return HttpResponseServerError("PDF render failed.")
+    """ Serve an invoice PDF, rendering it in the PDF pool if not cached."""
+    key = pdfs.invoice_pdf_key(pk)
+    if key is None:
+        raise Http404("No such invoice.")
+    number = Invoice.objects.values_list("number", flat=True).get(pk=pk)
+
+    path = pdfs.cached_pdf(pk, key)
+    if path is None:
+        try:
+            ok = pdfs.render(pk, key).result(
+                timeout=getattr(settings, "PDF_RENDER_WAIT", 0.5))
+        except FuturesTimeout:
+            return _pdf_pending()
+        if not ok:
+            # The invoice changed while rendering: poll for the new version
+            if pdfs.invoice_pdf_key(pk) != key:
+                return _pdf_pending()
+            return HttpResponseServerError("PDF render failed.")
+        path = pdfs.cache_path(pk, key)
 
-    pdf_bytes = pdf_io.getvalue()
-    resp = HttpResponse(pdf_bytes, content_type="application/pdf")
-    resp["Content-Disposition"] = f'inline; filename="Invoice-{inv.number}.pdf"'
+    try:
+        fh = open(path, "rb")
+    except FileNotFoundError:
+        # Invalidated (post/settle/edit) since it was found
+        return _pdf_pending()
+    resp = FileResponse(fh, content_type="application/pdf")
+    resp["Content-Disposition"] = f'inline; filename="Invoice-{number}.pdf"'
+    resp["Cache-Control"] = "private, no-cache"
     return resp
 
 # Settle Invoice View
@@ -951,6 +843,8 @@ def settle_invoice(request, pk):
     ledger.status = "paid"
     ledger.paid_at = timezone.now()
     ledger.save(update_fields=["status", "paid_at"])
+    summaries.move_ledger(ledger, "posted", "paid")
+    transaction.on_commit(lambda: pdfs.refresh(invoice.pk))
 
     messages.success(request, f"Invoice {invoice.number} marked as settled.")
     return redirect("invoice-detail", pk=pk)
@@ -979,6 +873,8 @@ def unsettle_invoice(request, pk):
     ledger.status = "posted"
     ledger.paid_at = None
     ledger.save(update_fields=["status", "paid_at"])
+    summaries.move_ledger(ledger, "paid", "posted")
+    transaction.on_commit(lambda: pdfs.refresh(invoice.pk))
 
     messages.success(request, f"Invoice {invoice.number} unmarked as settled.")
     return redirect("invoice-detail", pk=pk)
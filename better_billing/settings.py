@@ -49,6 +49,8 @@ LOGGING = {
         {"handlers": ["console"], "level": "ERROR", "propagate": False},
         "django.template":
         {"handlers": ["console"], "level": "ERROR", "propagate": False},
+        "better_bill_project.metrics":
+        {"handlers": ["console"], "level": "INFO", "propagate": False},
     },
 }
 
@@ -69,6 +71,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'better_bill_project.middleware.RequestMetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -187,3 +190,56 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_URL = "login"
 LOGIN_REDIRECT_URL = "index"      # go to dashboard after login
 LOGOUT_REDIRECT_URL = "login"     # send to login after logout
+
+# Invoice numbers reserved per worker at a time. Larger blocks leave bigger
+# gaps when a worker exits; numbering is never strictly gapless (a Postgres
+# SEQUENCE value is not returned on rollback).
+INVOICE_NUMBER_BLOCK_SIZE = int(os.getenv("INVOICE_NUMBER_BLOCK_SIZE", "1"))
+
+# Seconds a user's cached Personnel/Role lookup is reused. Saves to
+# Personnel/Role invalidate it at once in a shared cache backend; with the
+# default per-process cache other workers pick changes up within
+# ROLE_CACHE_MAX_AGE seconds (keep it short: it bounds stale access rights).
+ROLE_CACHE_TIMEOUT = int(os.getenv("ROLE_CACHE_TIMEOUT", "300"))
+ROLE_CACHE_MAX_AGE = int(os.getenv("ROLE_CACHE_MAX_AGE", "10"))
+
+# Seconds a filtered list total (e.g. "~N invoices") is cached
+LIST_COUNT_CACHE_TIMEOUT = int(os.getenv("LIST_COUNT_CACHE_TIMEOUT", "60"))
+
+# Invoice PDFs: rendered in a process pool (0 = render inline) and cached
+# on disk; a request waits up to PDF_RENDER_WAIT seconds (keep it well under
+# a second) before getting 202 and polling
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", "2"))
+PDF_RENDER_WAIT = float(os.getenv("PDF_RENDER_WAIT", "0.5"))
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", "")
+
+# Per-request SQL/template/view timing (see middleware.RequestMetricsMiddleware).
+# Fraction of requests sampled, 0 (off) to 1 (every request).
+REQUEST_METRICS_SAMPLE_RATE = float(os.getenv("REQUEST_METRICS_SAMPLE_RATE", "0"))
+# Same SQL repeated this many times in one request is logged as a likely N+1
+REQUEST_METRICS_DUPLICATE_THRESHOLD = int(
+    os.getenv("REQUEST_METRICS_DUPLICATE_THRESHOLD", "3"))
+# Emit a Server-Timing header on sampled responses
+REQUEST_METRICS_SERVER_TIMING = (
+    os.getenv("REQUEST_METRICS_SERVER_TIMING", "True").lower() == "true")
+
+# TimeEntry -> WIP work is queued in an outbox and applied by the
+# process_wip_outbox worker. Set WIP_OUTBOX_INLINE=True (e.g. when developing
+# without the worker) to also apply it right after the request commits.
+WIP_OUTBOX_INLINE = os.getenv("WIP_OUTBOX_INLINE", "False").lower() == "true"
+
+# Seconds a rendered matter dropdown is cached (any Matter change clears it)
+MATTER_OPTIONS_CACHE_TIMEOUT = int(os.getenv("MATTER_OPTIONS_CACHE_TIMEOUT", "3600"))
+# Without a shared cache backend a Matter change only clears the dropdown in
+# the worker that saved it; others pick it up within this many seconds
+MATTER_OPTIONS_MAX_AGE = int(os.getenv("MATTER_OPTIONS_MAX_AGE", "60"))
+# Seconds the forms' eligible client/matter sets are cached (same invalidation)
+ELIGIBLE_CHOICES_CACHE_TIMEOUT = int(os.getenv("ELIGIBLE_CHOICES_CACHE_TIMEOUT", "3600"))
+
+# Type-ahead search (search.py): without Postgres each process keeps a prefix
+# index, rebuilt on Client/Matter changes or after this many seconds
+SEARCH_INDEX_MAX_AGE = int(os.getenv("SEARCH_INDEX_MAX_AGE", "300"))
+
+# Seconds each process keeps its activity code/personnel lists (refdata.py);
+# saves bump a shared version so a shared cache backend reloads at once
+REFDATA_CACHE_TIMEOUT = int(os.getenv("REFDATA_CACHE_TIMEOUT", "300"))